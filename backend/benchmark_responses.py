@@ -0,0 +1,158 @@
+"""
+Serialization and bytes-on-wire benchmark for API payloads built from real training data.
+For every stored dataset it builds the /api/submit-feedback response (which echoes
+the dataset), the /api/export-dataset body and a plan response rebuilt from the
+dataset (prompt, model output, reviewed steps), then compares:
+- encoding time: the stdlib path FastAPI takes for a returned model or dict
+  (response_model validation + jsonable_encoder + json.dumps) against the
+  response_encoding path (model_dump_json for models, orjson for plain dicts)
+- body size: raw, gzip and brotli (when installed) as CompressionMiddleware sends them
+
+Usage:
+    python benchmark_responses.py [--training-dir training_data] [--repeat 50]
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from blob_store import with_blob_store
+from dataset_store import SQLITE_DB_NAME, legacy_dataset_files, open_dataset_store
+import response_encoding
+
+
+# Mirrors of main.Step/GeneratePlanResponse/SubmitFeedbackResponse (importing main would open the dataset store)
+class Step(BaseModel):
+    step_id: str
+    step_number: int
+    step_content: str
+    section: Optional[str] = None
+
+
+class PlanPayload(BaseModel):
+    session_id: str
+    prompt: str
+    plan_text: str
+    steps: List[Step]
+    metadata: Dict[str, Any]
+
+
+class FeedbackPayload(BaseModel):
+    success: bool
+    dataset: Dict[str, Any]
+    file_path: str
+
+
+def load_datasets(training_dir: str) -> List[Dict[str, Any]]:
+    """Every stored dataset: the configured backend plus unmigrated per-session files."""
+    datasets = []
+    for name in legacy_dataset_files(training_dir):
+        with open(os.path.join(training_dir, name), 'r') as f:
+            datasets.append(json.load(f))
+    backend = os.getenv("DATASET_BACKEND", "segments")
+    db_path = os.getenv("DATASET_DB_PATH") or os.path.join(training_dir, SQLITE_DB_NAME)
+    if not os.path.exists(db_path if backend == "sqlite" else os.path.join(training_dir, "segments")):
+        return datasets
+    store = with_blob_store(open_dataset_store(backend, training_dir, db_path=db_path), training_dir)
+    try:
+        store.sync()
+        session_ids = {dataset.get("session_id") for dataset in datasets}
+        datasets.extend(dataset for dataset in store.query() if dataset.get("session_id") not in session_ids)
+    finally:
+        store.close()
+    return datasets
+
+
+def plan_payload(dataset: Dict[str, Any]) -> PlanPayload:
+    feedback = dataset.get("human_feedback") or dataset.get("feedback") or []
+    return PlanPayload(
+        session_id=dataset["session_id"],
+        prompt=dataset.get("original_prompt", ""),
+        plan_text=dataset.get("model_output", ""),
+        steps=[
+            Step(
+                step_id=str(item.get("step_id", f"step-{i}")),
+                step_number=item.get("step_number", i),
+                step_content=item.get("step_content", ""),
+                section=f"Plan Step {item.get('step_number', i)}"
+            )
+            for i, item in enumerate(feedback, 1)
+        ],
+        metadata=dataset.get("model_metadata") or {}
+    )
+
+
+def stdlib_model(model: BaseModel) -> bytes:
+    """What FastAPI does with a returned model: validate against response_model, jsonable_encoder, json.dumps."""
+    validated = type(model).model_validate(model.model_dump())
+    content = jsonable_encoder(validated)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def stdlib_dict(value: Dict[str, Any]) -> bytes:
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_model(model: BaseModel) -> bytes:
+    return model.model_dump_json().encode("utf-8")
+
+
+def time_per_call(encode: Callable[[Any], bytes], payloads: List[Any], repeat: int) -> float:
+    """Mean microseconds per payload."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            encode(payload)
+    return (time.perf_counter() - started) * 1e6 / (repeat * len(payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization and compression on stored datasets")
+    parser.add_argument("--training-dir", default="training_data", help="Training data directory (default: training_data)")
+    parser.add_argument("--repeat", type=int, default=50, help="Encoding passes over all payloads (default: 50)")
+    args = parser.parse_args()
+
+    datasets = load_datasets(args.training_dir)
+    if not datasets:
+        print(f"No datasets found in {args.training_dir}")
+        return
+    print(f"{len(datasets)} datasets from {args.training_dir}; orjson: {'yes' if response_encoding.orjson else 'no'}, "
+          f"brotli: {'yes' if response_encoding.brotli else 'no'}\n")
+
+    cases = [
+        ("generate-plan", [plan_payload(dataset) for dataset in datasets], stdlib_model, fast_model),
+        ("submit-feedback", [FeedbackPayload(success=True, dataset=dataset, file_path="x") for dataset in datasets],
+         stdlib_model, fast_model),
+        ("export-dataset", datasets, stdlib_dict, response_encoding.dumps),
+    ]
+    print(f"{'payload':<16} {'stdlib µs':>10} {'fast µs':>9} {'speedup':>8} {'raw KB':>8} {'gzip KB':>8} {'br KB':>8} {'wire saved':>10}")
+    for name, payloads, baseline, fast in cases:
+        baseline_us = time_per_call(baseline, payloads, args.repeat)
+        fast_us = time_per_call(fast, payloads, args.repeat)
+        raw = gzip_size = brotli_size = 0
+        for payload in payloads:
+            sizes = response_encoding.encoded_sizes(fast(payload))
+            raw += sizes[0]
+            gzip_size += sizes[1]
+            brotli_size += sizes[2] or 0
+        best = brotli_size if response_encoding.brotli else gzip_size
+        print(
+            f"{name:<16} {baseline_us:>10.1f} {fast_us:>9.1f} {baseline_us / fast_us:>7.1f}x "
+            f"{raw / 1024:>8.1f} {gzip_size / 1024:>8.1f} "
+            f"{(f'{brotli_size / 1024:.1f}' if response_encoding.brotli else '-'):>8} {1 - best / raw:>9.0%}"
+        )
+
+    # Bulk export: one NDJSON stream, compressed as a whole
+    body = b"".join(response_encoding.dumps(dataset) + b"\n" for dataset in datasets)
+    raw, gzip_size, brotli_size = response_encoding.encoded_sizes(body)
+    print(f"\nexport-datasets (jsonl, {len(datasets)} datasets): {raw / 1024:.1f} KB raw, {gzip_size / 1024:.1f} KB gzip"
+          + (f", {brotli_size / 1024:.1f} KB br" if brotli_size is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Content-addressed storage for the large text inside RLHF datasets.
+The same PDDL text is stored several times per dataset (model_output, the
+domain/problem/plan copies in pddl_structure, the action definitions repeated in
+each human_feedback[].step_content), and across sessions for the same domain.
+Long strings are cut into line-aligned chunks at structural boundaries (see
+split_chunks); each distinct chunk is stored once in a SegmentedJsonlStore under
+training_data/blobs/ and a dataset keeps {"$blob": [<chunk hash>, ...]} in place
+of the string, with chunks too short to be worth a reference inline as [text].
+Every (:action ...) and (define ...) form is cut out as its own chunk(s), so the
+action definitions quoted in step_content and the domain/problem copies in
+pddl_structure resolve to the chunks already stored for model_output.
+DedupDatasetStore wraps a dataset backend: save() stores a dataset's chunks
+before the dataset itself, find()/query()/iter_after() rehydrate transparently.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+from dataset_store import SegmentedJsonlStore, SessionIndex
+
+logger = logging.getLogger(__name__)
+
+BLOB_KEY = "$blob"
+BLOB_DIR_NAME = "blobs"
+BLOB_INDEX_NAME = "blob_index"
+MIN_BLOB_CHARS = 256          # shorter strings stay inline
+MIN_CHUNK_CHARS = 64          # shorter chunks stay inline in the reference, as [text]
+CHUNK_BOUNDARY_MASK = 0x1F    # outside structural forms a line ends a chunk when crc32(line) & mask == 0
+MAX_CHUNK_CHARS = 8192        # force a boundary in long runs without one (e.g. no newlines)
+# Lines opening a PDDL form that is stored as its own chunk(s)
+STRUCTURAL_FORMS = ('(define', '(:action', '(:durative-action', '(:derived')
+
+
+def split_chunks(text: str) -> List[str]:
+    """
+    Cut text into line-aligned chunks; ''.join(chunks) == text.
+    A chunk starts at each line opening a (define ...) or (:action ...) form and
+    ends at the line where that form's parens close, so an action definition is
+    one chunk wherever it is copied (inside the domain, a code fence, a step).
+    Markdown headings also start chunks; runs of other lines are split after a
+    non-blank line with crc32(line) & CHUNK_BOUNDARY_MASK == 0 once the chunk
+    holds MIN_CHUNK_CHARS.
+    """
+    chunks = []
+    current: List[str] = []
+    size = 0
+    depth = 0
+    form_depths: List[int] = []  # paren depth outside each open structural form
+    lines = text.split('\n')
+    last = len(lines) - 1
+    for i, line in enumerate(lines):
+        piece = line + '\n' if i < last else line
+        stripped = line.strip()
+        opens_form = stripped.lower().startswith(STRUCTURAL_FORMS)
+        if size and (opens_form or stripped.startswith('#')):
+            chunks.append(''.join(current))
+            current = []
+            size = 0
+        current.append(piece)
+        size += len(piece)
+
+        if stripped.startswith('```'):
+            # Parens in prose around a code fence do not carry into the code inside it
+            depth = 0
+            form_depths = []
+            boundary = False
+        else:
+            if opens_form:
+                form_depths.append(depth)
+            code = line.split(';', 1)[0]
+            depth = max(depth + code.count('(') - code.count(')'), 0)
+            boundary = stripped.startswith('#')
+            if form_depths:
+                if depth <= form_depths[-1]:
+                    while form_depths and depth <= form_depths[-1]:
+                        form_depths.pop()
+                    boundary = True
+            elif (
+                stripped and size >= MIN_CHUNK_CHARS
+                and zlib.crc32(stripped.encode('utf-8')) & CHUNK_BOUNDARY_MASK == 0
+            ):
+                boundary = True
+        if boundary or size >= MAX_CHUNK_CHARS:
+            chunks.append(''.join(current))
+            current = []
+            size = 0
+    if size:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.blake2b(chunk.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(BLOB_KEY), list)
+
+
+class BlobStore:
+    """
+    Append-only chunk store: a SegmentedJsonlStore of {"hash", "text"} records plus a
+    SessionIndex keyed by hash. Recently read chunks are kept in an LRU so
+    rehydrating a query over many datasets for the same domain stays in memory.
+    Thread-safe.
+    """
+
+    def __init__(
+        self,
+        training_dir: str,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        compress: bool = False,
+        cache_entries: int = 4096
+    ):
+        self.segments = SegmentedJsonlStore(
+            os.path.join(training_dir, BLOB_DIR_NAME),
+            max_segment_bytes=max_segment_bytes,
+            compress=compress
+        )
+        self.index = SessionIndex(os.path.join(training_dir, BLOB_INDEX_NAME), key_field="hash")
+        self.cache_entries = cache_entries
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Monitoring counters
+        self.chunks_written = 0
+        self.chars_written = 0
+        self.chunks_deduplicated = 0
+        self.chars_deduplicated = 0
+
+    def sync(self) -> int:
+        """Index chunks appended since the last run (or everything, for a new index)."""
+        return self.index.sync(self.segments, None)
+
+    def _remember(self, digest: str, text: str):
+        self.cache[digest] = text
+        self.cache.move_to_end(digest)
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+
+    def put_many(self, chunks: Dict[str, str]):
+        """Store the chunks (hash -> text) not stored yet, with a single fsync."""
+        with self.lock:
+            new = []
+            for digest, text in chunks.items():
+                if self.index.get(digest) is None:
+                    new.append((digest, text))
+                else:
+                    self.chunks_deduplicated += 1
+                    self.chars_deduplicated += len(text)
+            if not new:
+                return
+            locations = self.segments.append_many([{"hash": digest, "text": text} for digest, text in new])
+            for (digest, text), location in zip(new, locations):
+                self.index.put(digest, location)
+                self._remember(digest, text)
+                self.chunks_written += 1
+                self.chars_written += len(text)
+
+    def get(self, digest: str) -> str:
+        with self.lock:
+            text = self.cache.get(digest)
+            if text is not None:
+                self.cache.move_to_end(digest)
+                return text
+        location = self.index.get(digest)
+        if location is None:
+            raise KeyError(f"Missing blob {digest}")
+        text = self.segments.read(location)["text"]
+        with self.lock:
+            self._remember(digest, text)
+        return text
+
+    def dehydrate(self, value: Any, chunks: Dict[str, str]) -> Any:
+        """Copy of value with long strings replaced by blob references; their chunks are added to chunks."""
+        if isinstance(value, str):
+            if len(value) < MIN_BLOB_CHARS:
+                return value
+            parts = split_chunks(value)
+            if all(len(chunk) < MIN_CHUNK_CHARS for chunk in parts):
+                return value
+            refs = []
+            for chunk in parts:
+                if len(chunk) < MIN_CHUNK_CHARS:
+                    refs.append([chunk])
+                    continue
+                digest = chunk_hash(chunk)
+                chunks.setdefault(digest, chunk)
+                refs.append(digest)
+            return {BLOB_KEY: refs}
+        if isinstance(value, dict):
+            return {key: self.dehydrate(item, chunks) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.dehydrate(item, chunks) for item in value]
+        return value
+
+    def rehydrate(self, value: Any) -> Any:
+        """Copy of value with blob references replaced by the strings they stand for."""
+        if is_blob_ref(value):
+            return ''.join(part[0] if isinstance(part, list) else self.get(part) for part in value[BLOB_KEY])
+        if isinstance(value, dict):
+            return {key: self.rehydrate(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.rehydrate(item) for item in value]
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "chunks_written": self.chunks_written,
+                "chars_written": self.chars_written,
+                "chunks_deduplicated": self.chunks_deduplicated,
+                "chars_deduplicated": self.chars_deduplicated,
+                "cached_chunks": len(self.cache)
+            }
+
+    def close(self):
+        self.segments.close()
+        self.index.close()
+
+
+class DedupDatasetStore:
+    """
+    Dataset backend wrapper that stores long strings in a BlobStore. With
+    dedup=False datasets are written unchanged, but references already stored are
+    still rehydrated on read, so deduplication can be switched off at any time.
+    """
+
+    def __init__(self, store, blobs: BlobStore, dedup: bool = True):
+        self.store = store
+        self.blobs = blobs
+        self.dedup = dedup
+
+    def sync(self) -> int:
+        self.blobs.sync()
+        return self.store.sync()
+
+    def _dehydrate_many(self, datasets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        chunks: Dict[str, str] = {}
+        dehydrated = [self.blobs.dehydrate(dataset, chunks) for dataset in datasets]
+        # Chunks are durable before any dataset that references them
+        self.blobs.put_many(chunks)
+        return dehydrated
+
+    def save(self, dataset: Dict[str, Any]) -> str:
+        return self.save_many([dataset])[0]
+
+    def save_many(self, datasets: List[Dict[str, Any]]) -> List[str]:
+        if self.dedup:
+            datasets = self._dehydrate_many(datasets)
+        return self.store.save_many(datasets)
+
+    def file_path(self, location: str) -> str:
+        return self.store.file_path(location)
+
+    def find(self, session_id: str) -> Optional[Dict[str, Any]]:
+        dataset = self.store.find(session_id)
+        return self.blobs.rehydrate(dataset) if dataset is not None else None
+
+    def query(self, *args, **kwargs) -> Iterator[Dict[str, Any]]:
+        for dataset in self.store.query(*args, **kwargs):
+            yield self.blobs.rehydrate(dataset)
+
+    def iter_after(self, location: Optional[str]) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        return ((stored_at, self.blobs.rehydrate(dataset)) for stored_at, dataset in self.store.iter_after(location))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"dedup": self.dedup, **self.blobs.stats()}
+
+    def close(self):
+        self.store.close()
+        self.blobs.close()
+
+
+def with_blob_store(
+    store,
+    training_dir: str,
+    dedup: bool = False,
+    max_segment_bytes: int = 64 * 1024 * 1024,
+    compress: bool = False
+):
+    """
+    Wrap a dataset backend in a DedupDatasetStore when dedup is on or blobs from an
+    earlier deduplicating run exist (so their references can be read); otherwise
+    return it unchanged.
+    """
+    if not dedup and not os.path.isdir(os.path.join(training_dir, BLOB_DIR_NAME)):
+        return store
+    blobs = BlobStore(training_dir, max_segment_bytes=max_segment_bytes, compress=compress)
+    return DedupDatasetStore(store, blobs, dedup=dedup)
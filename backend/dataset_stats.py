@@ -0,0 +1,220 @@
+"""
+Running aggregates over the stored RLHF datasets.
+DatasetStats is updated as each dataset is written, so /api/stats never has to
+re-read training data. Sessions are counted by distinct session_id: the latest
+dataset for a session replaces the contribution of an earlier submission. The
+totals are snapshotted to a small JSON file together with the store location of
+the last dataset counted; on startup sync() reloads the snapshot and folds in
+whatever the store holds after that location (datasets written after the last
+snapshot, e.g. before a crash). The full corpus is only scanned when there is no
+usable snapshot.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, Iterable, List
+
+# pddl_validity_score histogram: ten 0.1-wide bins [low, high), a bin for exactly 1.0 and "unknown"
+VALIDITY_BIN_COUNT = 10
+VALIDITY_BINS = [f"{i / VALIDITY_BIN_COUNT:.1f}-{(i + 1) / VALIDITY_BIN_COUNT:.1f}" for i in range(VALIDITY_BIN_COUNT)]
+VALIDITY_KEYS = VALIDITY_BINS + ["1.0", "unknown"]
+# Bumped when the snapshot layout changes; older snapshots are recomputed from the datasets
+SNAPSHOT_VERSION = 3
+SNAPSHOT_INTERVAL = 10.0   # minimum seconds between snapshots written by save_if_due()
+
+
+def validity_bin(validity: Optional[float]) -> str:
+    """Histogram key for a pddl_validity_score."""
+    if validity is None:
+        return "unknown"
+    if validity >= 1.0:
+        return "1.0"
+    # The small epsilon keeps scores like 0.3 (0.29999... * 10) out of the bin below
+    return VALIDITY_BINS[min(max(int(validity * VALIDITY_BIN_COUNT + 1e-9), 0), VALIDITY_BIN_COUNT - 1)]
+
+
+def contribution(dataset: Dict[str, Any]) -> List[Any]:
+    """
+    What one dataset adds to the aggregates, as a compact list (kept per session in
+    the snapshot): [feedback_items, positive_ratings, negative_ratings,
+    overall_score or None, validity bin, trainable (0/1), prompt_tokens,
+    completion_tokens, total_tokens].
+    """
+    metrics = dataset.get("aggregated_metrics") or {}
+    model_metadata = dataset.get("model_metadata") or {}
+    items = dataset.get("human_feedback")
+    if items is None:
+        items = dataset.get("feedback") or []
+    return [
+        len(items),
+        sum(1 for item in items if item.get("rating") == "positive"),
+        sum(1 for item in items if item.get("rating") == "negative"),
+        metrics.get("overall_score"),
+        validity_bin(metrics.get("pddl_validity_score")),
+        1 if (dataset.get("training_metadata") or {}).get("can_use_for_training") else 0,
+        model_metadata.get("prompt_tokens") or 0,
+        model_metadata.get("completion_tokens") or 0,
+        model_metadata.get("total_tokens") or 0,
+    ]
+
+
+class DatasetStats:
+    """Incrementally maintained totals and distributions over datasets. Thread-safe."""
+
+    COUNTERS = (
+        "sessions",
+        "feedback_items",
+        "positive_ratings",
+        "negative_ratings",
+        "scored_sessions",
+        "trainable_sessions",
+        "prompt_tokens",
+        "completion_tokens",
+        "total_tokens",
+    )
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self.lock = threading.Lock()
+        self.last_saved = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.totals = {name: 0 for name in self.COUNTERS}
+        self.overall_score_sum = 0.0
+        self.validity_distribution: Dict[str, int] = {key: 0 for key in VALIDITY_KEYS}
+        # session_id -> contribution() of its latest dataset
+        self.sessions: Dict[str, List[Any]] = {}
+        # Store location of the last dataset counted (None: nothing counted from the store yet)
+        self.position: Optional[str] = None
+        self.updated_at: Optional[float] = None
+
+    def _apply(self, counted: List[Any], sign: int):
+        feedback_items, positive, negative, overall_score, validity, trainable, prompt, completion, total = counted
+        totals = self.totals
+        totals["sessions"] += sign
+        totals["feedback_items"] += sign * feedback_items
+        totals["positive_ratings"] += sign * positive
+        totals["negative_ratings"] += sign * negative
+        if overall_score is not None:
+            totals["scored_sessions"] += sign
+            self.overall_score_sum += sign * overall_score
+        self.validity_distribution[validity] += sign
+        totals["trainable_sessions"] += sign * trainable
+        totals["prompt_tokens"] += sign * prompt
+        totals["completion_tokens"] += sign * completion
+        totals["total_tokens"] += sign * total
+
+    def _add(self, dataset: Dict[str, Any]):
+        counted = contribution(dataset)
+        session_id = dataset.get("session_id")
+        if session_id is not None:
+            previous = self.sessions.get(session_id)
+            if previous is not None:
+                # Resubmitted feedback: the latest dataset replaces the earlier one
+                self._apply(previous, -1)
+            self.sessions[session_id] = counted
+        self._apply(counted, 1)
+
+    def add_many(self, datasets: Iterable[Dict[str, Any]], position: Optional[str] = None):
+        """Count datasets; position is the store location of the last of them, if known."""
+        with self.lock:
+            for dataset in datasets:
+                self._add(dataset)
+            if position is not None:
+                self.position = position
+            self.updated_at = time.time()
+
+    def sync(self, store) -> int:
+        """
+        Load the snapshot and count the datasets the store holds after its position
+        (everything, when there is no usable snapshot or the store does not know the
+        position, e.g. after switching backends). Returns the number of datasets counted.
+        """
+        loaded = self.load()
+        try:
+            datasets = store.iter_after(self.position if loaded else None)
+        except ValueError:
+            with self.lock:
+                self._reset()
+            datasets = store.iter_after(None)
+        counted = 0
+        with self.lock:
+            for location, dataset in datasets:
+                self._add(dataset)
+                if location is not None:
+                    self.position = location
+                counted += 1
+            if counted:
+                self.updated_at = time.time()
+        if counted or not loaded:
+            self.save()
+        return counted
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            totals = dict(self.totals)
+            sessions = totals["sessions"]
+            return {
+                **totals,
+                "mean_overall_score": round(self.overall_score_sum / totals["scored_sessions"], 4) if totals["scored_sessions"] else None,
+                "trainable_fraction": round(totals["trainable_sessions"] / sessions, 4) if sessions else None,
+                "pddl_validity_distribution": {key: self.validity_distribution[key] for key in VALIDITY_KEYS},
+                "updated_at": self.updated_at
+            }
+
+    def save(self):
+        """Atomically write the current totals and store position to the snapshot file."""
+        if not self.snapshot_path:
+            return
+        with self.lock:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "position": self.position,
+                "totals": self.totals,
+                "overall_score_sum": self.overall_score_sum,
+                "validity_distribution": self.validity_distribution,
+                "sessions": self.sessions,
+                "updated_at": self.updated_at
+            }
+            directory = os.path.dirname(self.snapshot_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.snapshot_path)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self.last_saved = time.time()
+
+    def save_if_due(self):
+        """save() unless a snapshot was written less than SNAPSHOT_INTERVAL seconds ago."""
+        if time.time() - self.last_saved >= SNAPSHOT_INTERVAL:
+            self.save()
+
+    def load(self) -> bool:
+        """Restore totals and position from the snapshot file. Returns False if there is no usable snapshot."""
+        if not self.snapshot_path:
+            return False
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return False
+        with self.lock:
+            self.totals = {name: snapshot["totals"].get(name, 0) for name in self.COUNTERS}
+            self.overall_score_sum = snapshot["overall_score_sum"]
+            self.validity_distribution = {key: snapshot["validity_distribution"].get(key, 0) for key in VALIDITY_KEYS}
+            self.sessions = snapshot["sessions"]
+            self.position = snapshot["position"]
+            self.updated_at = snapshot.get("updated_at")
+        return True
@@ -0,0 +1,789 @@
+"""
+Append-only storage for RLHF training datasets.
+Datasets are appended as JSON lines to size-rotated segment files instead of one
+file per session. Segments are either plain `.jsonl` or `.jsonl.gz`; in the
+compressed form every record is its own gzip member, so a segment is still a
+valid gzip stream (readable with `zcat`) while any record can be read back
+from its offset without decompressing the rest of the segment.
+SessionIndex maps session ids to record locations for constant-time lookups.
+JsonlDatasetStore (segments + index) and SqliteDatasetStore are the two dataset
+backends; both provide save(), save_many(), find(), query(), iter_after() and
+close().
+"""
+
+import dbm
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_NAME_RE = re.compile(r'^segment-(\d{6})\.jsonl(\.gz)?$')
+LEGACY_FILE_RE = re.compile(r'^rlhf_session_.*\.json$')
+LEGACY_LOCATION_PREFIX = "legacy:"
+SESSION_INDEX_NAME = "session_index"
+SQLITE_DB_NAME = "datasets.sqlite3"
+READ_CHUNK_SIZE = 1 << 16
+
+
+def encode_record(record: Dict[str, Any], compress: bool) -> bytes:
+    """One stored record: a JSON line, gzip-compressed as a standalone member if requested."""
+    line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+    return gzip.compress(line, mtime=0) if compress else line
+
+
+def decode_record(data: bytes, compressed: bool) -> Dict[str, Any]:
+    if compressed:
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def scan_plain_segment(f, start: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (offset, length, line) for every complete line from start; a torn final line is skipped."""
+    f.seek(start)
+    offset = start
+    for line in f:
+        if not line.endswith(b'\n'):
+            return
+        yield offset, len(line), line
+        offset += len(line)
+
+
+def scan_gzip_segment(f, start: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (offset, length, decompressed line) for every complete gzip member from start; a torn final member is skipped."""
+    f.seek(start)
+    member_start = start
+    position = start
+    decompressor = zlib.decompressobj(wbits=31)
+    output = []
+    while True:
+        data = f.read(READ_CHUNK_SIZE)
+        if not data:
+            return
+        while data:
+            try:
+                output.append(decompressor.decompress(data))
+            except zlib.error:
+                # Corrupt member (e.g. a write cut short and appended to): stop at the last good record
+                return
+            if not decompressor.eof:
+                position += len(data)
+                break
+            unused = decompressor.unused_data
+            member_end = position + len(data) - len(unused)
+            yield member_start, member_end - member_start, b''.join(output)
+            member_start = position = member_end
+            decompressor = zlib.decompressobj(wbits=31)
+            output = []
+            data = unused
+
+
+class SegmentedJsonlStore:
+    """
+    Append-only dataset store made of numbered segment files in one directory.
+    The active segment is rotated once it reaches max_segment_bytes. Each record is
+    written with a single write() followed by fsync (unless fsync=False), and a
+    record torn by a crash is truncated away when the store is reopened, so readers
+    only ever see complete records. Records are addressed by a location string
+    "<segment file>:<offset>:<length>". Thread-safe.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        compress: bool = False,
+        fsync: bool = True
+    ):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self.segment_names()
+        self.active_name = segments[-1] if segments else None
+        self.active_file = None
+        self.active_size = 0
+        if self.active_name:
+            self._recover(self.active_name)
+            self.active_size = os.path.getsize(self._path(self.active_name))
+
+    def segment_names(self) -> List[str]:
+        """Segment file names in append order."""
+        return sorted(name for name in os.listdir(self.directory) if SEGMENT_NAME_RE.match(name))
+
+    def _path(self, segment_name: str) -> str:
+        return os.path.join(self.directory, segment_name)
+
+    @staticmethod
+    def _is_compressed(segment_name: str) -> bool:
+        return segment_name.endswith('.gz')
+
+    def _scan(self, segment_name: str, f, start: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+        if self._is_compressed(segment_name):
+            return scan_gzip_segment(f, start)
+        return scan_plain_segment(f, start)
+
+    def _recover(self, segment_name: str):
+        """Truncate a partially written record at the end of a segment."""
+        path = self._path(segment_name)
+        good_end = 0
+        with open(path, 'rb') as f:
+            for offset, length, _ in self._scan(segment_name, f):
+                good_end = offset + length
+        size = os.path.getsize(path)
+        if size > good_end:
+            logger.warning(f"⚠ Truncating {size - good_end} bytes of incomplete data from {segment_name}")
+            with open(path, 'r+b') as f:
+                f.truncate(good_end)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _open_segment(self, segment_name: str):
+        if self.active_file is not None:
+            # Records already written to the segment being rotated away from must be durable first
+            self.active_file.flush()
+            if self.fsync:
+                os.fsync(self.active_file.fileno())
+            self.active_file.close()
+        self.active_name = segment_name
+        self.active_file = open(self._path(segment_name), 'ab')
+        self.active_size = self.active_file.tell()
+
+    def _segment_for_write(self, size: int):
+        """Open (or rotate to) a segment that the next size bytes can go into."""
+        if self.active_name is not None:
+            same_format = self._is_compressed(self.active_name) == self.compress
+            if same_format and (self.active_size == 0 or self.active_size + size <= self.max_segment_bytes):
+                if self.active_file is None:
+                    self._open_segment(self.active_name)
+                return
+            number = int(SEGMENT_NAME_RE.match(self.active_name).group(1)) + 1
+        else:
+            number = 1
+        suffix = '.jsonl.gz' if self.compress else '.jsonl'
+        self._open_segment(f"segment-{number:06d}{suffix}")
+        if self.fsync:
+            # Make the new directory entry durable too
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def append(self, record: Dict[str, Any]) -> str:
+        """Durably append one record and return its location."""
+        return self.append_many([record])[0]
+
+    def append_many(self, records: List[Dict[str, Any]]) -> List[str]:
+        """Durably append records with a single flush and fsync. Returns their locations in order."""
+        encoded = [encode_record(record, self.compress) for record in records]
+        if not encoded:
+            return []
+        with self.lock:
+            locations = []
+            batch_start = None  # (segment, offset) where this batch starts in the active segment
+            try:
+                for data in encoded:
+                    self._segment_for_write(len(data))
+                    if batch_start is None or batch_start[0] != self.active_name:
+                        batch_start = (self.active_name, self.active_size)
+                    self.active_file.write(data)
+                    locations.append(f"{self.active_name}:{self.active_size}:{len(data)}")
+                    self.active_size += len(data)
+                self.active_file.flush()
+                if self.fsync:
+                    os.fsync(self.active_file.fileno())
+            except OSError:
+                # Drop whatever part of the batch made it out, so the next append starts clean
+                if self.active_file is not None:
+                    self.active_file.close()
+                    self.active_file = None
+                if batch_start is not None:
+                    with open(self._path(batch_start[0]), 'r+b') as f:
+                        f.truncate(batch_start[1])
+                    self.active_size = batch_start[1]
+                raise
+            return locations
+
+    def read(self, location: str) -> Dict[str, Any]:
+        """Read the record stored at a location returned by append()."""
+        segment_name, offset, length = location.rsplit(':', 2)
+        if not SEGMENT_NAME_RE.match(segment_name):
+            raise ValueError(f"Invalid record location: {location}")
+        with open(self._path(segment_name), 'rb') as f:
+            f.seek(int(offset))
+            data = f.read(int(length))
+        return decode_record(data, self._is_compressed(segment_name))
+
+    def end_position(self) -> str:
+        """Position "<segment file>:<offset>" just past the last appended record."""
+        with self.lock:
+            return f"{self.active_name or ''}:{self.active_size}"
+
+    def iter_records(self, after: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield (location, record) for every stored record in append order, one record
+        in memory at a time. With after (a position from end_position()), only
+        records appended after that position are yielded.
+        """
+        start_segment, start_offset = ('', 0)
+        if after:
+            start_segment, offset = after.rsplit(':', 1)
+            start_offset = int(offset)
+        for segment_name in self.segment_names():
+            if segment_name < start_segment:
+                continue
+            start = start_offset if segment_name == start_segment else 0
+            with open(self._path(segment_name), 'rb') as f:
+                for offset, length, line in self._scan(segment_name, f, start):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"⚠ Skipping unreadable record at {segment_name}:{offset}")
+                        continue
+                    yield f"{segment_name}:{offset}:{length}", record
+
+    def close(self):
+        with self.lock:
+            if self.active_file is not None:
+                self.active_file.close()
+                self.active_file = None
+
+
+class SessionIndex:
+    """
+    Persistent map from full session_id to the location of its latest dataset,
+    stored in a dbm hash database, so lookups stay constant-time however large the
+    corpus grows. Locations are SegmentedJsonlStore locations, or "legacy:<file>"
+    for per-session files that have not been migrated yet.
+    The index also records the store position it is complete up to; sync() indexes
+    whatever was appended after that (e.g. if the process died between appending a
+    dataset and indexing it) and rebuilds the whole index when it is new. Thread-safe.
+    key_field names the record field to index by (the blob store indexes "hash").
+    """
+
+    POSITION_KEY = "\x00indexed_through"
+
+    def __init__(self, path: str, key_field: str = "session_id"):
+        self.path = path
+        self.key_field = key_field
+        self.lock = threading.Lock()
+        self.db = dbm.open(path, 'c')
+
+    def get(self, session_id: str) -> Optional[str]:
+        with self.lock:
+            location = self.db.get(session_id)
+        return location.decode('utf-8') if location is not None else None
+
+    def put(self, session_id: str, location: str):
+        """Point session_id at a newly appended store record."""
+        segment_name, offset, length = location.rsplit(':', 2)
+        with self.lock:
+            self.db[session_id] = location
+            self.db[self.POSITION_KEY] = f"{segment_name}:{int(offset) + int(length)}"
+
+    def _index_store(self, store: SegmentedJsonlStore, after: Optional[str]) -> int:
+        indexed = 0
+        for location, record in store.iter_records(after=after):
+            if record.get(self.key_field):
+                self.put(record[self.key_field], location)
+                indexed += 1
+        with self.lock:
+            self.db[self.POSITION_KEY] = store.end_position()
+        return indexed
+
+    def rebuild(self, store: SegmentedJsonlStore, training_dir: Optional[str]) -> int:
+        """Recreate the index from the store and any unmigrated per-session files. Returns the number of records indexed."""
+        with self.lock:
+            self.db.close()
+            self.db = dbm.open(self.path, 'n')
+        indexed = 0
+        # Legacy files are older than anything in the store, so store records win for the same session
+        for name in legacy_dataset_files(training_dir) if training_dir else []:
+            try:
+                with open(os.path.join(training_dir, name), 'r') as f:
+                    session_id = json.load(f).get("session_id")
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠ Skipping unreadable dataset {name}: {e}")
+                continue
+            if session_id:
+                with self.lock:
+                    self.db[session_id] = LEGACY_LOCATION_PREFIX + name
+                indexed += 1
+        return indexed + self._index_store(store, None)
+
+    def sync(self, store: SegmentedJsonlStore, training_dir: Optional[str]) -> int:
+        """Bring the index up to date with the store. Returns the number of records indexed."""
+        with self.lock:
+            position = self.db.get(self.POSITION_KEY)
+        if position is None:
+            return self.rebuild(store, training_dir)
+        return self._index_store(store, position.decode('utf-8'))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def utc_timestamp(value: str) -> str:
+    """
+    An ISO-8601 date or timestamp as a fixed-width UTC string (YYYY-MM-DDTHH:MM:SS.ffffffZ),
+    so timestamps with different offsets and precisions compare correctly as strings.
+    Values without an offset (and bare dates, at midnight) are taken as UTC.
+    Raises ValueError if value is not ISO-8601.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def dataset_timestamp(dataset: Dict[str, Any]) -> Optional[str]:
+    """The dataset's timestamp as utc_timestamp(), or None if it has no readable timestamp."""
+    timestamp = dataset.get("timestamp")
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        return utc_timestamp(timestamp)
+    except ValueError:
+        return None
+
+
+def dataset_matches(
+    dataset: Dict[str, Any],
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    min_score: Optional[float] = None,
+    min_validity: Optional[float] = None,
+    trainable: Optional[bool] = None,
+    model: Optional[str] = None
+) -> bool:
+    """
+    Whether a dataset passes the export filters. Mirrors the SQL used by
+    SqliteDatasetStore.query(): a filter on a field the dataset does not have
+    never matches. since/until and the dataset timestamp are compared in UTC
+    (see utc_timestamp); since/until must be valid ISO-8601.
+    """
+    timestamp = dataset_timestamp(dataset) if since is not None or until is not None else None
+    since = utc_timestamp(since) if since is not None else None
+    until = utc_timestamp(until) if until is not None else None
+    metrics = dataset.get("aggregated_metrics") or {}
+    if since is not None and (timestamp is None or timestamp < since):
+        return False
+    if until is not None and (timestamp is None or timestamp >= until):
+        return False
+    if min_score is not None and (metrics.get("overall_score") is None or metrics["overall_score"] < min_score):
+        return False
+    if min_validity is not None and (
+        metrics.get("pddl_validity_score") is None or metrics["pddl_validity_score"] < min_validity
+    ):
+        return False
+    if trainable is not None:
+        can_use = (dataset.get("training_metadata") or {}).get("can_use_for_training")
+        if can_use is None or bool(can_use) != trainable:
+            return False
+    if model is not None and (dataset.get("model_metadata") or {}).get("model") != model:
+        return False
+    return True
+
+
+class JsonlDatasetStore:
+    """
+    Dataset backend made of a SegmentedJsonlStore (training_dir/segments/) plus a
+    SessionIndex (training_dir/session_index). save() appends and indexes a
+    dataset; find() is an index lookup followed by one positioned read.
+    """
+
+    def __init__(self, training_dir: str, max_segment_bytes: int = 64 * 1024 * 1024, compress: bool = False):
+        self.training_dir = training_dir
+        self.segments = SegmentedJsonlStore(
+            os.path.join(training_dir, "segments"),
+            max_segment_bytes=max_segment_bytes,
+            compress=compress
+        )
+        self.index = SessionIndex(os.path.join(training_dir, SESSION_INDEX_NAME))
+
+    def sync(self) -> int:
+        """Index datasets appended since the last run (or everything, for a new index)."""
+        return self.index.sync(self.segments, self.training_dir)
+
+    def save(self, dataset: Dict[str, Any]) -> str:
+        """Durably store a dataset and index it by session. Returns its location."""
+        return self.save_many([dataset])[0]
+
+    def save_many(self, datasets: List[Dict[str, Any]]) -> List[str]:
+        """Durably store datasets with one fsync and index them. Returns their locations in order."""
+        locations = self.segments.append_many(datasets)
+        for dataset, location in zip(datasets, locations):
+            self.index.put(dataset["session_id"], location)
+        return locations
+
+    def file_path(self, location: str) -> str:
+        return os.path.join(self.segments.directory, location)
+
+    def find(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Latest dataset for a full session_id, or None."""
+        location = self.index.get(session_id)
+        if location is None:
+            return None
+        if location.startswith(LEGACY_LOCATION_PREFIX):
+            # Per-session file that has not been migrated into the segments yet
+            try:
+                with open(os.path.join(self.training_dir, location[len(LEGACY_LOCATION_PREFIX):]), 'r') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return None
+        return self.segments.read(location)
+
+    def query(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        min_score: Optional[float] = None,
+        min_validity: Optional[float] = None,
+        trainable: Optional[bool] = None,
+        model: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield matching datasets (unmigrated per-session files first, then the segments
+        in append order), reading one record at a time. Same filters as
+        SqliteDatasetStore.query(), evaluated on each document.
+        """
+        if limit is not None and limit <= 0:
+            return
+        filters = dict(since=since, until=until, min_score=min_score, min_validity=min_validity,
+                       trainable=trainable, model=model)
+        yielded = 0
+        for dataset in self._iter_all():
+            if dataset_matches(dataset, **filters):
+                yield dataset
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+    def iter_after(self, location: Optional[str]) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Yield (location, dataset) for the datasets stored after the one at location (a
+        save_many() location), in append order. With location None every dataset is
+        yielded, unmigrated per-session files first with location None. Raises
+        ValueError (before iterating) if location is not a segment location.
+        """
+        if location is None:
+            return self._iter_all_located()
+        try:
+            segment_name, offset, length = location.rsplit(':', 2)
+            after = f"{segment_name}:{int(offset) + int(length)}"
+        except ValueError:
+            raise ValueError(f"Not a segment location: {location}") from None
+        if not SEGMENT_NAME_RE.match(segment_name):
+            raise ValueError(f"Not a segment location: {location}")
+        return self.segments.iter_records(after)
+
+    def _iter_all_located(self) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        for dataset in self._iter_legacy():
+            yield None, dataset
+        yield from self.segments.iter_records()
+
+    def _iter_legacy(self) -> Iterator[Dict[str, Any]]:
+        for name in legacy_dataset_files(self.training_dir):
+            try:
+                with open(os.path.join(self.training_dir, name), 'r') as f:
+                    yield json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠ Skipping unreadable dataset {name}: {e}")
+
+    def _iter_all(self) -> Iterator[Dict[str, Any]]:
+        yield from self._iter_legacy()
+        for _, dataset in self.segments.iter_records():
+            yield dataset
+
+    def close(self):
+        self.index.close()
+        self.segments.close()
+
+
+class SqliteDatasetStore:
+    """
+    Dataset backend in an embedded SQLite database (WAL mode).
+    Each dataset is one row holding the full JSON document plus indexed columns
+    (session_id, timestamp, model, overall_score, pddl_validity_score,
+    can_use_for_training), so filtered queries do not have to parse every document.
+    Concurrent save() calls are group-committed: whichever caller finds no commit in
+    progress writes every pending row in one transaction, and each caller returns
+    once the transaction holding its row has committed. Thread-safe.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS datasets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            timestamp TEXT,
+            model TEXT,
+            overall_score REAL,
+            pddl_validity_score REAL,
+            can_use_for_training INTEGER,
+            document TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_session_id ON datasets (session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_timestamp ON datasets (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_model ON datasets (model)",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_overall_score ON datasets (overall_score)",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_pddl_validity_score ON datasets (pddl_validity_score)",
+        "CREATE INDEX IF NOT EXISTS idx_datasets_can_use_for_training ON datasets (can_use_for_training, timestamp)"
+    ]
+    # PRAGMA user_version; 1: the timestamp column holds utc_timestamp() values
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Only the thread holding the commit slot uses the write connection
+        self.write_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.write_conn.execute("PRAGMA journal_mode=WAL")
+        self.write_conn.execute("PRAGMA synchronous=FULL")
+        for statement in self.SCHEMA:
+            self.write_conn.execute(statement)
+        self._upgrade()
+        self.local = threading.local()
+        self.cond = threading.Condition()
+        self.pending: List[Dict[str, Any]] = []
+        self.committing = False
+
+    def _upgrade(self):
+        """Bring rows written by older versions up to SCHEMA_VERSION."""
+        conn = self.write_conn
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        if version >= self.SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT id, document FROM datasets").fetchall()
+            conn.executemany(
+                "UPDATE datasets SET timestamp = ? WHERE id = ?",
+                [(dataset_timestamp(json.loads(document)), row_id) for row_id, document in rows]
+            )
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"✅ Normalized timestamps of {len(rows)} datasets to UTC")
+
+    def _read_conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self.local.conn = conn
+        return conn
+
+    def sync(self) -> int:
+        return 0
+
+    @staticmethod
+    def _row(dataset: Dict[str, Any]) -> tuple:
+        metrics = dataset.get("aggregated_metrics") or {}
+        trainable = (dataset.get("training_metadata") or {}).get("can_use_for_training")
+        return (
+            dataset["session_id"],
+            dataset_timestamp(dataset),
+            (dataset.get("model_metadata") or {}).get("model"),
+            metrics.get("overall_score"),
+            metrics.get("pddl_validity_score"),
+            None if trainable is None else int(bool(trainable)),
+            json.dumps(dataset, separators=(',', ':'))
+        )
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        conn = self.write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for item in batch:
+                cursor = conn.execute(
+                    "INSERT INTO datasets (session_id, timestamp, model, overall_score, pddl_validity_score, "
+                    "can_use_for_training, document) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    item["row"]
+                )
+                item["rowid"] = cursor.lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save(self, dataset: Dict[str, Any]) -> str:
+        """Durably store a dataset. Returns its location ("sqlite:<row id>")."""
+        return self.save_many([dataset])[0]
+
+    def save_many(self, datasets: List[Dict[str, Any]]) -> List[str]:
+        """Durably store datasets (committed together). Returns their locations in order."""
+        items = [{"row": self._row(dataset), "done": False, "error": None, "rowid": None} for dataset in datasets]
+        if not items:
+            return []
+        item = items[-1]  # the items are committed in the same transaction
+        with self.cond:
+            self.pending.extend(items)
+            while not item["done"]:
+                if self.committing:
+                    self.cond.wait()
+                    continue
+                # Commit everything queued so far, including other callers' rows
+                self.committing = True
+                batch, self.pending = self.pending, []
+                self.cond.release()
+                error = None
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    error = e
+                finally:
+                    self.cond.acquire()
+                    for queued in batch:
+                        queued["done"] = True
+                        queued["error"] = error
+                    self.committing = False
+                    self.cond.notify_all()
+        if item["error"] is not None:
+            raise item["error"]
+        return [f"sqlite:{queued['rowid']}" for queued in items]
+
+    def file_path(self, location: str) -> str:
+        return f"{self.path}#{location.split(':', 1)[1]}"
+
+    def find(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Latest dataset for a full session_id, or None."""
+        row = self._read_conn().execute(
+            "SELECT document FROM datasets WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+            (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        min_score: Optional[float] = None,
+        min_validity: Optional[float] = None,
+        trainable: Optional[bool] = None,
+        model: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield matching datasets in insertion order, streaming from the database cursor.
+        since/until are ISO-8601 timestamps compared in UTC against the dataset timestamp
+        (see utc_timestamp); a limit of 0 or less yields nothing, as in JsonlDatasetStore.
+        """
+        if limit is not None and limit <= 0:
+            return
+        clauses, params = [], []
+        for clause, value in (
+            ("timestamp >= ?", utc_timestamp(since) if since is not None else None),
+            ("timestamp < ?", utc_timestamp(until) if until is not None else None),
+            ("overall_score >= ?", min_score),
+            ("pddl_validity_score >= ?", min_validity),
+            ("can_use_for_training = ?", None if trainable is None else int(trainable)),
+            ("model = ?", model)
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = "SELECT document FROM datasets"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        # A dedicated connection, so a partially consumed query never blocks other reads.
+        # Consumers such as streaming responses may resume the generator on another thread.
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            for (document,) in conn.execute(sql, params):
+                yield json.loads(document)
+        finally:
+            conn.close()
+
+    def iter_after(self, location: Optional[str]) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Yield (location, dataset) for the datasets stored after the one at location
+        ("sqlite:<row id>"), in insertion order; every dataset when location is None.
+        Raises ValueError (before iterating) if location is not a SQLite location.
+        """
+        row_id = 0
+        if location is not None:
+            prefix, _, value = location.partition(':')
+            if prefix != "sqlite" or not value.isdigit():
+                raise ValueError(f"Not a SQLite location: {location}")
+            row_id = int(value)
+        return self._iter_rows_after(row_id)
+
+    def _iter_rows_after(self, row_id: int) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            for rowid, document in conn.execute("SELECT id, document FROM datasets WHERE id > ? ORDER BY id", (row_id,)):
+                yield f"sqlite:{rowid}", json.loads(document)
+        finally:
+            conn.close()
+
+    def close(self):
+        with self.cond:
+            self.write_conn.close()
+
+
+def open_dataset_store(
+    backend: str,
+    training_dir: str,
+    db_path: Optional[str] = None,
+    max_segment_bytes: int = 64 * 1024 * 1024,
+    compress: bool = False
+):
+    """Open the dataset backend named by backend: "segments" (default) or "sqlite"."""
+    if backend == "sqlite":
+        return SqliteDatasetStore(db_path or os.path.join(training_dir, SQLITE_DB_NAME))
+    if backend == "segments":
+        return JsonlDatasetStore(training_dir, max_segment_bytes=max_segment_bytes, compress=compress)
+    raise ValueError(f"Unknown dataset backend: {backend} (use segments or sqlite)")
+
+
+def legacy_dataset_files(training_dir: str) -> List[str]:
+    """Per-session rlhf_session_<ts>_<id>.json files, oldest first."""
+    return sorted(name for name in os.listdir(training_dir) if LEGACY_FILE_RE.match(name))
+
+
+def migrate_legacy_datasets(training_dir: str, store, delete: bool = False) -> int:
+    """
+    Save every per-session JSON file in training_dir to a dataset backend, oldest first.
+    Migrated files are moved to training_dir/migrated/ (or deleted with delete=True)
+    only after their dataset has been stored, so an interrupted migration can be
+    re-run without losing datasets (only the file being migrated at the time can
+    end up stored twice). Returns the number migrated.
+    """
+    archive_dir = os.path.join(training_dir, "migrated")
+    migrated = 0
+    for name in legacy_dataset_files(training_dir):
+        path = os.path.join(training_dir, name)
+        try:
+            with open(path, 'r') as f:
+                dataset = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠ Skipping unreadable dataset {name}: {e}")
+            continue
+        store.save(dataset)
+        if delete:
+            os.remove(path)
+        else:
+            os.makedirs(archive_dir, exist_ok=True)
+            os.replace(path, os.path.join(archive_dir, name))
+        migrated += 1
+    return migrated
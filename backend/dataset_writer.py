@@ -0,0 +1,165 @@
+"""
+Write-behind persistence for feedback datasets.
+DatasetWriter sits in front of a dataset backend (see dataset_store): requests
+hand datasets to a bounded queue, and a single background task stores whatever
+has accumulated with one save_many() call, so concurrent submissions share one
+fsync/commit and disk latency stays off the event loop.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("fsync", "queued")
+
+
+class DatasetWriter:
+    """
+    Batching background writer for a dataset backend.
+    durability="fsync": submit() returns the dataset's location once the batch holding
+    it has been fsynced/committed (group commit). durability="queued": submit()
+    returns None as soon as the dataset is on the queue; queued datasets are written
+    on shutdown, but a crash can lose them.
+    submit() waits for room when max_queue datasets are already waiting. Failed
+    batches are retried with backoff before the error is reported.
+    on_written, if given, is called with each successfully stored batch and its
+    locations (in the worker thread, right after the write); its errors are logged,
+    never retried.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_queue: int = 1000,
+        max_batch: int = 256,
+        durability: str = "fsync",
+        retries: int = 3,
+        on_written: Optional[Callable[[List[Dict[str, Any]], List[str]], None]] = None
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability} (use {' or '.join(DURABILITY_MODES)})")
+        self.store = store
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.durability = durability
+        self.retries = retries
+        self.on_written = on_written
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+        # Monitoring counters
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        """Start the writer task on the running event loop (idempotent)."""
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.task = asyncio.create_task(self._run())
+
+    async def submit(self, dataset: Dict[str, Any]) -> Optional[str]:
+        """Queue a dataset for writing; see the class docstring for when this returns."""
+        if self.closing:
+            raise RuntimeError("Dataset writer is shutting down")
+        self.start()
+        future = asyncio.get_running_loop().create_future() if self.durability == "fsync" else None
+        await self.queue.put((dataset, future))
+        if future is None:
+            return None
+        # Shielded: a disconnected client must not cancel the write other callers share
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            entry = await self.queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+
+    def _store(self, datasets: List[Dict[str, Any]]) -> List[str]:
+        locations = self.store.save_many(datasets)
+        if self.on_written is not None:
+            try:
+                self.on_written(datasets, locations)
+            except Exception as e:
+                logger.warning(f"⚠ Post-write hook failed: {str(e)}")
+        return locations
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], Optional[asyncio.Future]]]):
+        datasets = [dataset for dataset, _ in batch]
+        started = time.perf_counter()
+        error = None
+        locations = None
+        for attempt in range(self.retries + 1):
+            try:
+                locations = await asyncio.to_thread(self._store, datasets)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    logger.warning(f"⚠ Dataset write failed ({str(e)}), retrying batch of {len(batch)}")
+                    await asyncio.sleep(0.5 * (attempt + 1))
+        elapsed = time.perf_counter() - started
+
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+        if error is not None:
+            self.failed += len(batch)
+            session_ids = ', '.join(str(dataset.get("session_id", "?"))[:8] for dataset in datasets)
+            logger.error(f"❌ Could not write {len(batch)} datasets ({session_ids}): {str(error)}")
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(error)
+            return
+
+        self.written += len(batch)
+        for (_, future), location in zip(batch, locations):
+            if future is not None and not future.done():
+                future.set_result(location)
+
+    async def close(self):
+        """Stop accepting datasets, write everything still queued and stop the writer task."""
+        self.closing = True
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "durability": self.durability,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue": self.max_queue,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+            "avg_flush_ms": round(self.total_flush_seconds * 1000 / self.batches, 3) if self.batches else 0.0
+        }
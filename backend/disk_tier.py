@@ -0,0 +1,105 @@
+"""
+Size and age limits for the one-JSON-file-per-key disk tiers of GenerationCache
+and SessionStore. Those tiers only expire a file when its key is read again, so
+DiskPruner sweeps the directory on write instead: expired files and temp files
+left by interrupted writes are removed, then the oldest files until the tier
+is within its size limit.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+PRUNE_INTERVAL = 60.0   # seconds between sweeps of a disk tier on write
+PRUNE_TARGET = 0.9      # a size-triggered sweep removes oldest files down to this fraction of the limit
+
+
+def remove_file(path: str) -> int:
+    """Remove path; 1 if it was removed, 0 if it was already gone (e.g. another worker pruned it)."""
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+class DiskPruner:
+    """
+    Tracks the size of a disk tier and sweeps it at most every PRUNE_INTERVAL seconds,
+    or as soon as it may exceed max_bytes (0: no size limit). Files are written once
+    (atomic replace), so a file's mtime is its entry's creation time. Thread-safe;
+    workers sharing the directory may sweep it concurrently.
+    """
+
+    def __init__(self, disk_dir: str, ttl_seconds: float, max_bytes: int = 0):
+        self.disk_dir = disk_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # Size as of the last sweep plus what was written since (None until the first sweep)
+        self.disk_bytes: Optional[int] = None
+        self.last_prune = 0.0
+        self.pruned = 0
+        self.lock = threading.Lock()
+        self.prune_lock = threading.Lock()
+
+    def wrote(self, size: int):
+        """Account for a file of size bytes just written, sweeping the directory if due."""
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += size
+            due = (
+                self.disk_bytes is None
+                or time.time() - self.last_prune >= PRUNE_INTERVAL
+                or (self.max_bytes > 0 and self.disk_bytes > self.max_bytes)
+            )
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Sweep the directory now (unless a sweep is already running); returns the number of files removed."""
+        if not self.prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time()
+            stale_after = self.ttl_seconds if self.ttl_seconds > 0 else PRUNE_INTERVAL
+            files = []
+            removed = 0
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    if entry.name.endswith('.tmp'):
+                        if now - stat.st_mtime > stale_after:
+                            removed += remove_file(entry.path)
+                    elif entry.name.endswith('.json'):
+                        if self.ttl_seconds > 0 and now - stat.st_mtime > self.ttl_seconds:
+                            removed += remove_file(entry.path)
+                        else:
+                            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            if self.max_bytes > 0 and total > self.max_bytes:
+                target = self.max_bytes * PRUNE_TARGET
+                files.sort()
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    removed += remove_file(path)
+                    total -= size
+            with self.lock:
+                self.disk_bytes = total
+                self.last_prune = now
+                self.pruned += removed
+            return removed
+        finally:
+            self.prune_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.max_bytes,
+                "disk_pruned": self.pruned
+            }
@@ -0,0 +1,167 @@
+"""
+Flattened feedback exports for analytics.
+Turns stored RLHF datasets into one row per human_feedback item (session, step,
+rating, reason, feedback quality, model metadata and session metrics) and encodes
+the rows as streaming CSV, Parquet or Arrow IPC. Parquet/Arrow need the optional
+pyarrow package.
+"""
+
+import csv
+import io
+from typing import Dict, Any, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# (column, arrow type name) in output order
+FEEDBACK_COLUMNS = [
+    ("session_id", "string"),
+    ("timestamp", "string"),
+    ("step_id", "string"),
+    ("step_number", "int64"),
+    ("rating", "string"),
+    ("reason", "string"),
+    ("feedback_quality", "string"),
+    ("model", "string"),
+    ("temperature", "float64"),
+    ("max_tokens", "int64"),
+    ("prompt_tokens", "int64"),
+    ("completion_tokens", "int64"),
+    ("total_tokens", "int64"),
+    ("overall_score", "float64"),
+    ("pddl_validity_score", "float64"),
+    ("can_use_for_training", "bool_"),
+]
+STEP_CONTENT_COLUMN = ("step_content", "string")
+ROWS_PER_BATCH = 10000
+CSV_CHUNK_ROWS = 500
+
+
+def feedback_columns(include_content: bool = False) -> List[tuple]:
+    return FEEDBACK_COLUMNS + [STEP_CONTENT_COLUMN] if include_content else FEEDBACK_COLUMNS
+
+
+def flatten_feedback(dataset: Dict[str, Any], include_content: bool = False) -> Iterator[Dict[str, Any]]:
+    """One row per feedback item of a dataset (older datasets keep their items under "feedback")."""
+    model_metadata = dataset.get("model_metadata") or {}
+    metrics = dataset.get("aggregated_metrics") or {}
+    session = {
+        "session_id": dataset.get("session_id"),
+        "timestamp": dataset.get("timestamp"),
+        "model": model_metadata.get("model"),
+        "temperature": model_metadata.get("temperature"),
+        "max_tokens": model_metadata.get("max_tokens"),
+        "prompt_tokens": model_metadata.get("prompt_tokens"),
+        "completion_tokens": model_metadata.get("completion_tokens"),
+        "total_tokens": model_metadata.get("total_tokens"),
+        "overall_score": metrics.get("overall_score"),
+        "pddl_validity_score": metrics.get("pddl_validity_score"),
+        "can_use_for_training": (dataset.get("training_metadata") or {}).get("can_use_for_training"),
+    }
+    items = dataset.get("human_feedback")
+    if items is None:
+        items = dataset.get("feedback") or []
+    for item in items:
+        row = dict(session)
+        row["step_id"] = item.get("step_id")
+        row["step_number"] = item.get("step_number")
+        row["rating"] = item.get("rating")
+        row["reason"] = item.get("reason")
+        row["feedback_quality"] = item.get("feedback_quality")
+        if include_content:
+            row["step_content"] = item.get("step_content")
+        yield row
+
+
+def feedback_rows(datasets: Iterator[Dict[str, Any]], include_content: bool = False) -> Iterator[Dict[str, Any]]:
+    for dataset in datasets:
+        yield from flatten_feedback(dataset, include_content)
+
+
+def csv_chunks(datasets: Iterator[Dict[str, Any]], include_content: bool = False) -> Iterator[bytes]:
+    """Stream feedback rows as CSV with a header line, CSV_CHUNK_ROWS rows per chunk."""
+    names = [name for name, _ in feedback_columns(include_content)]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=names, extrasaction='ignore')
+    writer.writeheader()
+    pending = 0
+    for row in feedback_rows(datasets, include_content):
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object that hands out what has been written since the last drain()."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_schema(include_content: bool = False):
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in feedback_columns(include_content)])
+
+
+def arrow_batches(datasets: Iterator[Dict[str, Any]], schema) -> Iterator[Any]:
+    """Group feedback rows into pyarrow RecordBatches of up to ROWS_PER_BATCH rows."""
+    include_content = STEP_CONTENT_COLUMN[0] in schema.names
+    rows = []
+    for row in feedback_rows(datasets, include_content):
+        rows.append(row)
+        if len(rows) >= ROWS_PER_BATCH:
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def columnar_chunks(datasets: Iterator[Dict[str, Any]], fmt: str, include_content: bool = False) -> Iterator[bytes]:
+    """
+    Stream feedback rows as Parquet (one row group per batch) or as an Arrow IPC
+    stream (fmt "parquet" or "arrow"). Only one batch is held in memory at a time.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    schema = arrow_schema(include_content)
+    sink = ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    elif fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+
+    for batch in arrow_batches(datasets, schema):
+        writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,180 @@
+"""
+Response cache and request coalescing for model generations.
+GenerationCache is a bounded in-memory LRU with TTL, optionally backed by a
+directory of JSON files so cached generations survive restarts and are shared
+between workers. SingleFlight makes concurrent identical requests share one call.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable, Callable, Tuple
+
+from disk_tier import DiskPruner
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so prompts differing only in spacing share a cache entry."""
+    return ' '.join(prompt.split())
+
+
+def make_cache_key(prompt: str, model: str, system_prompt: str, temperature: float, max_tokens: int) -> str:
+    """Cache key over the normalized prompt, model, system prompt hash and sampling parameters."""
+    key_material = json.dumps({
+        "prompt": normalize_prompt(prompt),
+        "model": model,
+        "system_prompt_sha256": hashlib.sha256(system_prompt.encode('utf-8')).hexdigest(),
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }, sort_keys=True)
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache of model responses keyed by make_cache_key().
+    The memory tier holds at most max_entries responses and evicts the least recently
+    used; the optional disk tier stores one JSON file per key. Entries older than
+    ttl_seconds are treated as missing in both tiers. Writes prune the disk tier
+    down to disk_max_bytes (see DiskPruner). Thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes  # 0: no size limit
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, response)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pruner: Optional[DiskPruner] = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.pruner = DiskPruner(disk_dir, ttl_seconds, disk_max_bytes)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, created_at: float, response: Dict[str, Any]):
+        with self.lock:
+            self.entries[key] = (created_at, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for key, or None on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    del self.entries[key]
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                record = None
+            if record is not None:
+                if self._expired(record.get("created_at", 0)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                else:
+                    self._remember(key, record["created_at"], record["response"])
+                    with self.lock:
+                        self.hits += 1
+                    return record["response"]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """Store a response in memory and, if enabled, on disk (atomic replace)."""
+        created_at = time.time()
+        self._remember(key, created_at, response)
+        if self.disk_dir:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({"created_at": created_at, "response": response}, f)
+                    size = f.tell()
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self.pruner.wrote(size)
+
+    def prune_disk(self) -> int:
+        """Sweep the disk tier now; returns the number of files removed."""
+        return self.pruner.prune() if self.pruner else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": bool(self.disk_dir),
+                **(self.pruner.stats() if self.pruner else {}),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one in-flight task.
+    The first caller starts the work; callers arriving before it finishes await the
+    same task and receive its result (or exception). The task is shielded, so a
+    cancelled caller does not cancel the work others are waiting on.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Task] = {}
+
+    def in_flight(self) -> int:
+        return len(self.calls)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, coalesced) where coalesced is True if another call's result was shared."""
+        task = self.calls.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller has gone away
+            task.exception()
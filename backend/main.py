@@ -5,18 +5,35 @@ FastAPI server for generating PDDL plans and collecting human feedback.
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterator, Tuple
 import requests
 import os
 import json
 import re
+import asyncio
+import zlib
 from datetime import datetime
 import uuid
 import logging
 import sys
 from google import genai
 from google.genai.types import GenerateContentConfig, ThinkingConfig
+from dataset_stats import DatasetStats
+from dataset_store import open_dataset_store, utc_timestamp
+from blob_store import with_blob_store
+from dataset_writer import DatasetWriter
+from feedback_export import columnar_chunks, csv_chunks
+import feedback_export
+from generation_cache import GenerationCache, SingleFlight, make_cache_key
+from session_store import SessionStore
+from pddl_parser import PddlAction, PddlDocument, PddlDocumentBuilder, PlanStep, parse_pddl
+from pddl_planner import PlannerError, solve
+from pddl_validator import trace_checks_by_step, validate_plan
+import pddl_validator
+from response_encoding import CompressionMiddleware, FastJSONResponse, dumps, model_response
+import response_encoding
 
 # Configure logging for Railway
 logging.basicConfig(
@@ -28,7 +45,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="PDDL RLHF API", version="1.0.0")
+# JSON bodies are encoded with orjson (see response_encoding) unless an endpoint builds its own response
+app = FastAPI(title="PDDL RLHF API", version="1.0.0", default_response_class=FastJSONResponse)
 
 # CORS configuration for Vercel frontend
 app.add_middleware(
@@ -39,9 +57,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli/gzip (negotiated from Accept-Encoding) for bodies of at least RESPONSE_COMPRESSION_MIN_BYTES
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+if RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application on startup."""
+    global dataset_store, dataset_writer
     logger.info("=" * 60)
     logger.info("🚀 PDDL RLHF API starting up...")
     logger.info(f"📁 Working directory: {os.getcwd()}")
@@ -49,15 +74,98 @@ async def startup_event():
     logger.info(f"🔑 Project ID configured: {'Yes' if PROJECT_ID else 'No'}")
     logger.info(f"🤖 Model: {MODEL}")
     logger.info(f"🌐 Location: {LOCATION}")
+    logger.info(f"🚦 Max concurrent generations: {MAX_CONCURRENT_GENERATIONS}")
+    cache_disk = f"{GENERATION_CACHE_DIR} (up to {GENERATION_CACHE_DISK_MB:g} MB)" if GENERATION_CACHE_DIR else "off"
+    logger.info(f"♻️ Generation cache: {GENERATION_CACHE_SIZE} entries, TTL {GENERATION_CACHE_TTL}s, disk: {cache_disk}")
+    logger.info(f"🧩 Grounding cache: {GROUNDING_CACHE_SIZE} tasks")
+    compression = f"{'br/gzip' if response_encoding.brotli else 'gzip'} from {RESPONSE_COMPRESSION_MIN_BYTES} bytes" if RESPONSE_COMPRESSION else "off"
+    logger.info(f"🗜 Responses: {'orjson' if response_encoding.orjson else 'json'} encoding, compression {compression}")
+    logger.info(f"🧭 Planner: {PLANNER_TIME_BUDGET:g}s default budget (max {PLANNER_MAX_TIME_BUDGET:g}s), {MAX_CONCURRENT_PLANNERS} concurrent")
+    session_disk = f"{SESSION_STORE_DIR} (up to {SESSION_STORE_DISK_MB:g} MB)" if SESSION_STORE_DIR else "off"
+    logger.info(f"🗂 Session store: {SESSION_STORE_SIZE} sessions, {SESSION_STORE_MAX_MB:g} MB, TTL {SESSION_TTL}s, disk: {session_disk}")
+    dataset_store = await asyncio.to_thread(open_training_data_store)
+    indexed = dataset_store.sync()
+    logger.info(f"💾 Dataset backend: {DATASET_BACKEND} ({indexed} datasets indexed on startup), dedup: {'on' if TRAINING_DATA_DEDUP else 'off'}")
+    # Snapshot plus the datasets stored after it (everything on the first start)
+    counted = await asyncio.to_thread(dataset_stats.sync, dataset_store)
+    logger.info(f"📊 Dataset stats ready ({dataset_stats.to_dict()['sessions']} sessions, {counted} datasets counted on startup)")
+    dataset_writer = DatasetWriter(
+        dataset_store,
+        max_queue=DATASET_WRITE_QUEUE,
+        max_batch=DATASET_WRITE_BATCH,
+        durability=DATASET_DURABILITY,
+        on_written=record_dataset_stats
+    )
+    dataset_writer.start()
+    logger.info(f"✍️ Dataset writer: durability {DATASET_DURABILITY}, queue {DATASET_WRITE_QUEUE}, batch {DATASET_WRITE_BATCH}")
     logger.info(f"🌐 PORT: {os.getenv('PORT', 'not set')}")
     logger.info("✅ Startup complete!")
     logger.info("=" * 60)
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write any queued datasets before the process exits."""
+    logger.info(f"🛑 Shutting down, draining {dataset_writer.stats()['queue_depth']} queued datasets...")
+    await dataset_writer.close()
+    dataset_stats.save()
+    dataset_store.close()
+    logger.info("✅ Dataset writer drained")
+
 # Configuration
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "deep-research-467303")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
 MODEL = os.getenv("PDDL_MODEL", "8060593410504916992")
 
+# Maximum number of model generations in flight at once (per worker)
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "32"))
+generation_semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+
+# Maximum number of prompts accepted by one /api/generate-plans batch
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "1000"))
+
+# Upper bound on best-of-N samples per plan request
+MAX_SAMPLES = int(os.getenv("MAX_SAMPLES", "8"))
+
+# Grounded domains shared by plan validation and the planner, keyed by domain content + object set
+GROUNDING_CACHE_SIZE = int(os.getenv("GROUNDING_CACHE_SIZE", "64"))
+pddl_validator.grounding_cache.max_entries = GROUNDING_CACHE_SIZE
+
+# Embedded planner for /api/solve-plan: default and maximum search time, and how many searches run at once
+PLANNER_TIME_BUDGET = float(os.getenv("PLANNER_TIME_BUDGET", "2"))
+PLANNER_MAX_TIME_BUDGET = float(os.getenv("PLANNER_MAX_TIME_BUDGET", "30"))
+MAX_CONCURRENT_PLANNERS = int(os.getenv("MAX_CONCURRENT_PLANNERS", "2"))
+planner_semaphore = asyncio.Semaphore(MAX_CONCURRENT_PLANNERS)
+
+# Generation cache: in-memory LRU with TTL, plus an on-disk tier when GENERATION_CACHE_DIR is set
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "3600"))
+GENERATION_CACHE_DIR = os.getenv("GENERATION_CACHE_DIR") or None
+GENERATION_CACHE_DISK_MB = float(os.getenv("GENERATION_CACHE_DISK_MB", "512"))
+generation_cache = GenerationCache(
+    GENERATION_CACHE_SIZE,
+    GENERATION_CACHE_TTL,
+    GENERATION_CACHE_DIR,
+    disk_max_bytes=int(GENERATION_CACHE_DISK_MB * 1024 * 1024)
+)
+
+# Identical plan requests arriving while one is in flight wait for it instead of calling the model again
+generation_flights = SingleFlight()
+
+# Server-side session store: generated plans are kept so feedback can refer to steps by step_id
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "1000"))
+SESSION_STORE_MAX_MB = float(os.getenv("SESSION_STORE_MAX_MB", "256"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR") or None
+SESSION_STORE_DISK_MB = float(os.getenv("SESSION_STORE_DISK_MB", "1024"))
+session_store = SessionStore(
+    max_entries=SESSION_STORE_SIZE,
+    max_bytes=int(SESSION_STORE_MAX_MB * 1024 * 1024),
+    ttl_seconds=SESSION_TTL,
+    disk_dir=SESSION_STORE_DIR,
+    disk_max_bytes=int(SESSION_STORE_DISK_MB * 1024 * 1024)
+)
+
 # Handle Google Cloud credentials from environment variable
 credentials_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
 if credentials_json:
@@ -266,12 +374,74 @@ try:
 except Exception as e:
     logger.warning(f"⚠ Warning: Could not create training data directory: {e}")
 
+# Dataset backend: "segments" appends to rotating JSONL segments under training_data/segments/
+# (with a session index), "sqlite" stores rows with indexed metric columns in one database file
+DATASET_BACKEND = os.getenv("DATASET_BACKEND", "segments")
+DATASET_DB_PATH = os.getenv("DATASET_DB_PATH") or None
+TRAINING_DATA_SEGMENT_MB = float(os.getenv("TRAINING_DATA_SEGMENT_MB", "64"))
+TRAINING_DATA_COMPRESS = os.getenv("TRAINING_DATA_COMPRESS", "false").lower() in ("1", "true", "yes")
+# Store long strings (model output, PDDL copies, step content) once in training_data/blobs/
+# and keep chunk references in datasets; reads rehydrate whenever blobs exist
+TRAINING_DATA_DEDUP = os.getenv("TRAINING_DATA_DEDUP", "false").lower() in ("1", "true", "yes")
+# Opened in startup_event, so importing main creates no segments, index or database files
+dataset_store = None
+
+
+def open_training_data_store():
+    """Open the configured dataset backend (wrapped for deduplication when enabled)."""
+    return with_blob_store(
+        open_dataset_store(
+            DATASET_BACKEND,
+            TRAINING_DATA_DIR,
+            db_path=DATASET_DB_PATH,
+            max_segment_bytes=int(TRAINING_DATA_SEGMENT_MB * 1024 * 1024),
+            compress=TRAINING_DATA_COMPRESS
+        ),
+        TRAINING_DATA_DIR,
+        dedup=TRAINING_DATA_DEDUP,
+        max_segment_bytes=int(TRAINING_DATA_SEGMENT_MB * 1024 * 1024),
+        compress=TRAINING_DATA_COMPRESS
+    )
+
+
+# Running aggregates for /api/stats, updated on every dataset write and snapshotted to disk
+dataset_stats = DatasetStats(os.path.join(TRAINING_DATA_DIR, "stats.json"))
+
+
+def record_dataset_stats(datasets: List[Dict[str, Any]], locations: List[str]):
+    """DatasetWriter hook: fold newly written datasets into the running aggregates."""
+    dataset_stats.add_many(datasets, locations[-1] if locations else None)
+    # Datasets written after the last snapshot are recounted from the store on startup
+    dataset_stats.save_if_due()
+
+
+# Write-behind persistence: feedback datasets are batched onto the backend by a background task.
+# "fsync" answers once the dataset is durable, "queued" as soon as it is queued.
+DATASET_DURABILITY = os.getenv("DATASET_DURABILITY", "fsync")
+DATASET_WRITE_QUEUE = int(os.getenv("DATASET_WRITE_QUEUE", "1000"))
+DATASET_WRITE_BATCH = int(os.getenv("DATASET_WRITE_BATCH", "256"))
+# Created in startup_event, once dataset_store is open
+dataset_writer: Optional[DatasetWriter] = None
+
 
 # Request/Response Models
 class GeneratePlanRequest(BaseModel):
     prompt: str = Field(..., min_length=10, max_length=5000)
     temperature: float = Field(0.6, ge=0.0, le=1.0)
     max_tokens: int = Field(10000, ge=1000, le=20000)
+    # None: cache only deterministic (temperature 0) generations
+    use_cache: Optional[bool] = None
+    # Best-of-N: generate this many samples in parallel and return the highest scoring one
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    return_candidates: bool = False
+    # "compact": action definitions and META once at the top level, steps reference them by action name
+    step_format: str = Field("full", pattern="^(full|compact)$")
+
+
+class GeneratePlansRequest(BaseModel):
+    items: List[GeneratePlanRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+    concurrency: int = Field(8, ge=1, le=MAX_CONCURRENT_GENERATIONS)
+    timeout_seconds: float = Field(120.0, gt=0, le=600)
 
 
 class Step(BaseModel):
@@ -279,6 +449,8 @@ class Step(BaseModel):
     step_number: int
     step_content: str
     section: Optional[str] = None
+    # Compact responses: key into GeneratePlanResponse.definitions
+    action: Optional[str] = None
 
 
 class GeneratePlanResponse(BaseModel):
@@ -287,12 +459,17 @@ class GeneratePlanResponse(BaseModel):
     plan_text: str
     steps: List[Step]
     metadata: Dict[str, Any]
+    candidates: Optional[List[Dict[str, Any]]] = None
+    # Compact responses only (step_format="compact")
+    definitions: Optional[Dict[str, str]] = None
+    meta: Optional[Dict[str, str]] = None
 
 
 class FeedbackItem(BaseModel):
     step_id: str
-    step_number: int
-    step_content: str
+    # Optional when the session is in the session store: filled in from the stored steps
+    step_number: Optional[int] = None
+    step_content: Optional[str] = None
     rating: str = Field(..., pattern="^(positive|negative)$")
     reason: Optional[str] = None
 
@@ -305,10 +482,11 @@ class FeedbackItem(BaseModel):
 
 class SubmitFeedbackRequest(BaseModel):
     session_id: str
-    prompt: str
-    plan_text: str
+    # Optional when the session is in the session store
+    prompt: Optional[str] = None
+    plan_text: Optional[str] = None
     feedback: List[FeedbackItem]
-    metadata: Dict[str, Any]
+    metadata: Optional[Dict[str, Any]] = None
 
 
 class SubmitFeedbackResponse(BaseModel):
@@ -317,50 +495,73 @@ class SubmitFeedbackResponse(BaseModel):
     file_path: str
 
 
+class SolvePlanRequest(BaseModel):
+    # Either a session in the session store or the model output itself
+    session_id: Optional[str] = None
+    plan_text: Optional[str] = None
+    algorithm: str = Field("gbfs", pattern="^(gbfs|astar)$")
+    time_budget: float = Field(PLANNER_TIME_BUDGET, gt=0, le=PLANNER_MAX_TIME_BUDGET)
+
+
 # Helper Functions
-def parse_steps_from_plan(plan_text: str) -> List[Step]:
+NUMBERED_SECTION_RE = re.compile(r'^##\s*(\d+)[\.\s️⃣]+(.+)$')
+TABLE_SEPARATOR_RE = re.compile(r'^\|[\s\-:]+\|')
+TABLE_ROW_RE = re.compile(r'^\|\s*\*?\*?(\d+)[\.\s\*]*([^|]+?)\*?\*?\s*\|([^|]+)\|([^|]+)\|$')
+NUMBERED_LIST_RE = re.compile(r'^(\d+)[\.\:\)]\s+(.+)$')
+
+
+def detect_plan_formats(plan_text: str) -> List[str]:
     """
-    Parse PDDL plan output into discrete steps.
-    Handles multiple formats:
-    1. JSON format with pddl.plan field
-    2. PLAN section with numbered actions (new system prompt format)
-    3. PDDL action blocks with ; Action: headers
-    4. Numbered sections (## 1. Title)
-    5. Table rows with steps
-    6. Simple numbered lists
+    Classify the output shape in a single scan over its lines.
+    Returns the parse strategies whose markers are present, in the same priority
+    order parse_steps_from_plan has always used. A strategy is only listed when
+    its extractor could produce steps, so absent formats are never scanned.
     """
-    steps = []
-    step_counter = 1
-    
-    # Try Strategy 0: Extract from JSON format (new system prompt)
-    json_steps = extract_json_plan_steps(plan_text)
-    if json_steps:
-        return json_steps
-    
-    # Try Strategy 1: Extract from ; PLAN section (new system prompt format)
-    plan_section_steps = extract_plan_section_steps(plan_text)
-    if plan_section_steps:
-        return plan_section_steps
-    
-    # Try Strategy 2: Extract PDDL action blocks from code blocks
-    pddl_actions = extract_pddl_actions(plan_text)
-    if pddl_actions:
-        return pddl_actions
+    candidates = set()
+    if plan_text.lstrip().startswith('{'):
+        candidates.add('json')
     
-    # Try Strategy 3: Extract numbered sections (## N.)
-    numbered_sections = extract_numbered_sections(plan_text)
-    if numbered_sections:
-        return numbered_sections
+    has_pddl_fence = False
+    has_action = False
+    for line in plan_text.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        first = stripped[0]
+        if first == ';':
+            if stripped.upper() in ('; PLAN', ';PLAN'):
+                candidates.add('plan_section')
+        elif first == '`':
+            if stripped.startswith('```') and ('pddl' in stripped.lower() or 'lisp' in stripped.lower()):
+                has_pddl_fence = True
+        elif first == '#':
+            if 'numbered_sections' not in candidates and NUMBERED_SECTION_RE.match(stripped):
+                candidates.add('numbered_sections')
+        elif first == '|':
+            if 'table' not in candidates and TABLE_SEPARATOR_RE.match(stripped):
+                candidates.add('table')
+        elif first.isdigit():
+            if 'numbered_list' not in candidates and NUMBERED_LIST_RE.match(stripped):
+                candidates.add('numbered_list')
+        if not has_action and ':action' in stripped:
+            has_action = True
     
-    # Try Strategy 4: Extract from workflow tables
-    table_steps = extract_table_steps(plan_text)
-    if table_steps:
-        return table_steps
+    if has_pddl_fence and has_action:
+        candidates.add('pddl_actions')
     
-    # Try Strategy 5: Simple numbered list extraction
-    numbered_list = extract_numbered_list(plan_text)
-    if numbered_list:
-        return numbered_list
+    return [name for name in STEP_EXTRACTORS if name in candidates]
+
+
+def parse_steps_with_strategy(plan_text: str) -> Tuple[List[Step], str]:
+    """
+    Parse PDDL plan output into discrete steps and report which strategy produced them.
+    Only the extractors for formats found by detect_plan_formats are run; a later
+    candidate is tried only if an earlier one turns out to yield no steps.
+    """
+    for strategy in detect_plan_formats(plan_text):
+        steps = STEP_EXTRACTORS[strategy](plan_text)
+        if steps:
+            return steps, strategy
     
     # Fallback: Return the whole text as one step
     return [Step(
@@ -368,253 +569,310 @@ def parse_steps_from_plan(plan_text: str) -> List[Step]:
         step_number=1,
         step_content=plan_text,
         section="Complete Plan"
-    )]
+    )], "fallback"
 
 
-def extract_meta_sections(lines: List[str]) -> Dict[str, str]:
-    """Extract META sections (data_needed, data_collation, reasoning_outline) from PDDL output."""
-    meta_sections = {
-        'data_needed': '',
-        'data_collation': '',
-        'reasoning_outline': ''
-    }
-    
-    current_section = None
-    section_lines = []
-    
-    for line in lines:
+def parse_steps_from_plan(plan_text: str) -> List[Step]:
+    """
+    Parse PDDL plan output into discrete steps.
+    Handles multiple formats:
+    1. JSON format with pddl.plan field
+    2. PLAN section with numbered actions (new system prompt format)
+    3. PDDL action blocks with ; Action: headers
+    4. Numbered sections (## 1. Title)
+    5. Table rows with steps
+    6. Simple numbered lists
+    """
+    steps, _ = parse_steps_with_strategy(plan_text)
+    return steps
+
+
+META_SECTION_HEADERS = [
+    ('; data_needed:', 'data_needed'),
+    ('; data_collation:', 'data_collation'),
+    ('; reasoning_outline:', 'reasoning_outline'),
+]
+
+
+class MetaSectionCollector:
+    """
+    Line-at-a-time collector for the META sections (data_needed, data_collation, reasoning_outline).
+    Shared by extract_meta_sections and IncrementalStepParser.
+    """
+
+    def __init__(self):
+        self.sections = {name: '' for _, name in META_SECTION_HEADERS}
+        self.current_section = None
+        self.section_lines = []
+
+    def _save_current(self):
+        if self.current_section and self.section_lines:
+            self.sections[self.current_section] = '\n'.join(self.section_lines)
+
+    def feed_line(self, line: str) -> bool:
+        """Consume one line. Returns True if the collected META content may have changed."""
         stripped = line.strip()
         
         # Detect META section headers
-        if stripped.startswith('; data_needed:'):
-            if current_section and section_lines:
-                meta_sections[current_section] = '\n'.join(section_lines)
-            current_section = 'data_needed'
-            section_lines = []
-            continue
-        elif stripped.startswith('; data_collation:'):
-            if current_section and section_lines:
-                meta_sections[current_section] = '\n'.join(section_lines)
-            current_section = 'data_collation'
-            section_lines = []
-            continue
-        elif stripped.startswith('; reasoning_outline:'):
-            if current_section and section_lines:
-                meta_sections[current_section] = '\n'.join(section_lines)
-            current_section = 'reasoning_outline'
-            section_lines = []
-            continue
+        for header, name in META_SECTION_HEADERS:
+            if stripped.startswith(header):
+                self._save_current()
+                self.current_section = name
+                self.section_lines = []
+                return False
         
         # Stop collecting when we hit a non-comment line or new major section
-        if current_section:
+        if self.current_section:
             if stripped.startswith(';') and not stripped.startswith('; PLAN') and not stripped.startswith('; STATE'):
                 # Remove leading ';' and whitespace
                 content = stripped[1:].strip()
                 if content:
-                    section_lines.append(content)
+                    self.section_lines.append(content)
+                    return True
             elif stripped.startswith('(define') or stripped == '':
                 # End of META section
-                if section_lines:
-                    meta_sections[current_section] = '\n'.join(section_lines)
-                current_section = None
-                section_lines = []
+                self._save_current()
+                self.current_section = None
+                self.section_lines = []
+        return False
+
+    def snapshot(self) -> Dict[str, str]:
+        """Current META sections, including a section that is still being collected."""
+        sections = dict(self.sections)
+        if self.current_section and self.section_lines:
+            sections[self.current_section] = '\n'.join(self.section_lines)
+        return sections
+
+
+def extract_meta_sections(lines: List[str]) -> Dict[str, str]:
+    """Extract META sections (data_needed, data_collation, reasoning_outline) from PDDL output."""
+    collector = MetaSectionCollector()
+    for line in lines:
+        collector.feed_line(line)
+    return collector.snapshot()
+
+
+def render_plan_step(
+    plan_step: PlanStep,
+    meta_sections: Dict[str, str],
+    action_definitions: Dict[str, PddlAction],
+    traces: List[str],
+    trace_check: Optional[Dict[str, Any]] = None,
+    compact: bool = False
+) -> Step:
+    """
+    Build the reviewable Step for one ; PLAN action with its definition, trace and (for step 1) META context.
+    trace_check, from the plan simulation, annotates the trace with any mismatches.
+    With compact=True the definition and META are left out and the step names its
+    action instead (see compact_plan_response).
+    """
+    step_num = plan_step.step_number
+    has_definition = bool(plan_step.name) and plan_step.name in action_definitions
+    
+    # Build step content starting with META context if this is the first step
+    step_content = ""
+    
+    # Add META sections as context for the first step only
+    if step_num == 1 and not compact:
+        if meta_sections.get('data_needed'):
+            step_content += f"**📋 Data Needed:**\n{meta_sections['data_needed']}\n\n"
+        if meta_sections.get('data_collation'):
+            step_content += f"**📊 Data Collation:**\n{meta_sections['data_collation']}\n\n"
+        if meta_sections.get('reasoning_outline'):
+            step_content += f"**🧠 Reasoning Outline:**\n{meta_sections['reasoning_outline']}\n\n"
+        if step_content:
+            step_content += "---\n\n"
+    
+    # Add action call
+    step_content += f"**Action Call:**\n```lisp\n{plan_step.call}\n```"
     
-    # Save last section
-    if current_section and section_lines:
-        meta_sections[current_section] = '\n'.join(section_lines)
+    # Add full action definition from DOMAIN if available
+    if has_definition and not compact:
+        step_content += f"\n\n**Action Definition:**\n```lisp\n{action_definitions[plan_step.name].definition}\n```"
     
-    return meta_sections
+    # Add state trace if available
+    if traces:
+        step_content += "\n\n**State Trace:**\n"
+        for trace in traces:
+            step_content += f"- {trace}\n"
+    
+    # Add the comparison of the trace against the simulated state
+    if trace_check:
+        step_content += "\n" + render_trace_check(trace_check)
+    
+    return Step(
+        step_id=f"step-{step_num}",
+        step_number=step_num,
+        step_content=step_content.strip(),
+        section=f"Plan Step {step_num}",
+        action=action_definitions[plan_step.name].name if has_definition and compact else None
+    )
 
 
-def extract_plan_section_steps(plan_text: str) -> List[Step]:
+TRACE_MISMATCH_LABELS = [
+    ("claimed_true_but_false", "Claimed to hold before the step, but false"),
+    ("unsatisfied", "Preconditions claimed satisfied, but false"),
+    ("missing_added", "Added by the action, not in the trace"),
+    ("unexpected_added", "Claimed added, not added by the action"),
+    ("missing_deleted", "Deleted by the action, not in the trace"),
+    ("unexpected_deleted", "Claimed deleted, not deleted by the action"),
+]
+
+
+def render_trace_check(trace_check: Dict[str, Any]) -> str:
+    """Markdown summary of a step's STATE TRACE check."""
+    if trace_check["consistent"]:
+        return "**Trace Check:** ✅ matches the simulated state"
+    if trace_check.get("error"):
+        return f"**Trace Check:** ⚠️ {trace_check['error']}"
+    content = "**Trace Check:** ⚠️ differs from the simulated state\n"
+    if trace_check.get("claimed_preconditions_satisfied") is False:
+        content += "- Preconditions claimed unsatisfied, but they hold\n"
+    for key, label in TRACE_MISMATCH_LABELS:
+        if trace_check.get(key) and (key != "unsatisfied" or trace_check.get("claimed_preconditions_satisfied")):
+            content += f"- {label}: {', '.join(trace_check[key])}\n"
+    return content
+
+
+class IncrementalStepParser:
+    """
+    Push-based parser for the ; PLAN output format.
+    
+    feed() takes raw text chunks as they stream from the model and returns the steps
+    that are new or whose content changed: a Step is emitted as soon as its ; PLAN line
+    is complete and emitted again (same step_id) when its action definition or
+    ; STATE TRACE lines arrive, and once more on close() with the trace checked
+    against the simulated plan. Every line is tokenized exactly once by a
+    PddlDocumentBuilder, so the total cost is linear in the output size no matter
+    how many chunks it arrives in.
+    
+    With filter_pddl=True, lines are first passed through the same filter as
+    extract_pddl_portion so prose around the PDDL is ignored.
+    """
+
+    def __init__(self, filter_pddl: bool = True):
+        self.line_filter = PddlLineFilter() if filter_pddl else None
+        self.meta = MetaSectionCollector()
+        self.builder = PddlDocumentBuilder()
+        self.rendered = {}  # step_num -> last emitted Step
+        self.trace_checks = {}  # step_num -> trace check, filled in on close()
+        self.pddl_lines = []
+        self.pending = ''
+        self.closed = False
+
+    @property
+    def document(self) -> PddlDocument:
+        """The document parsed so far (complete once close() has been called)."""
+        return self.builder.document
+
+    @property
+    def steps(self) -> List[Step]:
+        """All steps parsed so far, ordered by step number."""
+        return [self.rendered[num] for num in sorted(self.document.plan)]
+
+    def feed(self, chunk: str) -> List[Step]:
+        """Consume a text chunk and return the steps that were added or updated by it."""
+        self.pending += chunk
+        if '\n' not in chunk:
+            return []
+        *lines, self.pending = self.pending.split('\n')
+        dirty = set()
+        for line in lines:
+            self._process_line(line, dirty)
+        return self._render(dirty)
+
+    def close(self) -> List[Step]:
+        """Flush the trailing partial line and return any final step updates."""
+        if self.closed:
+            return []
+        self.closed = True
+        dirty = set()
+        self._process_line(self.pending, dirty)
+        self.pending = ''
+        self._apply_events(self.builder.finish(), dirty)
+        self.trace_checks = trace_checks_by_step(validate_plan(self.document))
+        dirty.update(self.trace_checks)
+        return self._render(dirty)
+
+    def pddl_output(self, raw_output: str) -> str:
+        """The text extract_pddl_portion would return for the fed output."""
+        if self.line_filter is None:
+            return raw_output
+        if self.pddl_lines:
+            return '\n'.join(self.pddl_lines).strip()
+        return raw_output
+
+    def _process_line(self, line: str, dirty: set):
+        if self.line_filter is not None:
+            if not self.line_filter.accept(line):
+                return
+            self.pddl_lines.append(line)
+        
+        if self.meta.feed_line(line):
+            dirty.add(1)
+        self._apply_events(self.builder.feed_line(line), dirty)
+
+    def _apply_events(self, events: List[Tuple[str, Any]], dirty: set):
+        plan = self.document.plan
+        for kind, key in events:
+            if kind in ('plan', 'trace'):
+                dirty.add(key)
+            elif kind == 'action':
+                # Re-render steps that use an action whose definition just arrived
+                dirty.update(num for num, plan_step in plan.items() if plan_step.name == key)
+
+    def _render(self, dirty: set) -> List[Step]:
+        doc = self.document
+        updated = []
+        for step_num in sorted(dirty):
+            if step_num not in doc.plan:
+                continue
+            step = render_plan_step(
+                doc.plan[step_num],
+                self.meta.snapshot() if step_num == 1 else {},
+                doc.domain_actions,
+                doc.state_traces.get(step_num, []),
+                self.trace_checks.get(step_num)
+            )
+            previous = self.rendered.get(step_num)
+            if previous is None or previous.step_content != step.step_content:
+                self.rendered[step_num] = step
+                updated.append(step)
+        return updated
+
+
+def extract_plan_section_steps(plan_text: str, compact: bool = False) -> List[Step]:
     """
     Extract plan steps from the new system prompt format with ; PLAN section.
     Format: (; N) (action-name param1 param2...) or ; (N) (action-name...)
-    Also extracts META sections (data_needed, data_collation, reasoning_outline) as reviewable steps.
-    Includes full action definitions from DOMAIN section.
+    Also extracts META sections (data_needed, data_collation, reasoning_outline) as context for step 1.
+    Includes full action definitions from DOMAIN section (referenced by name with
+    compact=True), and annotates each step's STATE TRACE with its check against the simulated plan.
     """
-    steps = []
-    lines = plan_text.split('\n')
+    doc = parse_pddl(plan_text)
+    if not doc.plan:
+        return []
     
     # Extract META sections for context (but don't add as separate steps)
-    meta_sections = extract_meta_sections(lines)
-    
-    # First pass: Extract action definitions from DOMAIN section
-    action_definitions = {}  # action_name -> full definition
-    in_domain = False
-    current_action_name = None
-    current_action_lines = []
-    paren_depth = 0
-    
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        
-        # Detect DOMAIN section
-        if stripped.startswith('(define') and 'domain' in stripped.lower():
-            in_domain = True
-            continue
-        
-        # Exit DOMAIN when we hit PROBLEM section
-        if stripped.startswith('(define') and 'problem' in stripped.lower():
-            # Save last action if any
-            if current_action_name and current_action_lines:
-                action_definitions[current_action_name] = '\n'.join(current_action_lines)
-            in_domain = False
-            current_action_name = None
-            current_action_lines = []
-            continue
-        
-        if in_domain and '(:action' in line:
-            # Save previous action if any
-            if current_action_name and current_action_lines:
-                action_definitions[current_action_name] = '\n'.join(current_action_lines)
-            
-            # Start new action
-            action_match = re.search(r'\(:action\s+([\w\-]+)', line)
-            if action_match:
-                current_action_name = action_match.group(1)
-                current_action_lines = [line]
-                paren_depth = line.count('(') - line.count(')')
-        elif in_domain and current_action_name:
-            # Continue collecting action lines
-            current_action_lines.append(line)
-            paren_depth += line.count('(') - line.count(')')
-            
-            # Action complete when parentheses balance
-            if paren_depth == 0:
-                action_definitions[current_action_name] = '\n'.join(current_action_lines)
-                current_action_name = None
-                current_action_lines = []
-    
-    # Second pass: Extract plan actions and state traces
-    in_plan_section = False
-    in_state_trace = False
-    plan_actions = {}  # step_num -> action call
-    state_traces = {}  # step_num -> trace info
+    meta_sections = extract_meta_sections(doc.lines)
     
-    for line in lines:
-        stripped = line.strip()
-        
-        # Detect PLAN section
-        if stripped.upper() in ['; PLAN', ';PLAN', '; plan', ';plan']:
-            in_plan_section = True
-            in_state_trace = False
-            logger.debug(f"Found PLAN section")
-            continue
-        
-        # Detect STATE TRACE section
-        if stripped.upper() in ['; STATE TRACE', ';STATE TRACE', '; state trace', ';state trace']:
-            in_plan_section = False
-            in_state_trace = True
-            continue
-        
-        # Exit sections on new major section
-        if stripped.upper().startswith('; SOUNDNESS') or stripped.upper().startswith(';SOUNDNESS'):
-            in_plan_section = False
-            in_state_trace = False
-            continue
-        
-        # Extract plan actions
-        if in_plan_section:
-            # Match patterns like: 
-            # (; 1) (identify-company company1)
-            # ; (1) (load-package pkg1 truck1 locA)
-            # ; (gather-company-data msft)
-            # (confirm-filing-status msft bond-issuance-filing) <- NO semicolon
-            # (;10) (collect-data company2 business source1)
-            
-            # Skip empty lines
-            if not stripped:
-                continue
-            
-            # Pattern 1: (; N) (action ...)
-            match1 = re.match(r'\(\s*;\s*(\d+)\s*\)\s*(\(.+\))', stripped)
-            # Pattern 2: ; (N) (action ...)
-            match2 = re.match(r';\s*\(\s*(\d+)\s*\)\s*(.+)', stripped)
-            # Pattern 3: ; (action ...) - with semicolon, no number
-            match3 = re.match(r';\s*(\(.+\))\s*$', stripped)
-            # Pattern 4: (action ...) - NO semicolon, no number (NEW)
-            match4 = re.match(r'^(\([^\s]+.+\))\s*$', stripped)
-            
-            if match1:
-                step_num = int(match1.group(1))
-                action = match1.group(2).strip()
-                plan_actions[step_num] = action
-                logger.debug(f"Extracted action (pattern 1): step {step_num}, action: {action[:50]}")
-            elif match2:
-                step_num = int(match2.group(1))
-                action = match2.group(2).strip()
-                plan_actions[step_num] = action
-                logger.debug(f"Extracted action (pattern 2): step {step_num}, action: {action[:50]}")
-            elif match3:
-                action = match3.group(1).strip()
-                step_num = len(plan_actions) + 1
-                plan_actions[step_num] = action
-                logger.debug(f"Extracted action (pattern 3): step {step_num}, action: {action[:50]}")
-            elif match4:
-                # Action without semicolon - NEW FORMAT
-                action = match4.group(1).strip()
-                step_num = len(plan_actions) + 1
-                plan_actions[step_num] = action
-                logger.debug(f"Extracted action (pattern 4): step {step_num}, action: {action[:50]}")
-        
-        # Extract state traces
-        if in_state_trace:
-            # Match patterns like: ; step 1 preconditions_satisfied: yes -> {...}
-            # or ; step 1 added: {identified company1} deleted: {}
-            step_match = re.match(r';\s*step\s*(\d+)\s+(.+)', stripped)
-            if step_match:
-                step_num = int(step_match.group(1))
-                trace_info = step_match.group(2).strip()
-                
-                if step_num not in state_traces:
-                    state_traces[step_num] = []
-                state_traces[step_num].append(trace_info)
+    # Check STATE TRACE claims against the simulated plan
+    trace_checks = trace_checks_by_step(validate_plan(doc))
     
-    # Combine actions with their definitions and traces
-    for step_num in sorted(plan_actions.keys()):
-        action_call = plan_actions[step_num]
-        
-        # Extract action name from the call
-        action_name_match = re.match(r'\(([^\s\)]+)', action_call)
-        action_name = action_name_match.group(1) if action_name_match else None
-        
-        # Build step content starting with META context if this is the first step
-        step_content = ""
-        
-        # Add META sections as context for the first step only
-        if step_num == 1:
-            if meta_sections.get('data_needed'):
-                step_content += f"**📋 Data Needed:**\n{meta_sections['data_needed']}\n\n"
-            if meta_sections.get('data_collation'):
-                step_content += f"**📊 Data Collation:**\n{meta_sections['data_collation']}\n\n"
-            if meta_sections.get('reasoning_outline'):
-                step_content += f"**🧠 Reasoning Outline:**\n{meta_sections['reasoning_outline']}\n\n"
-            if step_content:
-                step_content += "---\n\n"
-        
-        # Add action call
-        step_content += f"**Action Call:**\n```lisp\n{action_call}\n```"
-        
-        # Add full action definition from DOMAIN if available
-        if action_name and action_name in action_definitions:
-            step_content += f"\n\n**Action Definition:**\n```lisp\n{action_definitions[action_name]}\n```"
-        
-        # Add state trace if available
-        if step_num in state_traces:
-            step_content += "\n\n**State Trace:**\n"
-            for trace in state_traces[step_num]:
-                step_content += f"- {trace}\n"
-        
-        steps.append(Step(
-            step_id=f"step-{step_num}",
-            step_number=step_num,
-            step_content=step_content.strip(),
-            section=f"Plan Step {step_num}"
-        ))
+    steps = [
+        render_plan_step(
+            plan_step,
+            meta_sections if plan_step.step_number == 1 else {},
+            doc.domain_actions,
+            doc.state_traces.get(plan_step.step_number, []),
+            trace_checks.get(plan_step.step_number),
+            compact
+        )
+        for plan_step in doc.plan_steps
+    ]
     
-    if steps:
-        logger.info(f"✅ Extracted {len(steps)} action steps with {len(action_definitions)} action definitions")
+    inconsistent = sum(1 for check in trace_checks.values() if not check["consistent"])
+    logger.info(f"✅ Extracted {len(steps)} action steps with {len(doc.domain_actions)} action definitions ({inconsistent} trace mismatches)")
     return steps
 
 
@@ -670,110 +928,139 @@ def extract_json_plan_steps(plan_text: str) -> List[Step]:
     return steps
 
 
+NUMBERED_ITEM_RE = re.compile(r'\d+\.\s*')
+NUMBERED_BOLD_ITEM_RE = re.compile(r'\d+\.\s*\*\*')
+NUMBERED_ITEM_START_RE = re.compile(r'^\d+\.')
+
+
+class ActionNameMatcher:
+    """
+    Trie over normalized action names for matching numbered explanation items.
+    Each name is indexed as-is and in readable form ("collect-sec-filings" and
+    "collect sec filings"), lowercased. A line is matched in one pass over its
+    numbered-item markers instead of running per-action regexes.
+    """
+
+    def __init__(self, action_names: List[str]):
+        self.root = {}
+        for action_name in action_names:
+            readable_name = action_name.replace('-', ' ').title()
+            for variant in (action_name.lower(), readable_name.lower()):
+                node = self.root
+                for char in variant:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, set()).add(action_name)
+
+    def _names_at(self, text: str, pos: int, limit: int) -> set:
+        """Names that occur in text starting at pos and ending at or before limit."""
+        names = set()
+        node = self.root
+        while True:
+            if None in node:
+                names.update(node[None])
+            if pos >= limit or text[pos] not in node:
+                return names
+            node = node[text[pos]]
+            pos += 1
+
+    def numbered_item_matches(self, line: str) -> set:
+        """
+        Action names a numbered item line refers to, i.e. those matching any of
+        "N. name", "N. readable name", "N. **...name...**", "N. **...readable name...**"
+        (case-insensitive, anywhere in the line).
+        """
+        if '.' not in line:
+            return set()
+        text = line.lower()
+        markers = list(NUMBERED_ITEM_RE.finditer(text))
+        if not markers:
+            return set()
+        
+        # "N. name": the name directly follows a numbered-item marker
+        names = set()
+        for marker in markers:
+            names |= self._names_at(text, marker.end(), len(text))
+        
+        # "N. **...name...**": the name sits between a bold marker and a later "**"
+        bold = NUMBERED_BOLD_ITEM_RE.search(text)
+        if bold:
+            closing = text.rfind('**')
+            for pos in range(bold.end(), closing):
+                if text[pos] in self.root:
+                    names |= self._names_at(text, pos, closing)
+        return names
+
+
 def extract_pddl_actions(plan_text: str) -> List[Step]:
     """Extract PDDL action blocks from ```pddl or ```lisp code blocks with explanations."""
     steps = []
     step_counter = 1
-    lines = plan_text.split('\n')
+    doc = parse_pddl(plan_text)
+    lines = doc.lines
     
-    in_code_block = False
-    code_block_end = -1
+    code_block_end = doc.pddl_fence_end
     action_names = []
     action_contents = {}
     
-    # First pass: Extract all PDDL actions from code blocks
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        
-        # Track code blocks (pddl or lisp)
-        if stripped.startswith('```'):
-            if 'pddl' in stripped.lower() or 'lisp' in stripped.lower():
-                in_code_block = True
-            elif in_code_block:
-                in_code_block = False
-                code_block_end = i
+    # First pass: Collect all PDDL actions found inside code blocks
+    for action in doc.actions:
+        if not action.node.fenced or not action.name:
             continue
+        action_name = action.name
+        action_names.append(action_name)
+        start_line, end_line = action.node.start[0], action.node.end[0]
         
-        if not in_code_block:
-            continue
+        # Look backwards for any comment that might describe this action
+        action_lines = [lines[j] for j in range(max(0, start_line - 3), start_line) if lines[j].strip().startswith(';')]
         
-        # Look for (:action definitions directly
-        if '(:action' in line:
-            # Extract action name (handle both regular and non-breaking hyphens)
-            action_name_match = re.search(r'\(:action\s+([\w\-\u2011]+)', line)
-            if action_name_match:
-                action_name = action_name_match.group(1)
-                action_names.append(action_name)
-                
-            # Found an action! Collect it
-            action_lines = []
-            
-            # Look backwards for any comment that might describe this action
-            for j in range(max(0, i-3), i):
-                if lines[j].strip().startswith(';'):
-                    action_lines.append(lines[j])
-            
-            # Add the action line itself
-            action_lines.append(line)
-            paren_depth = line.count('(') - line.count(')')
-            
-            # Continue collecting lines until parentheses balance
-            j = i + 1
-            while j < len(lines) and paren_depth > 0:
-                action_lines.append(lines[j])
-                paren_depth += lines[j].count('(') - lines[j].count(')')
-                j += 1
-            
-            # Look for explanation comment after the action
-            while j < len(lines) and lines[j].strip().startswith(';'):
-                action_lines.append(lines[j])
-                j += 1
-            
-            # Save this action
-            action_text = '\n'.join(action_lines).strip()
-            if action_text:
-                action_contents[action_name] = action_text
+        # The action itself, up to the line where its parentheses balance
+        action_lines.extend(lines[start_line:end_line + 1])
+        
+        # Look for explanation comment after the action
+        j = end_line + 1
+        while j < len(lines) and lines[j].strip().startswith(';'):
+            action_lines.append(lines[j])
+            j += 1
+        
+        # Save this action
+        action_text = '\n'.join(action_lines).strip()
+        if action_text:
+            action_contents[action_name] = action_text
     
     # Second pass: Look for explanations after the code block
     explanations = {}
-    if code_block_end > 0:
+    if code_block_end > 0 and action_names:
+        # Match patterns like "1. **Collect SEC filings**" or "1. Collect SEC filings";
+        # every action name is indexed once instead of compiling regexes per line and action
+        matcher = ActionNameMatcher(action_names)
+        
         # Look for the "Explanation of the plan" section
         for i in range(code_block_end, len(lines)):
             line = lines[i]
-            # Check for numbered list items that match our action names
-            for action_name in action_names:
-                # Match patterns like "1. **Collect SEC filings**" or "1. Collect SEC filings"
-                # Convert hyphenated action names to match various formats
-                readable_name = action_name.replace('-', ' ').title()
-                
-                patterns = [
-                    rf'\d+\.\s*\*\*.*{re.escape(readable_name)}.*\*\*',
-                    rf'\d+\.\s*{re.escape(readable_name)}',
-                    rf'\d+\.\s*\*\*.*{re.escape(action_name)}.*\*\*',
-                    rf'\d+\.\s*{re.escape(action_name)}'
-                ]
-                
-                for pattern in patterns:
-                    if re.search(pattern, line, re.IGNORECASE):
-                        # Found explanation for this action
-                        explanation_lines = [line]
-                        # Collect the explanation text (usually follows with a dash or colon)
-                        j = i + 1
-                        while j < len(lines):
-                            next_line = lines[j].strip()
-                            # Stop if we hit the next numbered item
-                            if re.match(r'^\d+\.', next_line):
-                                break
-                            # Include lines that are part of the explanation
-                            if next_line.startswith(('–', '-', '*', '•')) or next_line == '' or (j == i + 1):
-                                if next_line:
-                                    explanation_lines.append(lines[j])
-                                j += 1
-                            else:
-                                break
-                        
-                        explanations[action_name] = '\n'.join(explanation_lines)
-                        break
+            matched_names = matcher.numbered_item_matches(line)
+            if not matched_names:
+                continue
+            
+            # Found explanation for these actions
+            explanation_lines = [line]
+            # Collect the explanation text (usually follows with a dash or colon)
+            j = i + 1
+            while j < len(lines):
+                next_line = lines[j].strip()
+                # Stop if we hit the next numbered item
+                if NUMBERED_ITEM_START_RE.match(next_line):
+                    break
+                # Include lines that are part of the explanation
+                if next_line.startswith(('–', '-', '*', '•')) or next_line == '' or (j == i + 1):
+                    if next_line:
+                        explanation_lines.append(lines[j])
+                    j += 1
+                else:
+                    break
+            
+            explanation = '\n'.join(explanation_lines)
+            for action_name in matched_names:
+                explanations[action_name] = explanation
     
     # Combine PDDL code with explanations
     for action_name in action_names:
@@ -798,7 +1085,7 @@ def extract_pddl_actions(plan_text: str) -> List[Step]:
 def extract_numbered_sections(plan_text: str) -> List[Step]:
     """Extract complete numbered sections like ## 1. Title."""
     steps = []
-    section_pattern = re.compile(r'^##\s*(\d+)[\.\s️⃣]+(.+)$')
+    section_pattern = NUMBERED_SECTION_RE
     lines = plan_text.split('\n')
     
     current_num = None
@@ -840,12 +1127,12 @@ def extract_numbered_sections(plan_text: str) -> List[Step]:
 def extract_table_steps(plan_text: str) -> List[Step]:
     """Extract steps from markdown tables."""
     steps = []
-    table_row = re.compile(r'^\|\s*\*?\*?(\d+)[\.\s\*]*([^|]+?)\*?\*?\s*\|([^|]+)\|([^|]+)\|$')
+    table_row = TABLE_ROW_RE
     lines = plan_text.split('\n')
     in_table = False
     
     for line in lines:
-        if re.match(r'^\|[\s\-:]+\|', line.strip()):
+        if TABLE_SEPARATOR_RE.match(line.strip()):
             in_table = True
             continue
         
@@ -871,7 +1158,7 @@ def extract_table_steps(plan_text: str) -> List[Step]:
 def extract_numbered_list(plan_text: str) -> List[Step]:
     """Extract simple numbered list items."""
     steps = []
-    numbered = re.compile(r'^(\d+)[\.\:\)]\s+(.+)$')
+    numbered = NUMBERED_LIST_RE
     lines = plan_text.split('\n')
     
     for line in lines:
@@ -889,6 +1176,17 @@ def extract_numbered_list(plan_text: str) -> List[Step]:
     return steps
 
 
+# Step extractors in priority order, keyed by the strategy name reported in metadata
+STEP_EXTRACTORS = {
+    'json': extract_json_plan_steps,
+    'plan_section': extract_plan_section_steps,
+    'pddl_actions': extract_pddl_actions,
+    'numbered_sections': extract_numbered_sections,
+    'table': extract_table_steps,
+    'numbered_list': extract_numbered_list,
+}
+
+
 def format_as_planning_problem(prompt: str) -> str:
     """
     Format user prompt as a planning problem if not already formatted.
@@ -903,31 +1201,27 @@ def format_as_planning_problem(prompt: str) -> str:
     return f"Planning problem: {prompt}"
 
 
-def extract_pddl_portion(text: str) -> str:
-    """
-    Extract PDDL code and comments from model output.
-    Looks for PDDL structures (define, :action, etc.) and comment blocks.
-    Returns only the PDDL-formatted content, removing any prose wrapper.
-    """
-    lines = text.split('\n')
-    pddl_lines = []
-    in_pddl_block = False
-    in_code_block = False
-    
-    for line in lines:
+class PddlLineFilter:
+    """Line-at-a-time filter behind extract_pddl_portion: keeps PDDL code and comments, drops prose."""
+
+    def __init__(self):
+        self.in_pddl_block = False
+        self.in_code_block = False
+
+    def accept(self, line: str) -> bool:
+        """Return True if the line belongs to the PDDL portion of the output."""
         stripped = line.strip()
         
         # Track code blocks
         if stripped.startswith('```'):
-            in_code_block = not in_code_block
+            self.in_code_block = not self.in_code_block
             if 'pddl' in stripped.lower() or 'lisp' in stripped.lower():
-                in_pddl_block = True
-            continue
+                self.in_pddl_block = True
+            return False
         
         # If we're in a PDDL code block, include the line
-        if in_code_block and in_pddl_block:
-            pddl_lines.append(line)
-            continue
+        if self.in_code_block and self.in_pddl_block:
+            return True
         
         # Check for PDDL structures outside code blocks
         is_pddl = (
@@ -938,19 +1232,30 @@ def extract_pddl_portion(text: str) -> str:
             (stripped.startswith('(') and not stripped.startswith('(#')) or  # S-expression
             stripped == '' or  # Empty line (preserve formatting)
             stripped.startswith(')') or  # Closing paren
-            (in_pddl_block and stripped)  # Continue PDDL block
+            (self.in_pddl_block and stripped)  # Continue PDDL block
         )
         
         # Start PDDL block if we find PDDL content
-        if is_pddl and not in_pddl_block:
-            in_pddl_block = True
+        if is_pddl and not self.in_pddl_block:
+            self.in_pddl_block = True
         
         # Include line if in PDDL block
-        if in_pddl_block and is_pddl:
-            pddl_lines.append(line)
+        if self.in_pddl_block and is_pddl:
+            return True
         # Stop PDDL block if we hit clear non-PDDL content (like markdown headers)
-        elif in_pddl_block and (stripped.startswith('#') or stripped.startswith('**')):
-            in_pddl_block = False
+        elif self.in_pddl_block and (stripped.startswith('#') or stripped.startswith('**')):
+            self.in_pddl_block = False
+        return False
+
+
+def extract_pddl_portion(text: str) -> str:
+    """
+    Extract PDDL code and comments from model output.
+    Looks for PDDL structures (define, :action, etc.) and comment blocks.
+    Returns only the PDDL-formatted content, removing any prose wrapper.
+    """
+    line_filter = PddlLineFilter()
+    pddl_lines = [line for line in text.split('\n') if line_filter.accept(line)]
     
     # If we found PDDL content, return it; otherwise return original
     if pddl_lines:
@@ -958,8 +1263,75 @@ def extract_pddl_portion(text: str) -> str:
     return text
 
 
+def build_generation_config(temperature: float, max_tokens: int) -> GenerateContentConfig:
+    """Build the Vertex AI generation config shared by all model call paths."""
+    return GenerateContentConfig(
+        temperature=temperature,
+        max_output_tokens=max_tokens,
+        thinking_config=ThinkingConfig(
+            thinking_budget=0  # disables thinking
+        )
+    )
+
+
+def extract_response_text(resp: Any) -> str:
+    """
+    Extract the generated text from a Vertex AI response (or stream chunk).
+    Chunks without text (usage-only chunks, finish-only candidates whose content is
+    None) yield ''.
+    """
+    text = getattr(resp, 'text', None)
+    if isinstance(text, str) and text:
+        return text
+    candidates = getattr(resp, 'candidates', None)
+    if not candidates:
+        return ''
+    candidate = candidates[0]
+    content = getattr(candidate, 'content', None)
+    parts = getattr(content, 'parts', None) if content is not None else None
+    if parts:
+        return ''.join(part.text for part in parts if isinstance(getattr(part, 'text', None), str))
+    text = getattr(candidate, 'text', None)
+    return text if isinstance(text, str) else ''
+
+
+def extract_usage_info(resp: Any) -> Dict[str, Any]:
+    """Extract token usage information from a Vertex AI response if available."""
+    usage_info = {}
+    if getattr(resp, 'usage_metadata', None) is not None:
+        usage_metadata = resp.usage_metadata
+        usage_info = {
+            'prompt_tokens': getattr(usage_metadata, 'prompt_token_count', None),
+            'completion_tokens': getattr(usage_metadata, 'candidates_token_count', None),
+            'total_tokens': getattr(usage_metadata, 'total_token_count', None)
+        }
+    return usage_info
+
+
+def format_model_response(response_text: str, usage_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Log response stats and wrap the output in the chat-completions shape used by the endpoints."""
+    logger.info(f"✅ Model response received")
+    logger.info(f"   Response length: {len(response_text)} chars")
+    if usage_info:
+        logger.info(f"   Prompt tokens: {usage_info.get('prompt_tokens', 'N/A')}")
+        logger.info(f"   Completion tokens: {usage_info.get('completion_tokens', 'N/A')}")
+        logger.info(f"   Total tokens: {usage_info.get('total_tokens', 'N/A')}")
+    
+    return {
+        'choices': [{
+            'message': {
+                'content': response_text
+            }
+        }],
+        'usage': usage_info
+    }
+
+
 def call_pddl_model(prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
-    """Call the PDDL model API using Google Vertex AI."""
+    """
+    Call the PDDL model API using Google Vertex AI.
+    Blocking variant, kept for scripts; API endpoints use call_pddl_model_async.
+    """
     logger.info(f"📡 Calling PDDL model: {MODEL}")
     logger.info(f"   Temperature: {temperature}, Max tokens: {max_tokens}")
     logger.info(f"   Prompt length: {len(prompt)} chars")
@@ -977,62 +1349,50 @@ def call_pddl_model(prompt: str, temperature: float, max_tokens: int) -> Dict[st
         resp = client.models.generate_content(
             model=MODEL,
             contents=full_prompt,
-            config=GenerateContentConfig(
-                temperature=temperature,
-                max_output_tokens=max_tokens,
-                thinking_config=ThinkingConfig(
-                    thinking_budget=0  # disables thinking
-                )
-            )
+            config=build_generation_config(temperature, max_tokens)
         )
         
-        # Extract response text
-        if hasattr(resp, 'text') and resp.text:
-            response_text = resp.text
-        elif hasattr(resp, 'candidates') and resp.candidates:
-            candidate = resp.candidates[0]
-            if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
-                response_text = ''.join(part.text for part in candidate.content.parts if hasattr(part, 'text'))
-            elif hasattr(candidate, 'text'):
-                response_text = candidate.text
-            else:
-                response_text = str(resp.candidates[0])
-        else:
-            response_text = str(resp)
-        
-        # Extract usage information if available
-        usage_info = {}
-        if hasattr(resp, 'usage_metadata'):
-            usage_metadata = resp.usage_metadata
-            usage_info = {
-                'prompt_tokens': getattr(usage_metadata, 'prompt_token_count', None),
-                'completion_tokens': getattr(usage_metadata, 'candidates_token_count', None),
-                'total_tokens': getattr(usage_metadata, 'total_token_count', None)
-            }
-        
-        # Log response stats
-        logger.info(f"✅ Model response received")
-        logger.info(f"   Response length: {len(response_text)} chars")
-        if usage_info:
-            logger.info(f"   Prompt tokens: {usage_info.get('prompt_tokens', 'N/A')}")
-            logger.info(f"   Completion tokens: {usage_info.get('completion_tokens', 'N/A')}")
-            logger.info(f"   Total tokens: {usage_info.get('total_tokens', 'N/A')}")
-        
         # Return response in a format compatible with existing code
-        return {
-            'choices': [{
-                'message': {
-                    'content': response_text
-                }
-            }],
-            'usage': usage_info
-        }
+        return format_model_response(extract_response_text(resp), extract_usage_info(resp))
         
     except Exception as e:
         logger.error(f"❌ Error calling PDDL model: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error calling PDDL model: {str(e)}")
 
 
+async def call_pddl_model_async(prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+    """
+    Call the PDDL model API using the async Vertex AI client.
+    Does not block the event loop; at most MAX_CONCURRENT_GENERATIONS calls run at once
+    and further requests wait for a free slot.
+    """
+    logger.info(f"📡 Calling PDDL model (async): {MODEL}")
+    logger.info(f"   Temperature: {temperature}, Max tokens: {max_tokens}")
+    logger.info(f"   Prompt length: {len(prompt)} chars")
+    
+    # Get or initialize the client
+    client = get_genai_client()
+    
+    async with generation_semaphore:
+        try:
+            # Combine system prompt with user prompt
+            full_prompt = f"{SYSTEM_PROMPT}\n\nUser request: {prompt}"
+            
+            logger.info(f"🌐 Sending request to Google Vertex AI...")
+            
+            resp = await client.aio.models.generate_content(
+                model=MODEL,
+                contents=full_prompt,
+                config=build_generation_config(temperature, max_tokens)
+            )
+            
+            return format_model_response(extract_response_text(resp), extract_usage_info(resp))
+            
+        except Exception as e:
+            logger.error(f"❌ Error calling PDDL model: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error calling PDDL model: {str(e)}")
+
+
 def extract_pddl_components(plan_text: str) -> Dict[str, str]:
     """
     Extract PDDL domain, problem, and plan components from the output.
@@ -1045,28 +1405,30 @@ def extract_pddl_components(plan_text: str) -> Dict[str, str]:
         "full_text": plan_text
     }
     
-    # Extract domain definition
-    domain_match = re.search(r'\(define\s+\(domain[^)]*\).*?\n\)', plan_text, re.DOTALL)
-    if domain_match:
-        components["domain"] = domain_match.group(0)
+    doc = parse_pddl(plan_text)
     
-    # Extract problem definition  
-    problem_match = re.search(r'\(define\s+\(problem[^)]*\).*?\n\)', plan_text, re.DOTALL)
-    if problem_match:
-        components["problem"] = problem_match.group(0)
+    # Domain and problem definitions, taken from the parsed s-expressions
+    if doc.domain_node is not None and doc.domain_node.closed:
+        components["domain"] = doc.source(doc.domain_node)
+    if doc.problem_node is not None and doc.problem_node.closed:
+        components["problem"] = doc.source(doc.problem_node)
     
-    # Extract plan (action sequence)
-    plan_match = re.search(r'(?:PLAN:|Executable Plan|3️⃣)(.*?)(?:---|\Z)', plan_text, re.DOTALL)
-    if plan_match:
-        components["plan"] = plan_match.group(1).strip()
+    # Extract plan (action sequence) from the ; PLAN section, or from legacy markdown plan headings
+    if doc.plan:
+        components["plan"] = '\n'.join(plan_step.call for plan_step in doc.plan_steps)
+    else:
+        plan_match = re.search(r'(?:PLAN:|Executable Plan|3️⃣)(.*?)(?:---|\Z)', plan_text, re.DOTALL)
+        if plan_match:
+            components["plan"] = plan_match.group(1).strip()
     
     return components
 
 
 def validate_pddl_syntax(text: str) -> Dict[str, Any]:
     """
-    Basic PDDL syntax validation.
-    Checks for common PDDL structures based on MIT BlocksWorld format.
+    PDDL validation.
+    Checks for common PDDL structures based on MIT BlocksWorld format, then checks the
+    domain/problem for consistency and simulates the plan (see pddl_validator).
     """
     validation = {
         "is_valid_structure": False,
@@ -1074,24 +1436,21 @@ def validate_pddl_syntax(text: str) -> Dict[str, Any]:
         "has_problem": False,
         "has_actions": False,
         "has_predicates": False,
+        "is_valid_plan": False,
         "errors": []
     }
     
-    # Check for domain definition
-    if re.search(r'\(define\s+\(domain', text, re.IGNORECASE):
-        validation["has_domain"] = True
+    doc = parse_pddl(text)
     
-    # Check for problem definition
-    if re.search(r'\(define\s+\(problem', text, re.IGNORECASE):
-        validation["has_problem"] = True
+    # Check for domain and problem definitions
+    validation["has_domain"] = doc.domain_node is not None
+    validation["has_problem"] = doc.problem_node is not None
     
     # Check for actions
-    if re.search(r':action\s+\w+', text, re.IGNORECASE):
-        validation["has_actions"] = True
+    validation["has_actions"] = any(action.name for action in doc.actions)
     
     # Check for predicates
-    if re.search(r':predicates|:precondition|:effect', text, re.IGNORECASE):
-        validation["has_predicates"] = True
+    validation["has_predicates"] = bool(doc.keywords & {':predicates', ':precondition', ':effect'})
     
     # Overall structure validation
     validation["is_valid_structure"] = (
@@ -1100,26 +1459,47 @@ def validate_pddl_syntax(text: str) -> Dict[str, Any]:
         (validation["has_actions"] and validation["has_predicates"])
     )
     
-    # Check for balanced parentheses
-    open_count = text.count('(')
-    close_count = text.count(')')
-    if open_count != close_count:
-        validation["errors"].append(f"Unbalanced parentheses: {open_count} open, {close_count} close")
+    # Check for balanced parentheses (comments are not counted)
+    if doc.open_count != doc.close_count:
+        validation["errors"].append(f"Unbalanced parentheses: {doc.open_count} open, {doc.close_count} close")
+    
+    # Semantic checks and plan simulation
+    validation["plan_validation"] = validate_plan(doc)
+    validation["is_valid_plan"] = validation["plan_validation"]["plan_valid"]
     
     return validation
 
 
+def pddl_validity_score(validation: Dict[str, Any]) -> float:
+    """
+    Half structure (domain, problem, actions, predicates present), half plan validity
+    from the simulator, so only a plan that actually executes and reaches its goal scores 1.0.
+    """
+    structure = sum([
+        1 if validation["has_domain"] else 0,
+        1 if validation["has_problem"] else 0,
+        1 if validation["has_actions"] else 0,
+        1 if validation["has_predicates"] else 0
+    ]) / 4.0
+    plan_score = (validation.get("plan_validation") or {}).get("score", 0.0)
+    return round(0.5 * structure + 0.5 * plan_score, 3)
+
+
 def generate_rlhf_dataset(
     session_id: str,
     prompt: str,
     plan_text: str,
     feedback: List[FeedbackItem],
-    metadata: Dict[str, Any]
+    metadata: Dict[str, Any],
+    pddl_components: Optional[Dict[str, Any]] = None,
+    pddl_validation: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Generate RLHF training dataset from feedback.
     Follows MIT PDDL BlocksWorld format standards from:
     https://github.com/CassieHuang22/llm-as-pddl-formalizer
+    pddl_components/pddl_validation can be passed in when the analysis of
+    plan_text is already known (e.g. from the session store).
     """
     
     # Count ratings
@@ -1129,10 +1509,12 @@ def generate_rlhf_dataset(
     overall_score = positive_count / total_steps if total_steps > 0 else 0
     
     # Extract PDDL components
-    pddl_components = extract_pddl_components(plan_text)
+    if pddl_components is None:
+        pddl_components = extract_pddl_components(plan_text)
     
     # Validate PDDL syntax
-    pddl_validation = validate_pddl_syntax(plan_text)
+    if pddl_validation is None:
+        pddl_validation = validate_pddl_syntax(plan_text)
     
     dataset = {
         "session_id": session_id,
@@ -1171,12 +1553,7 @@ def generate_rlhf_dataset(
             "positive_ratings": positive_count,
             "negative_ratings": negative_count,
             "overall_score": round(overall_score, 3),
-            "pddl_validity_score": sum([
-                1 if pddl_validation["has_domain"] else 0,
-                1 if pddl_validation["has_problem"] else 0,
-                1 if pddl_validation["has_actions"] else 0,
-                1 if pddl_validation["has_predicates"] else 0
-            ]) / 4.0
+            "pddl_validity_score": pddl_validity_score(pddl_validation)
         },
         "training_metadata": {
             "pipeline_type": "llm-as-formalizer",
@@ -1201,6 +1578,407 @@ async def root():
     }
 
 
+@app.get("/api/stats")
+async def stats():
+    """
+    Running totals over all stored datasets: sessions, ratings, mean overall_score,
+    pddl_validity_score distribution, trainable fraction and token usage.
+    Maintained incrementally as datasets are written; never re-reads training data.
+    """
+    return dataset_stats.to_dict()
+
+
+@app.get("/api/storage-status")
+async def storage_status():
+    """Dataset backend, write-behind queue metrics (queue depth, batch sizes, flush latency) and blob dedup counters."""
+    return {
+        "backend": DATASET_BACKEND,
+        "writer": dataset_writer.stats(),
+        "blobs": dataset_store.stats() if hasattr(dataset_store, "blobs") else None
+    }
+
+
+def generation_cache_key(formatted_prompt: str, request: GeneratePlanRequest) -> Optional[str]:
+    """Cache key for a plan request, or None when caching is not enabled for it."""
+    use_cache = request.use_cache if request.use_cache is not None else request.temperature == 0
+    if not use_cache:
+        return None
+    return make_cache_key(formatted_prompt, MODEL, SYSTEM_PROMPT, request.temperature, request.max_tokens)
+
+
+async def run_store_io(store, func, *args):
+    """Run a cache or session store operation, off the event loop when it may touch the store's disk tier."""
+    if store.disk_dir:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+
+async def store_cached_response(cache_key: str, response: Dict[str, Any]):
+    """Store a model response in the generation cache; cache failures never fail the request."""
+    try:
+        await run_store_io(generation_cache, generation_cache.put, cache_key, response)
+    except Exception as e:
+        logger.warning(f"⚠ Could not store generation in cache: {str(e)}")
+
+
+async def cached_call_pddl_model(formatted_prompt: str, request: GeneratePlanRequest) -> Tuple[Dict[str, Any], str]:
+    """
+    Call the model through the generation cache.
+    Returns the response and the cache status: "hit", "miss" or "bypass".
+    """
+    cache_key = generation_cache_key(formatted_prompt, request)
+    if cache_key is None:
+        return await call_pddl_model_async(formatted_prompt, request.temperature, request.max_tokens), "bypass"
+    
+    cached = await run_store_io(generation_cache, generation_cache.get, cache_key)
+    if cached is not None:
+        logger.info(f"♻️ Generation cache hit: {cache_key[:12]}")
+        return cached, "hit"
+    
+    response = await call_pddl_model_async(formatted_prompt, request.temperature, request.max_tokens)
+    await store_cached_response(cache_key, response)
+    return response, "miss"
+
+
+def parse_generation(
+    raw_output: str,
+    usage: Dict[str, Any],
+    cache_status: str = "bypass",
+    parser: Optional[IncrementalStepParser] = None
+) -> Dict[str, Any]:
+    """
+    Parse raw model output into steps.
+    Returns the parts of a plan response that do not depend on the caller, so one
+    generation can be shared by every request coalesced onto it.
+    When an IncrementalStepParser already consumed the output (streaming path),
+    its steps are reused instead of re-parsing the full text.
+    """
+    logger.info(f"📄 Raw output length: {len(raw_output)} chars")
+    
+    # Extract PDDL portion for parsing (but we'll send raw_output to frontend)
+    pddl_output = parser.pddl_output(raw_output) if parser else extract_pddl_portion(raw_output)
+    logger.info(f"📋 PDDL portion length: {len(pddl_output)} chars")
+    
+    # Parse into steps using PDDL portion
+    if parser and parser.steps:
+        steps, parse_strategy = parser.steps, "plan_section"
+    else:
+        steps, parse_strategy = parse_steps_with_strategy(pddl_output)
+    logger.info(f"🔢 Parsed {len(steps)} steps from plan (strategy: {parse_strategy})")
+    
+    return {
+        "raw_output": raw_output,
+        "usage": usage,
+        "cache_status": cache_status,
+        "pddl_output": pddl_output,
+        "steps": steps,
+        "parse_strategy": parse_strategy
+    }
+
+
+def build_plan_response(
+    session_id: str,
+    request: GeneratePlanRequest,
+    generation: Dict[str, Any],
+    coalesced: bool = False,
+    candidates: Optional[List[Dict[str, Any]]] = None
+) -> GeneratePlanResponse:
+    """
+    Assemble the GeneratePlanResponse for one caller from a parsed generation.
+    For best-of-N requests, candidates holds the scored samples (see generate_best_of_n).
+    """
+    usage = generation["usage"]
+    
+    # Prepare metadata
+    metadata = {
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens,
+        "prompt_tokens": usage.get('prompt_tokens'),
+        "completion_tokens": usage.get('completion_tokens'),
+        "total_tokens": usage.get('total_tokens'),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "raw_output_length": len(generation["raw_output"]),
+        "pddl_output_length": len(generation["pddl_output"]),
+        "parse_strategy": generation["parse_strategy"],
+        "cache": generation["cache_status"],
+        "coalesced": coalesced
+    }
+    if candidates is not None:
+        metadata["samples"] = len(candidates)
+        metadata["selected_candidate"] = generation["candidate_index"]
+        metadata["candidate_scores"] = [candidate.get("score") for candidate in candidates]
+    
+    # Return raw_output (not pddl_output) to preserve original model output
+    return GeneratePlanResponse(
+        session_id=session_id,
+        prompt=request.prompt,
+        plan_text=generation["raw_output"],
+        steps=generation["steps"],
+        metadata=metadata,
+        candidates=candidates if request.return_candidates else None
+    )
+
+
+def compact_plan_response(plan_response: GeneratePlanResponse, pddl_output: str) -> GeneratePlanResponse:
+    """
+    Compact shape of a plan response (step_format="compact"): each action definition
+    used by the plan is sent once in definitions, the META sections once in meta, and
+    ; PLAN steps carry only their call, trace and trace check plus the action name.
+    Steps parsed by the other strategies have nothing to factor out and are kept as is.
+    """
+    compact = plan_response.model_copy(update={"definitions": {}, "meta": {}})
+    compact.metadata = {**plan_response.metadata, "step_format": "compact"}
+    if plan_response.metadata.get("parse_strategy") != "plan_section":
+        return compact
+    
+    doc = parse_pddl(pddl_output)
+    compact.steps = extract_plan_section_steps(pddl_output, compact=True)
+    compact.definitions = {
+        step.action: doc.domain_actions[step.action.lower()].definition
+        for step in compact.steps if step.action
+    }
+    compact.meta = {name: content for name, content in extract_meta_sections(doc.lines).items() if content}
+    return compact
+
+
+def respond_in_step_format(
+    plan_response: GeneratePlanResponse,
+    request: GeneratePlanRequest,
+    generation: Dict[str, Any]
+) -> GeneratePlanResponse:
+    """The response in the step format the request asked for (the stored session always keeps full steps)."""
+    if request.step_format == "compact":
+        return compact_plan_response(plan_response, generation["pddl_output"])
+    return plan_response
+
+
+async def generate_parsed_plan(formatted_prompt: str, request: GeneratePlanRequest) -> Dict[str, Any]:
+    """Call the model (through the generation cache) and parse its output."""
+    response, cache_status = await cached_call_pddl_model(formatted_prompt, request)
+    
+    # Extract plan text - KEEP ORIGINAL for frontend display
+    raw_output = response['choices'][0]['message']['content']
+    return parse_generation(raw_output, response.get('usage', {}), cache_status)
+
+
+def score_generation(generation: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Score a parsed generation for best-of-N ranking.
+    Complete domain and problem definitions and a plan weigh most, and a plan that
+    passes simulation weighs more still; unbalanced parentheses are penalized.
+    Ties are broken by the number of parsed steps.
+    """
+    validation = validate_pddl_syntax(generation["pddl_output"])
+    components = extract_pddl_components(generation["pddl_output"])
+    step_count = len(generation["steps"])
+    
+    score = 0
+    score += 3 if components["domain"] else 0
+    score += 3 if components["problem"] else 0
+    score += 2 if components["plan"] else 0
+    score += 1 if validation["has_actions"] else 0
+    score += 1 if validation["has_predicates"] else 0
+    score += 1 if step_count else 0
+    score += 3 if validation["is_valid_plan"] else 0
+    score -= 2 if validation["errors"] else 0
+    
+    return {
+        "score": score,
+        "step_count": step_count,
+        "validation": validation,
+        "has_domain": components["domain"] is not None,
+        "has_problem": components["problem"] is not None,
+        "has_plan": components["plan"] is not None
+    }
+
+
+async def generate_sample(formatted_prompt: str, request: GeneratePlanRequest) -> Dict[str, Any]:
+    """One uncached best-of-N sample: identical requests must not share a cached or coalesced result."""
+    response = await call_pddl_model_async(formatted_prompt, request.temperature, request.max_tokens)
+    raw_output = response['choices'][0]['message']['content']
+    return parse_generation(raw_output, response.get('usage', {}), "bypass")
+
+
+async def generate_best_of_n(formatted_prompt: str, request: GeneratePlanRequest) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Generate request.samples plans in parallel, score each one and pick the best.
+    Returns the winning generation (with its candidate_index) and one summary per
+    sample, in sample order. Failed samples are reported in the summaries; the
+    request only fails when every sample failed.
+    """
+    logger.info(f"🎲 Best-of-{request.samples} sampling")
+    results = await asyncio.gather(
+        *(generate_sample(formatted_prompt, request) for _ in range(request.samples)),
+        return_exceptions=True
+    )
+    
+    candidates = []
+    best_index = None
+    best_key = None
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.warning(f"⚠ Sample {index} failed: {str(result)}")
+            error = result.detail if isinstance(result, HTTPException) else str(result)
+            candidates.append({"index": index, "score": None, "error": error})
+            continue
+        
+        candidate = {"index": index, **score_generation(result)}
+        if request.return_candidates:
+            candidate["plan_text"] = result["raw_output"]
+            candidate["steps"] = [step.model_dump() for step in result["steps"]]
+        candidates.append(candidate)
+        
+        rank_key = (candidate["score"], candidate["step_count"])
+        if best_key is None or rank_key > best_key:
+            best_index, best_key = index, rank_key
+    
+    if best_index is None:
+        first_error = results[0]
+        if isinstance(first_error, HTTPException):
+            raise first_error
+        raise HTTPException(status_code=500, detail=f"Error calling PDDL model: {str(first_error)}")
+    
+    logger.info(f"🏆 Selected sample {best_index} (score {best_key[0]}, {best_key[1]} steps)")
+    generation = {**results[best_index], "candidate_index": best_index}
+    return generation, candidates
+
+
+def build_session_record(plan_response: GeneratePlanResponse) -> Dict[str, Any]:
+    """Session store record for a generated plan: raw output, parsed steps, metadata and PDDL analysis."""
+    pddl_components = extract_pddl_components(plan_response.plan_text)
+    del pddl_components["full_text"]  # same as plan_text
+    return {
+        "session_id": plan_response.session_id,
+        "prompt": plan_response.prompt,
+        "plan_text": plan_response.plan_text,
+        "steps": [step.model_dump() for step in plan_response.steps],
+        "metadata": plan_response.metadata,
+        "pddl_components": pddl_components,
+        "pddl_validation": validate_pddl_syntax(plan_response.plan_text)
+    }
+
+
+async def remember_session(plan_response: GeneratePlanResponse):
+    """Keep a generated plan in the session store; store failures never fail the request."""
+    try:
+        record = build_session_record(plan_response)
+        await run_store_io(session_store, session_store.put, plan_response.session_id, record)
+    except Exception as e:
+        logger.warning(f"⚠ Could not store session {plan_response.session_id[:8]}: {str(e)}")
+
+
+def resolve_feedback_items(feedback: List[FeedbackItem], session: Optional[Dict[str, Any]]) -> List[FeedbackItem]:
+    """
+    Fill in step_number/step_content of feedback items that only carry a step_id
+    from the stored session steps. Raises HTTPException(400) for steps that cannot be resolved.
+    """
+    steps_by_id = {step["step_id"]: step for step in session["steps"]} if session else {}
+    resolved = []
+    for item in feedback:
+        if item.step_number is not None and item.step_content is not None:
+            resolved.append(item)
+            continue
+        step = steps_by_id.get(item.step_id)
+        if step is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown step_id {item.step_id}: send step_number and step_content for steps not in the stored session"
+            )
+        resolved.append(item.model_copy(update={
+            "step_number": item.step_number if item.step_number is not None else step["step_number"],
+            "step_content": item.step_content if item.step_content is not None else step["step_content"]
+        }))
+    return resolved
+
+
+def generation_flight_key(formatted_prompt: str, request: GeneratePlanRequest) -> str:
+    """Key under which identical in-flight plan requests are coalesced."""
+    cache_mode = request.use_cache if request.use_cache is not None else request.temperature == 0
+    cache_key = make_cache_key(formatted_prompt, MODEL, SYSTEM_PROMPT, request.temperature, request.max_tokens)
+    return f"{cache_key}:{'cache' if cache_mode else 'nocache'}"
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+
+async def stream_pddl_model(
+    prompt: str,
+    temperature: float,
+    max_tokens: int,
+    usage_info: Dict[str, Any]
+) -> AsyncIterator[str]:
+    """
+    Stream the PDDL model output from Vertex AI, yielding text chunks as they arrive.
+    Token usage from the final chunk is written into usage_info.
+    Holds a generation slot for the whole stream, like call_pddl_model_async.
+    """
+    logger.info(f"📡 Streaming PDDL model: {MODEL}")
+    logger.info(f"   Temperature: {temperature}, Max tokens: {max_tokens}")
+    logger.info(f"   Prompt length: {len(prompt)} chars")
+    
+    client = get_genai_client()
+    full_prompt = f"{SYSTEM_PROMPT}\n\nUser request: {prompt}"
+    
+    async with generation_semaphore:
+        logger.info(f"🌐 Opening stream to Google Vertex AI...")
+        stream = await client.aio.models.generate_content_stream(
+            model=MODEL,
+            contents=full_prompt,
+            config=build_generation_config(temperature, max_tokens)
+        )
+        async for chunk in stream:
+            chunk_usage = extract_usage_info(chunk)
+            if chunk_usage:
+                usage_info.update(chunk_usage)
+            if getattr(chunk, 'candidates', None) or getattr(chunk, 'text', None):
+                text = extract_response_text(chunk)
+                if text:
+                    yield text
+
+
+async def iterate_chunks(chunks: List[str]) -> AsyncIterator[str]:
+    """Async iterator over already available text chunks."""
+    for chunk in chunks:
+        yield chunk
+
+
+async def run_plan_request(request: GeneratePlanRequest) -> GeneratePlanResponse:
+    """
+    Generate a PDDL plan for one request: call the AI model and parse the output into steps.
+    Shared by /api/generate-plan and /api/generate-plans.
+    """
+    # Generate session ID
+    session_id = str(uuid.uuid4())
+    logger.info(f"📝 New plan request - Session: {session_id[:8]}...")
+    logger.info(f"   User prompt: {request.prompt[:100]}...")
+    
+    # Prefix user prompt to frame it as a planning problem
+    formatted_prompt = format_as_planning_problem(request.prompt)
+    logger.info(f"   Formatted prompt: {formatted_prompt[:100]}...")
+    
+    if request.samples > 1:
+        generation, candidates = await generate_best_of_n(formatted_prompt, request)
+        plan_response = build_plan_response(session_id, request, generation, candidates=candidates)
+    else:
+        # Call PDDL model without blocking the event loop; identical requests already
+        # in flight share that call's result instead of starting another one
+        generation, coalesced = await generation_flights.run(
+            generation_flight_key(formatted_prompt, request),
+            lambda: generate_parsed_plan(formatted_prompt, request)
+        )
+        if coalesced:
+            logger.info(f"🔗 Coalesced with an identical in-flight request - Session: {session_id[:8]}")
+        
+        plan_response = build_plan_response(session_id, request, generation, coalesced)
+    
+    await remember_session(plan_response)
+    
+    logger.info(f"✅ Plan generation complete - Session: {session_id[:8]}")
+    return respond_in_step_format(plan_response, request, generation)
+
+
 @app.post("/api/generate-plan", response_model=GeneratePlanResponse)
 async def generate_plan(request: GeneratePlanRequest):
     """
@@ -1208,52 +1986,7 @@ async def generate_plan(request: GeneratePlanRequest):
     Calls the AI model and parses the output into steps.
     """
     try:
-        # Generate session ID
-        session_id = str(uuid.uuid4())
-        logger.info(f"📝 New plan request - Session: {session_id[:8]}...")
-        logger.info(f"   User prompt: {request.prompt[:100]}...")
-        
-        # Prefix user prompt to frame it as a planning problem
-        formatted_prompt = format_as_planning_problem(request.prompt)
-        logger.info(f"   Formatted prompt: {formatted_prompt[:100]}...")
-        
-        # Call PDDL model
-        response = call_pddl_model(formatted_prompt, request.temperature, request.max_tokens)
-        
-        # Extract plan text - KEEP ORIGINAL for frontend display
-        raw_output = response['choices'][0]['message']['content']
-        logger.info(f"📄 Raw output length: {len(raw_output)} chars")
-        
-        # Extract PDDL portion for parsing (but we'll send raw_output to frontend)
-        pddl_output = extract_pddl_portion(raw_output)
-        logger.info(f"📋 PDDL portion length: {len(pddl_output)} chars")
-        
-        # Parse into steps using PDDL portion
-        steps = parse_steps_from_plan(pddl_output)
-        logger.info(f"🔢 Parsed {len(steps)} steps from plan")
-        
-        # Prepare metadata
-        metadata = {
-            "temperature": request.temperature,
-            "max_tokens": request.max_tokens,
-            "prompt_tokens": response.get('usage', {}).get('prompt_tokens'),
-            "completion_tokens": response.get('usage', {}).get('completion_tokens'),
-            "total_tokens": response.get('usage', {}).get('total_tokens'),
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "raw_output_length": len(raw_output),
-            "pddl_output_length": len(pddl_output)
-        }
-        
-        logger.info(f"✅ Plan generation complete - Session: {session_id[:8]}")
-        
-        # Return raw_output (not pddl_output) to preserve original model output
-        return GeneratePlanResponse(
-            session_id=session_id,
-            prompt=request.prompt,
-            plan_text=raw_output,  # Changed from pddl_output to raw_output
-            steps=steps,
-            metadata=metadata
-        )
+        return model_response(await run_plan_request(request))
     
     except HTTPException:
         raise
@@ -1261,42 +1994,220 @@ async def generate_plan(request: GeneratePlanRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/api/generate-plans")
+async def generate_plans(request: GeneratePlansRequest):
+    """
+    Generate plans for a batch of prompts in parallel.
+    Runs up to `concurrency` items at once, each limited to `timeout_seconds`, and
+    streams one NDJSON line per item as soon as it finishes (completion order, not
+    request order). Lines carry the item's `index` and either `result` (the
+    GeneratePlanResponse payload) or `error`.
+    """
+    batch_id = str(uuid.uuid4())
+    logger.info(f"📦 New batch request - Batch: {batch_id[:8]}, items: {len(request.items)}, concurrency: {request.concurrency}")
+    batch_slots = asyncio.Semaphore(request.concurrency)
+    
+    async def run_item(index: int, item: GeneratePlanRequest) -> Dict[str, Any]:
+        async with batch_slots:
+            try:
+                plan_response = await asyncio.wait_for(run_plan_request(item), timeout=request.timeout_seconds)
+                return {"index": index, "status": "ok", "result": plan_response.model_dump()}
+            except asyncio.TimeoutError:
+                logger.warning(f"⏱ Batch {batch_id[:8]} item {index} timed out after {request.timeout_seconds}s")
+                return {"index": index, "status": "error", "error": f"Timed out after {request.timeout_seconds}s"}
+            except HTTPException as e:
+                return {"index": index, "status": "error", "error": e.detail}
+            except Exception as e:
+                logger.error(f"❌ Batch {batch_id[:8]} item {index} failed: {str(e)}")
+                return {"index": index, "status": "error", "error": f"Internal server error: {str(e)}"}
+    
+    async def result_stream():
+        tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(request.items)]
+        completed = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                completed += 1
+                yield dumps(result) + b"\n"
+            logger.info(f"✅ Batch complete - Batch: {batch_id[:8]}, items: {completed}")
+        finally:
+            # Client went away: stop the items that have not finished
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id}
+    )
+
+
+@app.post("/api/generate-plan/stream")
+async def generate_plan_stream(request: GeneratePlanRequest):
+    """
+    Streaming variant of /api/generate-plan using Server-Sent Events.
+    Emits a "session" event, one "chunk" event per model text chunk, a "step" event
+    whenever a ; PLAN step is parsed or updated (same step_id replaces the earlier one),
+    and a final "complete" event carrying the same payload as GeneratePlanResponse (in the
+    requested step_format; "step" events always carry full steps).
+    Failures after the stream has started are reported as an "error" event.
+    """
+    if request.samples > 1:
+        raise HTTPException(status_code=400, detail="Best-of-N sampling is not supported when streaming; use /api/generate-plan")
+    
+    session_id = str(uuid.uuid4())
+    logger.info(f"📝 New streaming plan request - Session: {session_id[:8]}...")
+    logger.info(f"   User prompt: {request.prompt[:100]}...")
+    
+    formatted_prompt = format_as_planning_problem(request.prompt)
+    
+    # Fail fast with a normal HTTP error if the client cannot be initialized
+    get_genai_client()
+    
+    async def event_stream():
+        yield sse_event("session", {"session_id": session_id})
+        
+        chunks = []
+        usage_info: Dict[str, Any] = {}
+        parser = IncrementalStepParser()
+        try:
+            cache_key = generation_cache_key(formatted_prompt, request)
+            cached = await run_store_io(generation_cache, generation_cache.get, cache_key) if cache_key else None
+            if cached is not None:
+                # Cache hit: the whole output arrives as a single chunk
+                logger.info(f"♻️ Generation cache hit: {cache_key[:12]}")
+                cache_status = "hit"
+                usage_info = cached.get('usage', {})
+                text_stream = iterate_chunks([cached['choices'][0]['message']['content']])
+            else:
+                cache_status = "miss" if cache_key else "bypass"
+                text_stream = stream_pddl_model(formatted_prompt, request.temperature, request.max_tokens, usage_info)
+            
+            async for text in text_stream:
+                chunks.append(text)
+                yield sse_event("chunk", {"text": text})
+                for step in parser.feed(text):
+                    yield sse_event("step", step.model_dump())
+            
+            for step in parser.close():
+                yield sse_event("step", step.model_dump())
+            
+            raw_output = ''.join(chunks)
+            if cache_status == "miss":
+                await store_cached_response(cache_key, format_model_response(raw_output, usage_info))
+            
+            generation = parse_generation(raw_output, usage_info, cache_status, parser)
+            plan_response = build_plan_response(session_id, request, generation)
+            await remember_session(plan_response)
+            logger.info(f"✅ Streaming plan generation complete - Session: {session_id[:8]}")
+            yield sse_event("complete", respond_in_step_format(plan_response, request, generation).model_dump())
+        except Exception as e:
+            logger.error(f"❌ Error streaming PDDL model: {str(e)}")
+            yield sse_event("error", {"detail": f"Error calling PDDL model: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/solve-plan")
+async def solve_plan(request: SolvePlanRequest):
+    """
+    Solve the domain and problem of a generated plan with the embedded planner
+    and compare the reference plan with the model's ; PLAN.
+    """
+    plan_text = request.plan_text
+    if plan_text is None:
+        if request.session_id is None:
+            raise HTTPException(status_code=400, detail="Provide session_id or plan_text")
+        session = await run_store_io(session_store, session_store.get, request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired; submit plan_text instead")
+        plan_text = session["plan_text"]
+    
+    doc = parse_pddl(plan_text)
+    async with planner_semaphore:
+        try:
+            reference = await asyncio.to_thread(solve, doc, request.algorithm, request.time_budget)
+        except PlannerError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    model_plan = validate_plan(doc)
+    model_length = len(doc.plan)
+    reference_length = reference.get("plan_length")
+    logger.info(
+        f"🧭 Solved {(request.session_id or 'plan_text')[:8]} with {request.algorithm}: "
+        f"{'plan of ' + str(reference_length) + ' steps' if reference['solved'] else reference['reason']} "
+        f"in {reference['total_ms']:.0f}ms"
+    )
+    return {
+        "session_id": request.session_id,
+        "reference_plan": reference,
+        "comparison": {
+            "model_plan_length": model_length,
+            "model_plan_valid": model_plan["plan_valid"],
+            "reference_plan_length": reference_length,
+            "extra_steps": model_length - reference_length if reference_length is not None and model_plan["plan_valid"] else None
+        }
+    }
+
+
 @app.post("/api/submit-feedback", response_model=SubmitFeedbackResponse)
 async def submit_feedback(request: SubmitFeedbackRequest):
     """
     Accept human feedback and generate RLHF training dataset.
     Saves the dataset to disk.
+    For sessions still in the session store, only session_id and per-step
+    step_id/rating/reason are required; prompt, plan_text, metadata and step
+    contents are taken from the stored session.
     """
     try:
         logger.info(f"💬 Feedback submission - Session: {request.session_id[:8]}...")
         logger.info(f"   Feedback items: {len(request.feedback)}")
         
+        session = await run_store_io(session_store, session_store.get, request.session_id)
+        if session is None and (request.prompt is None or request.plan_text is None):
+            raise HTTPException(
+                status_code=404,
+                detail="Session not found or expired; submit prompt and plan_text with the feedback"
+            )
+        
+        prompt = request.prompt if request.prompt is not None else session["prompt"]
+        plan_text = request.plan_text if request.plan_text is not None else session["plan_text"]
+        metadata = request.metadata if request.metadata is not None else (session["metadata"] if session else {})
+        feedback = resolve_feedback_items(request.feedback, session)
+        
+        # Reuse the stored analysis unless the client sent a different plan
+        stored_analysis = session is not None and plan_text == session["plan_text"]
+        
         # Generate RLHF dataset
         dataset = generate_rlhf_dataset(
             request.session_id,
-            request.prompt,
-            request.plan_text,
-            request.feedback,
-            request.metadata
+            prompt,
+            plan_text,
+            feedback,
+            metadata,
+            pddl_components=session["pddl_components"] if stored_analysis else None,
+            pddl_validation=session["pddl_validation"] if stored_analysis else None
         )
         
-        # Save to disk
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = f"rlhf_session_{timestamp}_{request.session_id[:8]}.json"
-        file_path = os.path.join(TRAINING_DATA_DIR, filename)
-        
-        logger.info(f"💾 Saving dataset to: {filename}")
-        with open(file_path, 'w') as f:
-            json.dump(dataset, f, indent=2)
+        # Hand the dataset to the background writer (batched fsync/commit off the event loop)
+        location = await dataset_writer.submit(dataset)
+        file_path = dataset_store.file_path(location) if location else "queued"
+        logger.info(f"💾 Saved dataset to: {location or 'write queue'}")
         
         logger.info(f"✅ Feedback saved successfully")
         
-        return SubmitFeedbackResponse(
+        return model_response(SubmitFeedbackResponse(
             success=True,
             dataset=dataset,
             file_path=file_path
-        )
+        ))
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing feedback: {str(e)}")
 
@@ -1307,30 +2218,141 @@ async def export_dataset(session_id: str, format: str = "json"):
     Export a specific dataset by session ID.
     Supports json, jsonl, and csv formats.
     """
-    # Find the file
-    matching_files = [f for f in os.listdir(TRAINING_DATA_DIR) if session_id[:8] in f]
+    dataset = await asyncio.to_thread(dataset_store.find, session_id)
     
-    if not matching_files:
+    if dataset is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    file_path = os.path.join(TRAINING_DATA_DIR, matching_files[0])
-    
-    with open(file_path, 'r') as f:
-        dataset = json.load(f)
-    
     if format == "json":
-        return dataset
+        # Stored datasets are plain JSON already: encode directly, without jsonable_encoder
+        return FastJSONResponse(dataset)
     elif format == "jsonl":
         # Convert to JSONL format
-        lines = [json.dumps(dataset)]
-        return {"data": "\n".join(lines)}
+        lines = [dumps(dataset).decode('utf-8')]
+        return FastJSONResponse({"data": "\n".join(lines)})
     elif format == "csv":
-        # Simplified CSV format
-        raise HTTPException(status_code=501, detail="CSV format not yet implemented")
+        # One row per feedback item
+        return StreamingResponse(
+            csv_chunks(iter([dataset])),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{session_id}.csv"'}
+        )
     else:
         raise HTTPException(status_code=400, detail="Invalid format. Use json, jsonl, or csv")
 
 
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def parse_export_timestamp(name: str, value: Optional[str]) -> Optional[str]:
+    """Validate an ISO-8601 date/timestamp filter; the dataset backends compare it with dataset timestamps in UTC."""
+    if value is None:
+        return None
+    try:
+        utc_timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: use an ISO-8601 date or timestamp, e.g. 2025-10-06 or 2025-10-06T12:00:00Z")
+    return value
+
+
+def ndjson_chunks(datasets: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    """Encode datasets as NDJSON in chunks of about EXPORT_CHUNK_BYTES. Only the current chunk is held in memory."""
+    buffer = []
+    buffered = 0
+    for dataset in datasets:
+        line = dumps(dataset) + b"\n"
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= EXPORT_CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# format -> (media type, file extension) for /api/export-datasets
+EXPORT_FORMATS = {
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+
+
+@app.get("/api/export-datasets")
+async def export_datasets(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    min_score: Optional[float] = None,
+    min_validity: Optional[float] = None,
+    trainable: Optional[bool] = None,
+    model: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: str = "jsonl",
+    include_content: bool = False,
+    gzip: bool = False
+):
+    """
+    Bulk export of every stored dataset matching the filters.
+    format=jsonl (default) streams one dataset per line. format=csv, parquet or
+    arrow stream one flattened row per human_feedback item instead (step_content
+    only with include_content=true); parquet/arrow need pyarrow. gzip=true
+    compresses jsonl/csv output as one gzip stream.
+    since/until bound the dataset timestamp (ISO-8601, until is exclusive);
+    min_score/min_validity are lower bounds on overall_score/pddl_validity_score.
+    Datasets are read and sent one chunk at a time, so memory use does not grow
+    with the size of the corpus.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use {', '.join(EXPORT_FORMATS)}")
+    if format in ("parquet", "arrow"):
+        if feedback_export.pa is None:
+            raise HTTPException(status_code=501, detail="Parquet/Arrow export requires the pyarrow package")
+        if gzip:
+            raise HTTPException(status_code=400, detail="gzip applies to jsonl and csv exports only")
+    since = parse_export_timestamp("since", since)
+    until = parse_export_timestamp("until", until)
+    logger.info(f"📤 Bulk export - format: {format}, since: {since}, until: {until}, min_score: {min_score}, trainable: {trainable}, gzip: {gzip}")
+    
+    datasets = dataset_store.query(
+        since=since,
+        until=until,
+        min_score=min_score,
+        min_validity=min_validity,
+        trainable=trainable,
+        model=model,
+        limit=limit
+    )
+    if format == "jsonl":
+        chunks = ndjson_chunks(datasets)
+    elif format == "csv":
+        chunks = csv_chunks(datasets, include_content)
+    else:
+        chunks = columnar_chunks(datasets, format, include_content)
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"datasets.{extension}"
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        media_type, filename = "application/gzip", filename + ".gz"
+    
+    # A sync iterator: Starlette pulls each chunk in the threadpool, off the event loop
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,91 @@
+"""
+One-time migration of per-session training data files into a dataset backend.
+Converts every training_data/rlhf_session_<ts>_<id>.json into a record in the
+configured backend (JSONL segments by default, or SQLite), oldest first, and
+moves the original into training_data/migrated/ (or deletes it with --delete).
+With --backend sqlite --from-segments, datasets already in training_data/segments/
+are copied into the database as well. With --dedup, long strings are stored once
+in training_data/blobs/ (see blob_store). Run it while the server is stopped.
+
+Usage:
+    python migrate_training_data.py [--training-dir training_data] [--backend segments|sqlite]
+                                    [--compress] [--dedup] [--delete] [--from-segments]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from blob_store import with_blob_store
+from dataset_store import JsonlDatasetStore, legacy_dataset_files, migrate_legacy_datasets, open_dataset_store
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate per-session dataset files into a dataset backend")
+    parser.add_argument("--training-dir", default="training_data", help="Training data directory (default: training_data)")
+    parser.add_argument("--backend", choices=["segments", "sqlite"], default=os.getenv("DATASET_BACKEND", "segments"),
+                        help="Target backend (default: DATASET_BACKEND or segments)")
+    parser.add_argument("--db-path", default=os.getenv("DATASET_DB_PATH") or None,
+                        help="SQLite database path (default: DATASET_DB_PATH or <training-dir>/datasets.sqlite3)")
+    parser.add_argument("--segment-mb", type=float, default=float(os.getenv("TRAINING_DATA_SEGMENT_MB", "64")),
+                        help="Segment rotation size in MB (default: TRAINING_DATA_SEGMENT_MB or 64)")
+    parser.add_argument("--compress", action="store_true",
+                        default=os.getenv("TRAINING_DATA_COMPRESS", "false").lower() in ("1", "true", "yes"),
+                        help="Write gzip-compressed segments (default: TRAINING_DATA_COMPRESS)")
+    parser.add_argument("--dedup", action="store_true",
+                        default=os.getenv("TRAINING_DATA_DEDUP", "false").lower() in ("1", "true", "yes"),
+                        help="Store long strings once in <training-dir>/blobs/ (default: TRAINING_DATA_DEDUP)")
+    parser.add_argument("--delete", action="store_true", help="Delete migrated files instead of moving them to migrated/")
+    parser.add_argument("--from-segments", action="store_true",
+                        help="With --backend sqlite, also copy datasets from training_data/segments/")
+    args = parser.parse_args()
+
+    store = with_blob_store(
+        open_dataset_store(
+            args.backend,
+            args.training_dir,
+            db_path=args.db_path,
+            max_segment_bytes=int(args.segment_mb * 1024 * 1024),
+            compress=args.compress
+        ),
+        args.training_dir,
+        dedup=args.dedup,
+        max_segment_bytes=int(args.segment_mb * 1024 * 1024),
+        compress=args.compress
+    )
+    try:
+        store.sync()
+
+        if args.from_segments and args.backend == "sqlite":
+            segment_store = JsonlDatasetStore(args.training_dir)
+            # Records written with dedup hold blob references; copy them rehydrated
+            blobs = getattr(store, "blobs", None)
+            try:
+                copied = 0
+                for _, dataset in segment_store.segments.iter_records():
+                    store.save(blobs.rehydrate(dataset) if blobs else dataset)
+                    copied += 1
+            finally:
+                segment_store.close()
+            logger.info(f"✅ Copied {copied} datasets from segments")
+
+        pending = legacy_dataset_files(args.training_dir)
+        logger.info(f"📦 Found {len(pending)} per-session dataset files in {args.training_dir}")
+        migrated = migrate_legacy_datasets(args.training_dir, store, delete=args.delete)
+        logger.info(f"✅ Migrated {migrated} datasets into the {args.backend} backend")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+PDDL s-expression tokenizer and reader.
+Parses model output in one linear pass into a reusable document AST
+(domain, problem, actions, plan and state trace) shared by the extractors in main.py.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple, Union
+
+
+# One token per match: plan step marker "(; 12)", comment, parens or atom
+TOKEN_RE = re.compile(r"""
+    (?P<step>\(\s*;\s*(?P<step_num>\d+)\s*\))
+  | (?P<comment>;.*)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<atom>[^\s();]+)
+""", re.VERBOSE)
+
+PLAN_HEADERS = {'; PLAN', ';PLAN'}
+STATE_TRACE_HEADERS = {'; STATE TRACE', ';STATE TRACE'}
+
+# Plan actions written inside comments: "; (N) (action ...)" and "; (action ...)"
+NUMBERED_COMMENT_STEP_RE = re.compile(r';\s*\(\s*(\d+)\s*\)\s*(.+)')
+COMMENT_STEP_RE = re.compile(r';\s*(\(.+\))\s*$')
+STATE_TRACE_STEP_RE = re.compile(r';\s*step\s*(\d+)\s+(.+)')
+
+
+class SExpr:
+    """
+    A parenthesized list. Items are lowercased atoms (str) or nested SExpr nodes;
+    PDDL names are case-insensitive, so the lowercased atoms are what everything
+    compares. text() gives an atom as it was written, for display.
+    """
+
+    __slots__ = ('items', 'parent', 'start', 'end', 'closed', 'fenced', 'spellings')
+
+    def __init__(self, parent: Optional['SExpr'], start: Tuple[int, int], fenced: bool = False):
+        self.items: List[Union[str, 'SExpr']] = []
+        self.parent = parent
+        self.start = start  # (line, column) of the opening paren
+        self.end = start  # (line, column) of the closing paren
+        self.closed = False
+        self.fenced = fenced  # opened inside a ```pddl / ```lisp code block
+        self.spellings: Optional[Dict[int, str]] = None  # item index -> source text, for atoms not written in lowercase
+
+    @property
+    def head(self) -> Optional[str]:
+        """The first item if it is an atom, e.g. 'define' or ':action'."""
+        if self.items and isinstance(self.items[0], str):
+            return self.items[0]
+        return None
+
+    def text(self, index: int) -> str:
+        """Atom at index as written in the source (items[index] is its lowercased form)."""
+        if self.spellings is not None and index in self.spellings:
+            return self.spellings[index]
+        return self.items[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __repr__(self):
+        return f"SExpr({sexpr_to_str(self)})"
+
+
+def sexpr_to_str(node: Union[str, SExpr]) -> str:
+    """Canonical single-line rendering of a node (lowercase, single spaces)."""
+    if isinstance(node, str):
+        return node
+    return '(' + ' '.join(sexpr_to_str(item) for item in node.items) + ')'
+
+
+def parse_typed_list(items: List[Union[str, SExpr]]) -> List[Tuple[str, str]]:
+    """Parse a PDDL typed list like "a b - block c - table d" into [(name, type), ...]."""
+    result = []
+    pending = []
+    i = 0
+    while i < len(items):
+        item = items[i]
+        if item == '-' and i + 1 < len(items):
+            type_item = items[i + 1]
+            if isinstance(type_item, SExpr):
+                # (either t1 t2) - keep the first alternative
+                type_name = next((t for t in type_item.items[1:] if isinstance(t, str)), 'object')
+            else:
+                type_name = type_item
+            result.extend((name, type_name) for name in pending)
+            pending = []
+            i += 2
+            continue
+        if isinstance(item, str):
+            pending.append(item)
+        i += 1
+    result.extend((name, 'object') for name in pending)
+    return result
+
+
+class PlanStep:
+    """One grounded action from the ; PLAN section."""
+
+    __slots__ = ('step_number', 'call', 'name', 'args', 'line')
+
+    def __init__(self, step_number: int, call: str, name: Optional[str], args: List[str], line: int):
+        self.step_number = step_number
+        self.call = call  # source text, e.g. "(load pkg1 truck1 locA)"
+        self.name = name  # lowercased action name, None if the call is not an s-expression
+        self.args = args  # lowercased arguments
+        self.line = line
+
+
+class PddlAction:
+    """An (:action ...) definition."""
+
+    def __init__(self, node: SExpr, definition: str):
+        self.node = node
+        self.definition = definition  # full source lines of the action
+        has_name = len(node.items) > 1 and isinstance(node.items[1], str)
+        self.key = node.items[1] if has_name else None  # lowercased name, for lookups
+        self.name = node.text(1) if has_name else None  # name as written
+        self.parameters: List[Tuple[str, str]] = []
+        self.precondition: Optional[SExpr] = None
+        self.effect: Optional[SExpr] = None
+        items = node.items
+        for i in range(2, len(items) - 1):
+            key, value = items[i], items[i + 1]
+            if key == ':parameters' and isinstance(value, SExpr):
+                self.parameters = parse_typed_list(value.items)
+            elif key == ':precondition' and isinstance(value, SExpr):
+                self.precondition = value
+            elif key == ':effect' and isinstance(value, SExpr):
+                self.effect = value
+
+
+class PddlDomain:
+    """Structured view of a (define (domain ...)) form."""
+
+    def __init__(self, node: SExpr, actions: Dict[str, PddlAction]):
+        self.node = node
+        self.name = None
+        self.requirements: List[str] = []
+        self.types: Dict[str, str] = {}  # type -> parent type
+        self.constants: List[Tuple[str, str]] = []
+        self.predicates: Dict[str, List[Tuple[str, str]]] = {}  # name -> typed parameters
+        self.functions: Dict[str, List[Tuple[str, str]]] = {}
+        self.actions = actions
+        for item in node.items[1:]:
+            if not isinstance(item, SExpr):
+                continue
+            head = item.head
+            if head == 'domain' and len(item) > 1:
+                self.name = item[1]
+            elif head == ':requirements':
+                self.requirements = [r for r in item.items[1:] if isinstance(r, str)]
+            elif head == ':types':
+                self.types = dict(parse_typed_list(item.items[1:]))
+            elif head == ':constants':
+                self.constants = parse_typed_list(item.items[1:])
+            elif head == ':predicates':
+                for predicate in item.items[1:]:
+                    if isinstance(predicate, SExpr) and predicate.head:
+                        self.predicates[predicate.head] = parse_typed_list(predicate.items[1:])
+            elif head == ':functions':
+                for function in item.items[1:]:
+                    if isinstance(function, SExpr) and function.head:
+                        self.functions[function.head] = parse_typed_list(function.items[1:])
+
+
+class PddlProblem:
+    """Structured view of a (define (problem ...)) form."""
+
+    def __init__(self, node: SExpr):
+        self.node = node
+        self.name = None
+        self.domain_name = None
+        self.objects: List[Tuple[str, str]] = []
+        self.init: List[SExpr] = []
+        self.goal: Optional[SExpr] = None
+        for item in node.items[1:]:
+            if not isinstance(item, SExpr):
+                continue
+            head = item.head
+            if head == 'problem' and len(item) > 1:
+                self.name = item[1]
+            elif head == ':domain' and len(item) > 1:
+                self.domain_name = item[1]
+            elif head == ':objects':
+                self.objects = parse_typed_list(item.items[1:])
+            elif head == ':init':
+                self.init = [fact for fact in item.items[1:] if isinstance(fact, SExpr)]
+            elif head == ':goal' and len(item) > 1 and isinstance(item[1], SExpr):
+                self.goal = item[1]
+
+
+class PddlDocument:
+    """
+    Parsed model output. Built by PddlDocumentBuilder; treat as read-only,
+    since parse_pddl() shares documents between callers.
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.forms: List[SExpr] = []  # top-level lists in source order
+        self.comments: List[Tuple[int, str]] = []  # (line, comment text)
+        self.actions: List[PddlAction] = []  # every (:action ...) in source order
+        self.domain_actions: Dict[str, PddlAction] = {}  # actions inside the domain define, by lowercased name
+        self.domain_node: Optional[SExpr] = None
+        self.problem_node: Optional[SExpr] = None
+        self.plan: Dict[int, PlanStep] = {}  # step number -> plan step
+        self.state_traces: Dict[int, List[str]] = {}  # step number -> trace lines
+        self.keywords = set()  # ':'-prefixed atoms seen outside comments
+        self.open_count = 0
+        self.close_count = 0
+        self.unclosed = 0  # lists still open at end of input
+        self.pddl_fence_end = -1  # line of the last closing fence of a ```pddl block
+        self._domain = None
+        self._problem = None
+
+    def source(self, node: SExpr) -> str:
+        """Exact source text of a node, from its opening to its closing paren."""
+        (start_line, start_col), (end_line, end_col) = node.start, node.end
+        if start_line == end_line:
+            return self.lines[start_line][start_col:end_col + 1]
+        parts = [self.lines[start_line][start_col:]]
+        parts.extend(self.lines[start_line + 1:end_line])
+        parts.append(self.lines[end_line][:end_col + 1])
+        return '\n'.join(parts)
+
+    def line_span(self, node: SExpr) -> str:
+        """Full source lines covered by a node."""
+        return '\n'.join(self.lines[node.start[0]:node.end[0] + 1])
+
+    @property
+    def domain(self) -> Optional[PddlDomain]:
+        if self._domain is None and self.domain_node is not None:
+            self._domain = PddlDomain(self.domain_node, self.domain_actions)
+        return self._domain
+
+    @property
+    def problem(self) -> Optional[PddlProblem]:
+        if self._problem is None and self.problem_node is not None:
+            self._problem = PddlProblem(self.problem_node)
+        return self._problem
+
+    @property
+    def plan_steps(self) -> List[PlanStep]:
+        """Plan steps ordered by step number."""
+        return [self.plan[num] for num in sorted(self.plan)]
+
+
+class PddlDocumentBuilder:
+    """
+    Incremental single-pass reader. feed_line() tokenizes one line, updates the
+    document and returns change events so streaming callers can react:
+      ('plan', step_number), ('trace', step_number), ('action', action_name),
+      ('domain', None), ('problem', None)
+    """
+
+    def __init__(self):
+        self.document = PddlDocument()
+        self.stack: List[SExpr] = []
+        self.section = None  # current comment section: 'plan', 'trace', 'checks' or None
+        self.in_pddl_fence = False
+        self.finished = False
+
+    def feed_line(self, line: str) -> List[Tuple[str, Any]]:
+        doc = self.document
+        line_no = len(doc.lines)
+        doc.lines.append(line)
+        events = []
+        stripped = line.strip()
+
+        # Markdown code fences are not PDDL; track ```pddl / ```lisp blocks
+        if stripped.startswith('```'):
+            self._close_open_lists(events)
+            if 'pddl' in stripped.lower() or 'lisp' in stripped.lower():
+                self.in_pddl_fence = True
+            elif self.in_pddl_fence:
+                self.in_pddl_fence = False
+                doc.pddl_fence_end = line_no
+            return events
+
+        if not stripped:
+            return events
+        if stripped[0] == ';':
+            # Whole-line comment: no tokens to read
+            self._comment(line_no, stripped, stripped, events)
+            return events
+
+        stack = self.stack
+        step_number = None
+        for match in TOKEN_RE.finditer(line):
+            kind = match.lastgroup
+            if kind == 'atom':
+                if not stack:
+                    continue  # prose outside any list
+                text = match.group()
+                atom = text.lower()
+                if atom[0] == ':':
+                    doc.keywords.add(atom)
+                node = stack[-1]
+                if atom != text:
+                    if node.spellings is None:
+                        node.spellings = {}
+                    node.spellings[len(node.items)] = text
+                node.items.append(atom)
+                if atom == 'define' and len(node.items) == 1 and len(stack) > 1:
+                    # A define always starts a new top-level form; whatever is
+                    # still open around it (stray prose parens) was never closed
+                    stack.pop()
+                    self._close_open_lists(events)
+                    node.parent = None
+                    stack.append(node)
+            elif kind == 'open':
+                doc.open_count += 1
+                stack.append(SExpr(stack[-1] if stack else None, (line_no, match.start()), self.in_pddl_fence))
+            elif kind == 'close':
+                doc.close_count += 1
+                if not stack:
+                    continue
+                node = stack.pop()
+                node.end = (line_no, match.start())
+                node.closed = True
+                self._complete(node, step_number, events)
+                step_number = None
+            elif kind == 'step':
+                step_number = int(match.group('step_num'))
+            else:  # comment runs to end of line
+                self._comment(line_no, match.group(), stripped, events)
+                break
+        return events
+
+    def finish(self) -> List[Tuple[str, Any]]:
+        """Close lists left open by truncated output. Returns the final change events."""
+        events = []
+        if self.finished:
+            return events
+        self.finished = True
+        self._close_open_lists(events)
+        return events
+
+    def _close_open_lists(self, events: List[Tuple[str, Any]]):
+        """Complete every open list as unclosed, ending at the last line read."""
+        doc = self.document
+        doc.unclosed += len(self.stack)
+        last_line = max(len(doc.lines) - 1, 0)
+        while self.stack:
+            node = self.stack.pop()
+            node.end = (last_line, len(doc.lines[last_line]) - 1 if doc.lines else 0)
+            self._complete(node, None, events)
+
+    def _complete(self, node: SExpr, step_number: Optional[int], events: List[Tuple[str, Any]]):
+        doc = self.document
+        parent = node.parent
+        if parent is not None:
+            parent.items.append(node)
+        else:
+            doc.forms.append(node)
+
+        head = node.head
+        if head == ':action':
+            action = PddlAction(node, doc.line_span(node))
+            doc.actions.append(action)
+            if action.key and parent is not None and parent is doc.domain_node:
+                doc.domain_actions[action.key] = action
+                events.append(('action', action.key))
+            return
+
+        if parent is not None:
+            # The (domain x) / (problem x) header tells us what the enclosing define is
+            if parent.head == 'define' and len(parent.items) == 2:
+                if head == 'domain' and doc.domain_node is None:
+                    doc.domain_node = parent
+                    events.append(('domain', None))
+                elif head == 'problem' and doc.problem_node is None:
+                    doc.problem_node = parent
+                    events.append(('problem', None))
+            return
+
+        # Top-level list inside the PLAN section is a grounded action
+        if self.section == 'plan' and head and head != 'define' and not head.startswith(':'):
+            if step_number is None:
+                step_number = len(doc.plan) + 1
+            args = [item if isinstance(item, str) else sexpr_to_str(item) for item in node.items[1:]]
+            doc.plan[step_number] = PlanStep(step_number, doc.source(node), head, args, node.start[0])
+            events.append(('plan', step_number))
+
+    def _comment(self, line_no: int, text: str, stripped: str, events: List[Tuple[str, Any]]):
+        doc = self.document
+        doc.comments.append((line_no, text))
+        if not stripped.startswith(';'):
+            # Trailing comment after code; only whole-line comments carry sections and plan/trace data
+            return
+
+        # Section headers; a header inside an open list means that list was truncated
+        upper = stripped.upper()
+        if upper in PLAN_HEADERS:
+            section = 'plan'
+        elif upper in STATE_TRACE_HEADERS:
+            section = 'trace'
+        elif upper.startswith('; SOUNDNESS') or upper.startswith(';SOUNDNESS'):
+            section = 'checks'
+        else:
+            section = None
+        if section is not None:
+            self._close_open_lists(events)
+            self.section = section
+            return
+
+        if self.section == 'plan':
+            match = NUMBERED_COMMENT_STEP_RE.match(stripped)
+            if match:
+                step_number = int(match.group(1))
+                call = match.group(2).strip()
+            else:
+                match = COMMENT_STEP_RE.match(stripped)
+                if not match:
+                    return
+                step_number = len(doc.plan) + 1
+                call = match.group(1).strip()
+            name, args = read_call(call)
+            doc.plan[step_number] = PlanStep(step_number, call, name, args, line_no)
+            events.append(('plan', step_number))
+        elif self.section == 'trace':
+            match = STATE_TRACE_STEP_RE.match(stripped)
+            if match:
+                step_number = int(match.group(1))
+                doc.state_traces.setdefault(step_number, []).append(match.group(2).strip())
+                events.append(('trace', step_number))
+
+
+def read_call(text: str) -> Tuple[Optional[str], List[str]]:
+    """Read the first list in text and return its (name, args), e.g. "(load a b)" -> ('load', ['a', 'b'])."""
+    builder = PddlDocumentBuilder()
+    builder.feed_line(text)
+    builder.finish()
+    forms = builder.document.forms
+    if not forms or not forms[0].head:
+        return None, []
+    node = forms[0]
+    return node.head, [item if isinstance(item, str) else sexpr_to_str(item) for item in node.items[1:]]
+
+
+@lru_cache(maxsize=16)
+def parse_pddl(text: str) -> PddlDocument:
+    """
+    Parse text into a PddlDocument in a single pass.
+    Cached so the extractors, validator and component views of the same output share one parse.
+    """
+    builder = PddlDocumentBuilder()
+    for line in text.split('\n'):
+        builder.feed_line(line)
+    builder.finish()
+    return builder.document
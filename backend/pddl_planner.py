@@ -0,0 +1,450 @@
+"""
+Embedded classical planner for extracted PDDL domains and problems.
+Grounds every action against the problem objects (static predicates prune the
+bindings), then runs greedy best-first search or A* over bitset states (see
+pddl_validator) guided by the FF relaxed-plan heuristic, within a time budget.
+Visited states are plain ints, so the closed list is a hash set of ints.
+Groundings are kept on the cached task (see pddl_validator.GroundingCache), so
+solving another problem over the same domain and objects skips re-grounding.
+"""
+
+import copy
+import heapq
+import math
+import time
+from typing import List, Optional, Dict, Any, Tuple
+
+from pddl_parser import PddlDocument, PddlDomain, SExpr
+from pddl_validator import Condition, GroundAction, PddlTask, PlanStepError, compile_problem, grounding_cache
+
+ALGORITHMS = ("gbfs", "astar")
+MAX_GROUND_ACTIONS = 100000
+MAX_GROUND_BINDINGS = 2000000  # parameter bindings enumerated while grounding, kept or pruned
+DEADLINE_CHECK_INTERVAL = 1024  # bindings between deadline checks while grounding
+MAX_EXPANSIONS = 1000000
+MAX_ACTION_TABLES_PER_TASK = 4
+CONNECTIVES = {'and', 'or', 'not', 'imply', 'forall', 'exists', 'when', '='}
+INFINITY = math.inf
+
+
+class PlannerError(Exception):
+    """The task cannot be searched (missing definitions, grounding too large or too slow)."""
+
+
+def bit_ids(mask: int) -> List[int]:
+    """Fact ids set in a bitmask."""
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+
+def effect_predicates(node, found: set) -> set:
+    """Predicates that occur in an effect; every other predicate is static."""
+    if isinstance(node, SExpr):
+        if node.head and node.head not in CONNECTIVES:
+            found.add(node.head)
+        else:
+            for item in node.items[1:]:
+                effect_predicates(item, found)
+    return found
+
+
+def static_preconditions(node, static: set) -> List[SExpr]:
+    """Positive atoms over static predicates in the top-level conjunction of a precondition."""
+    if not isinstance(node, SExpr):
+        return []
+    if node.head == 'and':
+        atoms = []
+        for item in node.items[1:]:
+            atoms.extend(static_preconditions(item, static))
+        return atoms
+    return [node] if node.head in static else []
+
+
+def static_predicates(domain: PddlDomain) -> set:
+    """Declared predicates that no action changes."""
+    modified = set()
+    for action in domain.actions.values():
+        effect_predicates(action.effect, modified)
+    return set(domain.predicates) - modified
+
+
+def ground_actions(
+    task: PddlTask,
+    init_state: int,
+    static: set,
+    deadline: float = INFINITY
+) -> List[GroundAction]:
+    """
+    Every applicable-in-principle grounding of the domain's actions. Parameters are bound
+    in order and a static precondition is checked against :init as soon as its
+    variables are bound, so e.g. (road ?from ?to) only yields existing roads.
+    Raises PlannerError past deadline (a time.perf_counter() value), after
+    MAX_GROUND_BINDINGS bindings or MAX_GROUND_ACTIONS kept groundings.
+    """
+    domain: PddlDomain = task.domain
+    grounded = []
+    enumerated = [0]
+
+    def count_binding():
+        enumerated[0] += 1
+        if enumerated[0] > MAX_GROUND_BINDINGS:
+            raise PlannerError(f"More than {MAX_GROUND_BINDINGS} parameter bindings to ground")
+        if enumerated[0] % DEADLINE_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+            raise PlannerError("Grounding did not finish within the time budget")
+
+    for name, action in domain.actions.items():
+        parameters = [parameter for parameter, _ in action.parameters]
+        candidates = [task.objects_of_type(type_name) for _, type_name in action.parameters]
+        # depth -> static atoms whose last variable is bound at that depth
+        checks: List[List[SExpr]] = [[] for _ in range(len(parameters) + 1)]
+        for atom in static_preconditions(action.precondition, static):
+            positions = [parameters.index(term) for term in atom.items[1:] if term in parameters]
+            checks[max(positions) + 1 if positions else 0].append(atom)
+
+        def holds(atoms: List[SExpr], bindings: Dict[str, str]) -> bool:
+            for atom in atoms:
+                fact_id = task.facts.get(task.ground_atom(atom, bindings))
+                if fact_id is None or not init_state >> fact_id & 1:
+                    return False
+            return True
+
+        def extend(depth: int, bindings: Dict[str, str], args: List[str]):
+            count_binding()
+            if not holds(checks[depth], bindings):
+                return
+            if depth == len(parameters):
+                try:
+                    ground = task.ground_action(name, args)
+                except PlanStepError:
+                    return
+                if not ground.precondition.never:
+                    grounded.append(ground)
+                    if len(grounded) > MAX_GROUND_ACTIONS:
+                        raise PlannerError(f"More than {MAX_GROUND_ACTIONS} ground actions")
+                return
+            for value in candidates[depth]:
+                bindings[parameters[depth]] = value
+                args.append(value)
+                extend(depth + 1, bindings, args)
+                args.pop()
+            bindings.pop(parameters[depth], None)
+
+        extend(0, {}, [])
+    return grounded
+
+
+class RelaxedPlanHeuristic:
+    """
+    FF heuristic: the number of actions in a relaxed plan (delete effects,
+    negative and non-literal preconditions ignored), extracted from a relaxed
+    planning graph built with per-action precondition counters.
+    """
+
+    def __init__(self, actions: List[GroundAction], goal: Optional[Condition] = None):
+        self.preconditions = [bit_ids(action.precondition.pos) for action in actions]
+        self.adds = []
+        for action in actions:
+            add = action.add
+            for _, when_add, _ in action.conditional:
+                add |= when_add
+            self.adds.append(bit_ids(add))
+        self.consumers: Dict[int, List[int]] = {}
+        for index, facts in enumerate(self.preconditions):
+            for fact in facts:
+                self.consumers.setdefault(fact, []).append(index)
+        self.unconditional = [index for index, facts in enumerate(self.preconditions) if not facts]
+        self.counts = [len(facts) for facts in self.preconditions]
+        self.goal = bit_ids(goal.pos) if goal is not None else []
+        self.fact_count = max([fact for facts in self.preconditions + self.adds for fact in facts], default=-1) + 1
+
+    def with_goal(self, goal: Condition) -> 'RelaxedPlanHeuristic':
+        """A copy for another goal, sharing the action tables."""
+        heuristic = copy.copy(self)
+        heuristic.goal = bit_ids(goal.pos)
+        return heuristic
+
+    def __call__(self, state: int) -> float:
+        return self.evaluate(state)[0]
+
+    def evaluate(self, state: int) -> Tuple[float, set]:
+        """(h, action indices of the relaxed plan); h is INFINITY for relaxed dead ends."""
+        goals = [fact for fact in self.goal if not state >> fact & 1]
+        if not goals:
+            return 0, set()
+        goal_set = set(goals)
+        counters = self.counts[:]
+        achiever: Dict[int, int] = {}
+        frontier = bit_ids(state)
+        reached = bytearray(max(self.fact_count, state.bit_length()))
+        for fact in frontier:
+            reached[fact] = 1
+        ready = list(self.unconditional)
+        remaining = len(goals)
+        while remaining:
+            for fact in frontier:
+                for index in self.consumers.get(fact, ()):
+                    counters[index] -= 1
+                    if counters[index] == 0:
+                        ready.append(index)
+            if not ready:
+                return INFINITY, set()
+            frontier = []
+            for index in ready:
+                for fact in self.adds[index]:
+                    if not reached[fact]:
+                        reached[fact] = 1
+                        achiever[fact] = index
+                        frontier.append(fact)
+                        if fact in goal_set:
+                            remaining -= 1
+            ready = []
+            if not frontier and remaining:
+                return INFINITY, set()
+
+        # Walk back from the goals, collecting one achiever per unmet fact
+        relaxed_plan = set()
+        pending = goals
+        seen = set(goals)
+        while pending:
+            fact = pending.pop()
+            index = achiever[fact]
+            if index in relaxed_plan:
+                continue
+            relaxed_plan.add(index)
+            for precondition in self.preconditions[index]:
+                if precondition not in seen and precondition in achiever:
+                    seen.add(precondition)
+                    pending.append(precondition)
+        return len(relaxed_plan), relaxed_plan
+
+
+class SuccessorGenerator:
+    """Applicable actions of a state, looking only at actions indexed under one of its facts."""
+
+    def __init__(self, actions: List[GroundAction]):
+        self.actions = actions
+        self.by_fact: Dict[int, List[int]] = {}
+        self.unconditional = []
+        for index, action in enumerate(actions):
+            pos = action.precondition.pos
+            if pos:
+                self.by_fact.setdefault((pos & -pos).bit_length() - 1, []).append(index)
+            else:
+                self.unconditional.append(index)
+
+    def __call__(self, state: int):
+        actions = self.actions
+        for index in self.unconditional:
+            if actions[index].precondition.holds(state):
+                yield index
+        for fact in bit_ids(state):
+            for index in self.by_fact.get(fact, ()):
+                if actions[index].precondition.holds(state):
+                    yield index
+
+
+class ActionTable:
+    """The full grounding of a task for one set of static :init facts, with its search indexes."""
+
+    def __init__(self, actions: List[GroundAction], facts: int):
+        self.actions = actions
+        self.facts = facts
+        self.successors = SuccessorGenerator(actions)
+        self.heuristic = RelaxedPlanHeuristic(actions)
+
+
+def action_table(task: PddlTask, init: int, deadline: float = INFINITY) -> ActionTable:
+    """
+    Ground the task for init, reusing a table built earlier for the same static facts.
+    Grounding runs on a fork of the task without holding task.lock, so validations of
+    the same task never wait for it; the table is kept on the task only if the task
+    could adopt the fork's fact numbering (otherwise it serves this search alone).
+    init must have been compiled on task. Raises PlannerError if grounding runs past
+    deadline.
+    """
+    static = static_predicates(task.domain)
+    with task.lock:
+        key = frozenset(fact for fact in bit_ids(init) if task.fact_names[fact][0] in static)
+        table = task.action_tables.get(key)
+        if table is not None:
+            return table
+        fork = task.fork()
+    table = ActionTable(ground_actions(fork, init, static, deadline), len(fork.fact_names))
+    with task.lock:
+        if task.adopt(fork):
+            task.action_tables[key] = table
+            while len(task.action_tables) > MAX_ACTION_TABLES_PER_TASK:
+                del task.action_tables[next(iter(task.action_tables))]
+    return table
+
+
+def extract_plan(parents: Dict[int, Optional[Tuple[int, int]]], state: int) -> List[int]:
+    plan = []
+    while parents[state] is not None:
+        state, index = parents[state]
+        plan.append(index)
+    plan.reverse()
+    return plan
+
+
+def greedy_best_first(
+    actions: List[GroundAction],
+    heuristic: RelaxedPlanHeuristic,
+    successors: SuccessorGenerator,
+    init: int,
+    goal: Condition,
+    deadline: float,
+    result: Dict[str, Any]
+) -> Optional[List[int]]:
+    """
+    GBFS with deferred evaluation: successors are queued under their parent's h and
+    only evaluated when popped, and FF helpful actions (relaxed plan actions
+    applicable in the parent) are tried first.
+    """
+    parents: Dict[int, Optional[Tuple[int, int]]] = {init: None}
+    counter = 0
+    heap = [(0, 0, counter, None, -1)]
+    while heap:
+        _, _, _, parent, index = heapq.heappop(heap)
+        if parent is None:
+            state = init
+        else:
+            state = actions[index].apply(parent)
+            if state in parents:
+                continue
+            parents[state] = (parent, index)
+        result["generated"] += 1
+        if goal.holds(state):
+            return extract_plan(parents, state)
+        h, relaxed_plan = heuristic.evaluate(state)
+        if h == INFINITY:
+            continue
+        result["expanded"] += 1
+        if time.perf_counter() > deadline or result["expanded"] >= MAX_EXPANSIONS:
+            return None
+        for child in successors(state):
+            counter += 1
+            heapq.heappush(heap, (h, 0 if child in relaxed_plan else 1, counter, state, child))
+    return None
+
+
+def astar(
+    actions: List[GroundAction],
+    heuristic: RelaxedPlanHeuristic,
+    successors: SuccessorGenerator,
+    init: int,
+    goal: Condition,
+    deadline: float,
+    result: Dict[str, Any]
+) -> Optional[List[int]]:
+    """
+    A* on g + h_FF (FF is not admissible, so plans are short but not guaranteed optimal).
+    Expanded states go on the closed list and are never reopened or re-evaluated.
+    """
+    parents: Dict[int, Optional[Tuple[int, int]]] = {init: None}
+    best_g = {init: 0}
+    closed = set()
+    dead_ends = set()
+    counter = 0
+    heap = [(heuristic(init), 0, counter, init)]
+    while heap:
+        _, g, _, state = heapq.heappop(heap)
+        if g > best_g[state] or state in closed:
+            continue  # stale entry, superseded by a cheaper path or already expanded
+        if goal.holds(state):
+            return extract_plan(parents, state)
+        closed.add(state)
+        result["expanded"] += 1
+        if result["expanded"] >= MAX_EXPANSIONS:
+            return None
+        for index in successors(state):
+            child = actions[index].apply(state)
+            child_g = g + 1
+            if child in closed or child in dead_ends or child_g >= best_g.get(child, INFINITY):
+                continue
+            if time.perf_counter() > deadline:
+                return None
+            child_h = heuristic(child)
+            result["generated"] += 1
+            if child_h == INFINITY:
+                dead_ends.add(child)
+                continue
+            parents[child] = (state, index)
+            best_g[child] = child_g
+            counter += 1
+            heapq.heappush(heap, (child_g + child_h, child_g, counter, child))
+    return None
+
+
+def search(
+    table: ActionTable,
+    init: int,
+    goal: Condition,
+    algorithm: str = "gbfs",
+    time_budget: float = 2.0
+) -> Dict[str, Any]:
+    """Search for a plan from init. Returns search statistics and the plan as action indices."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown search algorithm: {algorithm} (use {' or '.join(ALGORITHMS)})")
+    deadline = time.perf_counter() + time_budget
+    heuristic = table.heuristic.with_goal(goal)
+    h = heuristic(init)
+    result = {"expanded": 0, "generated": 0, "initial_heuristic": h if h != INFINITY else None}
+    if h == INFINITY:
+        return {**result, "solved": False, "reason": "Goal is unreachable (relaxed)"}
+
+    run = greedy_best_first if algorithm == "gbfs" else astar
+    plan = run(table.actions, heuristic, table.successors, init, goal, deadline, result)
+    if plan is not None:
+        return {**result, "solved": True, "plan": plan}
+    if time.perf_counter() > deadline:
+        reason = f"Time budget of {time_budget:g}s exhausted"
+    elif result["expanded"] >= MAX_EXPANSIONS:
+        reason = f"Expansion limit of {MAX_EXPANSIONS} reached"
+    else:
+        reason = "Search space exhausted: no plan exists"
+    return {**result, "solved": False, "reason": reason}
+
+
+def solve(doc: PddlDocument, algorithm: str = "gbfs", time_budget: float = 2.0) -> Dict[str, Any]:
+    """
+    Solve the domain/problem of a parsed output and return a reference plan:
+    {"solved", "plan": ["(action a b)", ...], "plan_length", search/grounding statistics,
+    "reason" when unsolved}. Raises PlannerError if there is nothing to solve or
+    grounding alone uses up time_budget.
+    """
+    domain, problem = doc.domain, doc.problem
+    if domain is None or problem is None:
+        raise PlannerError("Output has no " + ("domain" if domain is None else "problem") + " definition")
+    if not domain.actions:
+        raise PlannerError("Domain defines no actions")
+
+    started = time.perf_counter()
+    task, cached = grounding_cache.get(domain, problem.objects)
+    with task.lock:
+        init, goal, errors = compile_problem(task, problem)
+        errors = task.errors + errors
+    table = action_table(task, init, started + time_budget)
+    grounding_ms = (time.perf_counter() - started) * 1000
+
+    # The search only reads the table, so other validations of this task can proceed meanwhile
+    result = search(table, init, goal, algorithm, max(time_budget - grounding_ms / 1000, 0.0))
+    plan = result.pop("plan", None)
+    actions = table.actions
+    if plan is not None:
+        result["plan"] = ['(' + ' '.join((actions[index].name,) + actions[index].args) + ')' for index in plan]
+        result["plan_length"] = len(plan)
+    return {
+        "algorithm": algorithm,
+        **result,
+        "ground_actions": len(actions),
+        "facts": table.facts,
+        "errors": errors,
+        "grounding_cache": "hit" if cached else "miss",
+        "grounding_ms": round(grounding_ms, 3),
+        "total_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
@@ -0,0 +1,706 @@
+"""
+PDDL consistency checker and plan simulator.
+Checks a parsed domain and problem (see pddl_parser) for undeclared types,
+predicates, objects and arity mismatches, grounds the actions of the ; PLAN
+section and simulates them from :init to :goal. Facts are numbered and a state
+is a Python int used as a bitset, so checking and applying a grounded action is
+a few mask operations and long plans validate in milliseconds. The same pass
+compares each step's ; STATE TRACE claims with the simulated state.
+Grounded tasks are kept in an LRU keyed by domain content and object set, so
+outputs that reuse a domain are not re-grounded.
+"""
+
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import product
+from typing import List, Optional, Dict, Any, Tuple, Union
+
+from pddl_parser import PddlDocument, PddlDomain, PddlProblem, PlanStep, SExpr, parse_typed_list, sexpr_to_str
+
+MAX_REPORTED_ERRORS = 50
+MAX_REPORTED_FAILURES = 100
+
+# Numeric fluents are parsed but not simulated
+NUMERIC_EFFECTS = {'increase', 'decrease', 'assign', 'scale-up', 'scale-down'}
+NUMERIC_COMPARISONS = {'<', '>', '<=', '>='}
+
+# Ground formulas are tuples: ('atom', bit), ('not', f), ('and', (f, ...)), ('or', (f, ...))
+TRUE = ('and', ())
+FALSE = ('or', ())
+
+Fact = Tuple[str, ...]  # (predicate, arg1, arg2, ...)
+
+# "; step 2 preconditions_satisfied: yes -> {at truck1 locA}" / "; step 2 added: {at truck1 locB}  deleted: {...}"
+TRACE_PRECONDITION_RE = re.compile(r'preconditions?_satisfied\s*:\s*(\w+)(?:\s*->\s*\{([^}]*)\})?', re.IGNORECASE)
+TRACE_EFFECT_RE = re.compile(r'(added|deleted|removed)\s*:\s*\{([^}]*)\}', re.IGNORECASE)
+FACT_TOKEN_RE = re.compile(r'[^\s(),]+')
+
+
+class PlanStepError(Exception):
+    """A plan step that cannot be grounded (unknown action, wrong arity, bad argument)."""
+
+
+def evaluate(formula: tuple, state: int) -> bool:
+    kind = formula[0]
+    if kind == 'atom':
+        return bool(state & formula[1])
+    if kind == 'not':
+        return not evaluate(formula[1], state)
+    if kind == 'and':
+        return all(evaluate(child, state) for child in formula[1])
+    return any(evaluate(child, state) for child in formula[1])
+
+
+class Condition:
+    """
+    A ground formula compiled for fast checks: its top-level literals become
+    pos/neg bitmasks, anything else (disjunctions, negated conjunctions) is kept
+    in rest and evaluated recursively.
+    """
+
+    __slots__ = ('pos', 'neg', 'rest', 'never')
+
+    def __init__(self, formula: tuple):
+        self.pos = 0
+        self.neg = 0
+        self.rest: List[tuple] = []
+        self.never = False
+        self._add(formula)
+
+    def _add(self, formula: tuple):
+        kind = formula[0]
+        if kind == 'and':
+            for child in formula[1]:
+                self._add(child)
+        elif kind == 'atom':
+            self.pos |= formula[1]
+        elif kind == 'not' and formula[1][0] == 'atom':
+            self.neg |= formula[1][1]
+        elif formula == FALSE:
+            self.never = True
+        else:
+            self.rest.append(formula)
+
+    def holds(self, state: int) -> bool:
+        if self.never or state & self.pos != self.pos or state & self.neg:
+            return False
+        return all(evaluate(formula, state) for formula in self.rest)
+
+
+class GroundAction:
+    """A plan action with its parameters bound: precondition and add/delete bitmasks."""
+
+    __slots__ = ('name', 'args', 'precondition', 'add', 'delete', 'conditional')
+
+    def __init__(self, name: str, args: Tuple[str, ...], precondition: Condition):
+        self.name = name
+        self.args = args
+        self.precondition = precondition
+        self.add = 0
+        self.delete = 0
+        self.conditional: List[Tuple[Condition, int, int]] = []  # (when, add, delete)
+
+    def effects(self, state: int) -> Tuple[int, int]:
+        """(add, delete) masks when applied in state, including triggered conditional effects."""
+        add, delete = self.add, self.delete
+        for condition, when_add, when_delete in self.conditional:
+            if condition.holds(state):
+                add |= when_add
+                delete |= when_delete
+        return add, delete
+
+    def apply(self, state: int) -> int:
+        """Successor state; deletes are applied before adds, as in PDDL."""
+        if not self.conditional:
+            return (state & ~self.delete) | self.add
+        add, delete = self.effects(state)
+        return (state & ~delete) | add
+
+
+class EffectParts:
+    __slots__ = ('add', 'delete')
+
+    def __init__(self):
+        self.add = 0
+        self.delete = 0
+
+
+class PddlTask:
+    """
+    A domain bound to a set of objects (domain constants plus problem objects).
+    Construction runs the static consistency checks; errors and warnings are
+    collected rather than raised. Facts are numbered on first use and grounded
+    plan actions are cached, so repeated steps cost one dict lookup.
+    Tasks shared through GroundingCache must only be used while holding lock; long
+    work (full grounding in pddl_planner) runs on a fork() instead and is handed
+    back with adopt().
+    """
+
+    def __init__(self, domain: PddlDomain, objects: List[Tuple[str, str]]):
+        self.domain = domain
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.types = domain.types
+        self.constants = {name for name, _ in domain.constants}
+        self.objects: Dict[str, str] = {}
+        for name, type_name in list(domain.constants) + list(objects):
+            if name in self.objects and self.objects[name] != type_name:
+                self._error(f"Object {name} is declared as both {self.objects[name]} and {type_name}")
+            self.objects[name] = type_name
+        self.facts: Dict[Fact, int] = {}
+        self.fact_names: List[Fact] = []
+        self._typed_objects: Dict[str, List[str]] = {}
+        self._grounded: Dict[Tuple[str, ...], Union[GroundAction, PlanStepError]] = {}
+        self.action_tables: Dict[Any, Any] = {}  # full groundings built by pddl_planner, by static :init facts
+        self.lock = threading.RLock()
+        self.forked_facts: Optional[int] = None  # fact count of the task this one was forked from
+        self._check_types()
+        self._check_actions()
+
+    def fork(self) -> "PddlTask":
+        """Copy with its own fact numbering and caches, usable without the lock. Hold lock while forking."""
+        fork = copy.copy(self)
+        fork.errors = list(self.errors)
+        fork.warnings = list(self.warnings)
+        fork.facts = dict(self.facts)
+        fork.fact_names = list(self.fact_names)
+        fork._typed_objects = dict(self._typed_objects)
+        fork._grounded = dict(self._grounded)
+        fork.action_tables = {}
+        fork.lock = threading.RLock()
+        fork.forked_facts = len(self.fact_names)
+        return fork
+
+    def adopt(self, fork: "PddlTask") -> bool:
+        """
+        Take over the facts numbered and actions grounded by a fork, if this task has
+        not numbered new facts since forking (the fork's numbering then extends this
+        task's). Returns whether it did. Hold lock.
+        """
+        if fork.forked_facts != len(self.fact_names):
+            return False
+        self.facts = fork.facts
+        self.fact_names = fork.fact_names
+        self._grounded = {**fork._grounded, **self._grounded}
+        return True
+
+    # Facts and types
+
+    def fact_bit(self, fact: Fact) -> int:
+        fact_id = self.facts.get(fact)
+        if fact_id is None:
+            fact_id = len(self.fact_names)
+            self.facts[fact] = fact_id
+            self.fact_names.append(fact)
+        return 1 << fact_id
+
+    def fact_strings(self, mask: int) -> List[str]:
+        """Render the facts of a bitmask as "(pred a b)" strings, in fact-id order."""
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append('(' + ' '.join(self.fact_names[low.bit_length() - 1]) + ')')
+            mask ^= low
+        return names
+
+    def is_subtype(self, type_name: Optional[str], expected: str) -> bool:
+        seen = set()
+        while type_name is not None and type_name not in seen:
+            if type_name == expected or expected == 'object':
+                return True
+            seen.add(type_name)
+            type_name = self.types.get(type_name)
+        return False
+
+    def objects_of_type(self, type_name: str) -> List[str]:
+        objects = self._typed_objects.get(type_name)
+        if objects is None:
+            objects = [name for name, object_type in self.objects.items() if self.is_subtype(object_type, type_name)]
+            self._typed_objects[type_name] = objects
+        return objects
+
+    # Static checks
+
+    def _error(self, message: str):
+        if message not in self.errors:
+            self.errors.append(message)
+
+    def _warning(self, message: str):
+        if message not in self.warnings:
+            self.warnings.append(message)
+
+    def _check_type(self, type_name: str, where: str):
+        if type_name != 'object' and type_name not in self.types:
+            self._error(f"Undeclared type {type_name} in {where}")
+
+    def _check_types(self):
+        for type_name, parent in self.types.items():
+            if parent != 'object' and parent not in self.types:
+                self._error(f"Type {type_name} has undeclared parent type {parent}")
+        for name, type_name in self.objects.items():
+            self._check_type(type_name, f"object {name}")
+        for predicate, parameters in self.domain.predicates.items():
+            for _, type_name in parameters:
+                self._check_type(type_name, f"predicate {predicate}")
+
+    def _check_actions(self):
+        for name, action in self.domain.actions.items():
+            where = f"action {name}"
+            variables = set()
+            for parameter, type_name in action.parameters:
+                self._check_type(type_name, where)
+                variables.add(parameter)
+            if action.precondition is not None:
+                self.check_formula(action.precondition, variables, where)
+            if action.effect is not None:
+                self.check_formula(action.effect, variables, where)
+
+    def check_term(self, term: Union[str, SExpr], variables: set, where: str):
+        if not isinstance(term, str):
+            return  # function term, e.g. (distance ?a ?b)
+        if term.startswith('?'):
+            if term not in variables:
+                self._error(f"Unbound variable {term} in {where}")
+        elif term not in self.objects:
+            self._error(f"Unknown object {term} in {where}")
+        elif term not in self.constants and not where.startswith('problem'):
+            self._warning(f"{where} refers to problem object {term}, which is not a domain constant")
+
+    def check_formula(self, node: SExpr, variables: set, where: str):
+        """Check predicate names, arities and terms of a precondition, effect, init fact or goal."""
+        items = node.items
+        head = node.head
+        if not items:
+            return
+        if head in ('and', 'or', 'not', 'imply'):
+            for child in items[1:]:
+                if isinstance(child, SExpr):
+                    self.check_formula(child, variables, where)
+        elif head in ('forall', 'exists'):
+            if len(items) < 3 or not isinstance(items[1], SExpr) or not isinstance(items[2], SExpr):
+                self._error(f"Malformed {head} in {where}")
+                return
+            scoped = set(variables)
+            for variable, type_name in parse_typed_list(items[1].items):
+                self._check_type(type_name, where)
+                scoped.add(variable)
+            self.check_formula(items[2], scoped, where)
+        elif head == 'when':
+            for child in items[1:3]:
+                if isinstance(child, SExpr):
+                    self.check_formula(child, variables, where)
+        elif head == '=':
+            for term in items[1:]:
+                self.check_term(term, variables, where)
+        elif head in NUMERIC_EFFECTS or head in NUMERIC_COMPARISONS:
+            self._warning(f"Numeric {head} in {where} is not simulated")
+        elif head is None:
+            self._error(f"Malformed formula {sexpr_to_str(node)} in {where}")
+        else:
+            parameters = self.domain.predicates.get(head)
+            if parameters is None:
+                self._error(f"Undeclared predicate {head} in {where}")
+            elif len(parameters) != len(items) - 1:
+                self._error(f"Predicate {head} takes {len(parameters)} arguments, got {len(items) - 1} in {where}")
+            for term in items[1:]:
+                self.check_term(term, variables, where)
+
+    # Grounding
+
+    def ground_formula(self, node: Union[str, SExpr, None], bindings: Dict[str, str]) -> tuple:
+        if not isinstance(node, SExpr) or not node.items:
+            return TRUE
+        items = node.items
+        head = node.head
+        if head in ('and', 'or'):
+            return (head, tuple(self.ground_formula(child, bindings) for child in items[1:] if isinstance(child, SExpr)))
+        if head == 'not':
+            return ('not', self.ground_formula(items[1] if len(items) > 1 else None, bindings))
+        if head == 'imply':
+            if len(items) < 3:
+                return TRUE
+            return ('or', (('not', self.ground_formula(items[1], bindings)), self.ground_formula(items[2], bindings)))
+        if head in ('forall', 'exists'):
+            if len(items) < 3 or not isinstance(items[1], SExpr):
+                return TRUE
+            expanded = tuple(
+                self.ground_formula(items[2], scoped)
+                for scoped in self.quantifier_bindings(items[1], bindings)
+            )
+            return ('and' if head == 'forall' else 'or', expanded)
+        if head == '=':
+            terms = items[1:3]
+            if len(terms) < 2 or not all(isinstance(term, str) for term in terms):
+                return TRUE  # numeric (= (f x) 3) is not simulated
+            return TRUE if bindings.get(terms[0], terms[0]) == bindings.get(terms[1], terms[1]) else FALSE
+        if head is None or head in NUMERIC_COMPARISONS:
+            return TRUE
+        return ('atom', self.fact_bit(self.ground_atom(node, bindings)))
+
+    def ground_atom(self, node: SExpr, bindings: Dict[str, str]) -> Fact:
+        return (node.head,) + tuple(
+            bindings.get(item, item) if isinstance(item, str) else sexpr_to_str(item)
+            for item in node.items[1:]
+        )
+
+    def quantifier_bindings(self, variables: SExpr, bindings: Dict[str, str]):
+        typed = parse_typed_list(variables.items)
+        names = [name for name, _ in typed]
+        for values in product(*(self.objects_of_type(type_name) for _, type_name in typed)):
+            scoped = dict(bindings)
+            scoped.update(zip(names, values))
+            yield scoped
+
+    def ground_effect(self, node: Union[str, SExpr, None], bindings: Dict[str, str], parts: EffectParts, action: GroundAction):
+        if not isinstance(node, SExpr) or not node.items:
+            return
+        items = node.items
+        head = node.head
+        if head == 'and':
+            for child in items[1:]:
+                self.ground_effect(child, bindings, parts, action)
+        elif head == 'not':
+            if len(items) > 1 and isinstance(items[1], SExpr) and items[1].head:
+                parts.delete |= self.fact_bit(self.ground_atom(items[1], bindings))
+        elif head == 'forall':
+            if len(items) >= 3 and isinstance(items[1], SExpr):
+                for scoped in self.quantifier_bindings(items[1], bindings):
+                    self.ground_effect(items[2], scoped, parts, action)
+        elif head == 'when':
+            if len(items) >= 3:
+                when = EffectParts()
+                self.ground_effect(items[2], bindings, when, action)
+                action.conditional.append((Condition(self.ground_formula(items[1], bindings)), when.add, when.delete))
+        elif head is not None and head not in NUMERIC_EFFECTS:
+            parts.add |= self.fact_bit(self.ground_atom(node, bindings))
+
+    def ground_action(self, name: Optional[str], args: List[str]) -> GroundAction:
+        """Ground a plan step's action. Raises PlanStepError if the call does not fit the domain."""
+        key = (name,) + tuple(args)
+        grounded = self._grounded.get(key)
+        if grounded is None:
+            try:
+                grounded = self._ground_action(name, args)
+            except PlanStepError as e:
+                grounded = e
+            self._grounded[key] = grounded
+        if isinstance(grounded, PlanStepError):
+            raise grounded
+        return grounded
+
+    def _ground_action(self, name: Optional[str], args: List[str]) -> GroundAction:
+        if name is None:
+            raise PlanStepError("Not an action call")
+        action = self.domain.actions.get(name)
+        if action is None:
+            raise PlanStepError(f"Unknown action {name}")
+        if len(args) != len(action.parameters):
+            raise PlanStepError(f"Action {name} takes {len(action.parameters)} arguments, got {len(args)}")
+        for arg, (parameter, type_name) in zip(args, action.parameters):
+            object_type = self.objects.get(arg)
+            if object_type is None:
+                raise PlanStepError(f"Unknown object {arg}")
+            if not self.is_subtype(object_type, type_name):
+                raise PlanStepError(f"Object {arg} is a {object_type}, but {parameter} of {name} needs a {type_name}")
+
+        bindings = {parameter: arg for (parameter, _), arg in zip(action.parameters, args)}
+        grounded = GroundAction(name, tuple(args), Condition(self.ground_formula(action.precondition, bindings)))
+        parts = EffectParts()
+        self.ground_effect(action.effect, bindings, parts, grounded)
+        grounded.add = parts.add
+        grounded.delete = parts.delete
+        return grounded
+
+    def unsatisfied(self, condition: Condition, state: int) -> List[str]:
+        """Literals of a condition that do not hold in state."""
+        missing = self.fact_strings(condition.pos & ~state)
+        missing.extend(f"(not {fact})" for fact in self.fact_strings(condition.neg & state))
+        if condition.never:
+            missing.append("(false)")
+        missing.extend(self.render(formula) for formula in condition.rest if not evaluate(formula, state))
+        return missing
+
+    def render(self, formula: tuple) -> str:
+        kind = formula[0]
+        if kind == 'atom':
+            return self.fact_strings(formula[1])[0]
+        if kind == 'not':
+            return f"(not {self.render(formula[1])})"
+        return '(' + ' '.join([kind] + [self.render(child) for child in formula[1]]) + ')'
+
+
+def task_key(domain: PddlDomain, objects: List[Tuple[str, str]]) -> str:
+    """Content hash of the normalized domain (canonical s-expression form) and the problem's object set."""
+    material = sexpr_to_str(domain.node) + '\n' + ' '.join(sorted({f"{name} - {type_name}" for name, type_name in objects}))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class GroundingCache:
+    """
+    LRU of PddlTasks keyed by task_key(). A cached task keeps its consistency
+    check results, numbered facts, grounded plan actions and the planner's action
+    tables, so validating or solving another output with the same domain and
+    objects skips re-checking and re-grounding. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, PddlTask]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, domain: PddlDomain, objects: List[Tuple[str, str]]) -> Tuple[PddlTask, bool]:
+        """The task for domain + objects, and whether it came from the cache."""
+        key = task_key(domain, objects)
+        with self.lock:
+            task = self.entries.get(key)
+            if task is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return task, True
+            self.misses += 1
+
+        task = PddlTask(domain, objects)
+        if self.max_entries > 0:
+            with self.lock:
+                # Another thread may have built the same task meanwhile; keep the first
+                task = self.entries.setdefault(key, task)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return task, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Shared by validate_plan() and pddl_planner.solve(); main.py sizes it from GROUNDING_CACHE_SIZE
+grounding_cache = GroundingCache()
+
+
+def compile_problem(task: PddlTask, problem: PddlProblem) -> Tuple[int, Condition, List[str]]:
+    """Check a problem against a task and return (initial state, goal condition, errors)."""
+    # Problem checks must not stick to the task's own domain errors/warnings
+    error_count, warning_count = len(task.errors), len(task.warnings)
+    state = 0
+    for fact in problem.init:
+        if fact.head == '=' or fact.head is None:
+            continue  # numeric fluent value
+        task.check_formula(fact, set(), "problem :init")
+        state |= task.fact_bit(task.ground_atom(fact, {}))
+    if problem.goal is not None:
+        task.check_formula(problem.goal, set(), "problem :goal")
+    goal = Condition(task.ground_formula(problem.goal, {}))
+    errors = task.errors[error_count:]
+    del task.errors[error_count:]
+    del task.warnings[warning_count:]
+
+    if problem.goal is None:
+        errors.append("Problem has no :goal")
+    if problem.domain_name and task.domain.name and problem.domain_name != task.domain.name:
+        errors.append(f"Problem is for domain {problem.domain_name}, not {task.domain.name}")
+    return state, goal, errors
+
+
+def parse_fact_set(text: Optional[str]) -> List[Fact]:
+    """Facts listed in a trace claim, e.g. "at truck1 locB, (road locA locB)"."""
+    facts = []
+    for part in (text or '').split(','):
+        tokens = FACT_TOKEN_RE.findall(part.lower())
+        if tokens:
+            facts.append(tuple(tokens))
+    return facts
+
+
+class TraceClaim:
+    """What a step's ; STATE TRACE lines claim: precondition status, facts holding before, added and deleted facts."""
+
+    __slots__ = ('preconditions_satisfied', 'holding', 'added', 'deleted')
+
+    def __init__(self, lines: List[str]):
+        self.preconditions_satisfied: Optional[bool] = None
+        self.holding: Optional[List[Fact]] = None
+        self.added: Optional[List[Fact]] = None
+        self.deleted: Optional[List[Fact]] = None
+        for line in lines:
+            match = TRACE_PRECONDITION_RE.search(line)
+            if match:
+                answer = match.group(1).lower()
+                if answer in ('yes', 'true', 'no', 'false'):
+                    self.preconditions_satisfied = answer in ('yes', 'true')
+                if match.group(2) is not None:
+                    self.holding = (self.holding or []) + parse_fact_set(match.group(2))
+            for kind, facts in TRACE_EFFECT_RE.findall(line):
+                if kind.lower() == 'added':
+                    self.added = (self.added or []) + parse_fact_set(facts)
+                else:
+                    self.deleted = (self.deleted or []) + parse_fact_set(facts)
+
+    @property
+    def empty(self) -> bool:
+        return self.preconditions_satisfied is None and self.holding is None and self.added is None and self.deleted is None
+
+
+def fact_str(fact: Fact) -> str:
+    return '(' + ' '.join(fact) + ')'
+
+
+def check_trace(task: PddlTask, step: PlanStep, action: Optional[GroundAction], state: int, claim: TraceClaim) -> Dict[str, Any]:
+    """
+    Compare a step's trace claim with the simulation, given the state before the step.
+    Add/delete sets are only compared when the trace states at least one of them.
+    """
+    check = {"step": step.step_number, "consistent": True}
+    if action is None:
+        check["consistent"] = False
+        check["error"] = "Step could not be simulated"
+        return check
+
+    satisfied = action.precondition.holds(state)
+    if claim.preconditions_satisfied is not None and claim.preconditions_satisfied != satisfied:
+        check["consistent"] = False
+        check["claimed_preconditions_satisfied"] = claim.preconditions_satisfied
+        check["unsatisfied"] = task.unsatisfied(action.precondition, state)
+    if claim.holding:
+        not_holding = [fact_str(fact) for fact in claim.holding if fact not in task.facts or not state & (1 << task.facts[fact])]
+        if not_holding:
+            check["consistent"] = False
+            check["claimed_true_but_false"] = not_holding
+
+    if claim.added is not None or claim.deleted is not None:
+        add, delete = action.effects(state)
+        for kind, claimed, mask in (("added", claim.added or [], add), ("deleted", claim.deleted or [], delete)):
+            actual = task.fact_strings(mask)
+            claimed = [fact_str(fact) for fact in claimed]
+            missing = [fact for fact in actual if fact not in claimed]
+            unexpected = [fact for fact in claimed if fact not in actual]
+            if missing:
+                check[f"missing_{kind}"] = missing
+            if unexpected:
+                check[f"unexpected_{kind}"] = unexpected
+            if missing or unexpected:
+                check["consistent"] = False
+    return check
+
+
+def simulate_plan(
+    task: PddlTask,
+    state: int,
+    goal: Condition,
+    steps: List[PlanStep],
+    traces: Optional[Dict[int, List[str]]] = None
+) -> Dict[str, Any]:
+    """
+    Execute plan steps from state. A step whose preconditions fail is reported
+    and its effects are still applied, so independent later failures are found too.
+    Steps with ; STATE TRACE lines in traces get a trace check (see check_trace).
+    """
+    traces = traces or {}
+    failures = []
+    failed = 0
+    first_failed = None
+    trace_checks = []
+    for step in steps:
+        failure = None
+        action = None
+        try:
+            action = task.ground_action(step.name, step.args)
+        except PlanStepError as e:
+            failure = {"step": step.step_number, "action": step.call, "error": str(e)}
+        else:
+            if not action.precondition.holds(state):
+                failure = {
+                    "step": step.step_number,
+                    "action": step.call,
+                    "error": "Preconditions not satisfied",
+                    "unsatisfied": task.unsatisfied(action.precondition, state)
+                }
+        trace = traces.get(step.step_number)
+        if trace:
+            claim = TraceClaim(trace)
+            if not claim.empty:
+                trace_checks.append(check_trace(task, step, action, state, claim))
+        if action is not None:
+            state = action.apply(state)
+        if failure is not None:
+            failed += 1
+            if first_failed is None:
+                first_failed = step.step_number
+            if len(failures) < MAX_REPORTED_FAILURES:
+                failures.append(failure)
+
+    goal_reached = goal.holds(state)
+    return {
+        "total_steps": len(steps),
+        "valid_steps": len(steps) - failed,
+        "failed_step_count": failed,
+        "first_failed_step": first_failed,
+        "failed_steps": failures,
+        "goal_reached": goal_reached,
+        "unsatisfied_goals": [] if goal_reached else task.unsatisfied(goal, state),
+        "final_state_size": bin(state).count('1'),
+        "trace_check": {
+            "checked_steps": len(trace_checks),
+            "inconsistent_steps": sum(1 for check in trace_checks if not check["consistent"]),
+            "steps": trace_checks
+        }
+    }
+
+
+@lru_cache(maxsize=16)
+def validate_plan(doc: PddlDocument) -> Dict[str, Any]:
+    """
+    Check the domain/problem of a parsed output and simulate its plan.
+    "score" is 1.0 only for a consistent domain/problem whose plan executes and
+    reaches the goal: 0.7 for the fraction of executable steps, 0.2 for reaching
+    the goal and 0.1 for having no consistency errors.
+    Cached per document (only pass complete documents); treat the report as read-only.
+    """
+    domain, problem, steps = doc.domain, doc.problem, doc.plan_steps
+    missing = [part for part, value in (("domain", domain), ("problem", problem), ("plan", steps)) if not value]
+    if missing:
+        return {"checked": False, "reason": f"No {', '.join(missing)} to validate", "plan_valid": False, "score": 0.0}
+
+    started = time.perf_counter()
+    task, cached = grounding_cache.get(domain, problem.objects)
+    with task.lock:
+        state, goal, problem_errors = compile_problem(task, problem)
+        report = simulate_plan(task, state, goal, steps, doc.state_traces)
+        errors = task.errors + problem_errors
+        warnings = list(task.warnings)
+        facts = len(task.fact_names)
+    if not doc.domain_node.closed or not doc.problem_node.closed:
+        warnings.append("Domain or problem definition is truncated")
+
+    fraction = report["valid_steps"] / report["total_steps"]
+    plan_valid = not errors and report["failed_step_count"] == 0 and report["goal_reached"]
+    score = 0.7 * fraction + (0.2 if report["goal_reached"] else 0.0) + (0.0 if errors else 0.1)
+    return {
+        "checked": True,
+        "plan_valid": plan_valid,
+        # Exactly 1.0 for a valid plan; anything else stays below 1.0 even when it would round up
+        "score": 1.0 if plan_valid else min(round(score, 3), 0.999),
+        **report,
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "warnings": warnings[:MAX_REPORTED_ERRORS],
+        "facts": facts,
+        "grounding_cache": "hit" if cached else "miss",
+        "simulation_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+def trace_checks_by_step(report: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """Step number -> trace check from a validate_plan() report (empty if nothing was checked)."""
+    return {check["step"]: check for check in (report.get("trace_check") or {}).get("steps", [])}
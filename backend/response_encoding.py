@@ -0,0 +1,215 @@
+"""
+Fast JSON encoding and negotiated compression for API responses.
+dumps() and FastJSONResponse encode with orjson when it is installed, falling
+back to the stdlib json module for anything orjson rejects; model_response()
+serializes validated models with pydantic; CompressionMiddleware compresses
+large bodies with brotli (when the brotli package is installed) or gzip,
+whichever the client's Accept-Encoding prefers.
+"""
+
+import json
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Streams whose chunks must reach the client as they are produced, and bodies that are already compressed
+UNCOMPRESSED_MEDIA_TYPES = (
+    "text/event-stream",
+    "application/gzip",
+    "application/vnd.apache.parquet",
+    "image/",
+    "video/",
+    "audio/"
+)
+
+
+def orjson_dumps(value: Any) -> Optional[bytes]:
+    """value encoded by orjson, or None when orjson is not installed or cannot encode it."""
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # Values orjson rejects (e.g. integers beyond 64 bits, lone surrogates, tuple keys)
+        return None
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON for value."""
+    body = orjson_dumps(value)
+    if body is not None:
+        return body
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with orjson. Content orjson cannot encode is rendered by
+    JSONResponse's own json.dumps, so such responses are exactly what they were
+    before orjson (including the error for content json cannot encode either).
+    """
+
+    def render(self, content: Any) -> bytes:
+        body = orjson_dumps(content)
+        if body is not None:
+            return body
+        return super().render(content)
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """
+    JSON response for a model that was validated when it was built. Returning it
+    directly skips FastAPI's response_model re-validation and jsonable_encoder pass;
+    the model is serialized once by pydantic's own encoder.
+    """
+    return Response(content=model.model_dump_json(), status_code=status_code, media_type="application/json")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(header: str) -> Optional[str]:
+    """Best supported content coding for an Accept-Encoding header ("br" or "gzip"), or None."""
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    best, best_q = None, 0.0
+    # br first so it wins ties
+    for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli compressor; compress(data, final) returns the bytes ready to send."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self.compressor.process(data)
+            return out + (self.compressor.finish() if final else self.compressor.flush())
+        out = self.compressor.compress(data)
+        # Sync flush: a streamed chunk is decodable by the client as soon as it arrives
+        return out + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies of at least minimum_size bytes
+    (and streamed bodies) with the coding negotiated from Accept-Encoding.
+    Responses that already carry a Content-Encoding, Server-Sent Events and
+    already compressed media types are passed through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressingSend(send, encoding, self.minimum_size))
+
+
+class CompressingSend:
+    """The send callable for one response: holds the start message until the first body chunk decides."""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Dict[str, Any]] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    def _compressible(self, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers:
+            return False
+        if headers.get("content-type", "").startswith(UNCOMPRESSED_MEDIA_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
+
+    async def __call__(self, message: Dict[str, Any]):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if not self._compressible(headers, body, more_body):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.compressor = StreamCompressor(self.encoding)
+            compressed = self.compressor.compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        await self.send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body, final=not more_body),
+            "more_body": more_body
+        })
+
+
+def encoded_sizes(body: bytes) -> Tuple[int, int, Optional[int]]:
+    """(raw, gzip, brotli or None) sizes of a body as this middleware would send it."""
+    gzip_size = len(StreamCompressor("gzip").compress(body, final=True))
+    brotli_size = len(StreamCompressor("br").compress(body, final=True)) if brotli is not None else None
+    return len(body), gzip_size, brotli_size
@@ -0,0 +1,140 @@
+"""
+Server-side store of generated plan sessions.
+Keeps what /api/generate-plan produced for a session (prompt, raw output, parsed
+steps, metadata and PDDL analysis) so feedback can refer to steps by step_id
+instead of uploading the whole plan again. Bounded by entry count and total size
+in memory, optionally backed by a directory of JSON files bounded by age and
+total size.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from disk_tier import DiskPruner
+
+
+class SessionStore:
+    """
+    LRU store of session records keyed by session_id.
+    The memory tier evicts the least recently used sessions once it holds more than
+    max_entries sessions or more than max_bytes of serialized records; the optional
+    disk tier keeps one JSON file per session, so evicted sessions can still be
+    loaded, and writes prune it down to disk_max_bytes (see DiskPruner). Sessions
+    older than ttl_seconds are treated as missing. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # session_id -> (created_at, record, size)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.pruner: Optional[DiskPruner] = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.pruner = DiskPruner(disk_dir, ttl_seconds, disk_max_bytes)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _disk_path(self, session_id: str) -> str:
+        # session_id comes from the URL/body: name the file by its hash, so any id maps
+        # to a distinct, safe file name
+        digest = hashlib.sha256(session_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def _remember(self, session_id: str, created_at: float, record: Dict[str, Any], size: int):
+        with self.lock:
+            previous = self.entries.pop(session_id, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            self.entries[session_id] = (created_at, record, size)
+            self.total_bytes += size
+            while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def put(self, session_id: str, record: Dict[str, Any]):
+        """Store a session record (JSON-serializable) in memory and, if enabled, on disk."""
+        created_at = time.time()
+        payload = json.dumps({"created_at": created_at, "record": record})
+        self._remember(session_id, created_at, record, len(payload))
+        if self.disk_dir:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._disk_path(session_id))
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self.pruner.wrote(len(payload.encode('utf-8')))
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session record, or None if it is unknown or expired."""
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    del self.entries[session_id]
+                    self.total_bytes -= entry[2]
+                else:
+                    self.entries.move_to_end(session_id)
+                    return entry[1]
+
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(session_id)
+        try:
+            with open(path, 'r') as f:
+                payload = f.read()
+            stored = json.loads(payload)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored.get("created_at", 0)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self._remember(session_id, stored["created_at"], stored["record"], len(payload))
+        return stored["record"]
+
+    def prune_disk(self) -> int:
+        """Sweep the disk tier now; returns the number of files removed."""
+        return self.pruner.prune() if self.pruner else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "sessions": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": bool(self.disk_dir),
+                **(self.pruner.stats() if self.pruner else {}),
+                "evictions": self.evictions
+            }
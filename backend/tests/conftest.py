@@ -0,0 +1,39 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules (python main.py from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TRAINING_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "training_data")
+
+# Two rooms and a robot that carries one ball at a time
+GRIPPER_DOMAIN = """(define (domain Gripper)
+  (:requirements :strips :typing)
+  (:types room ball)
+  (:predicates (at-robby ?r - room) (at ?b - ball ?r - room) (free) (carry ?b - ball))
+  (:action move
+    :parameters (?from ?to - room)
+    :precondition (at-robby ?from)
+    :effect (and (at-robby ?to) (not (at-robby ?from))))
+  (:action pick
+    :parameters (?b - ball ?r - room)
+    :precondition (and (at ?b ?r) (at-robby ?r) (free))
+    :effect (and (carry ?b) (not (at ?b ?r)) (not (free))))
+  (:action drop
+    :parameters (?b - ball ?r - room)
+    :precondition (and (carry ?b) (at-robby ?r))
+    :effect (and (at ?b ?r) (free) (not (carry ?b)))))
+"""
+
+GRIPPER_PROBLEM = """(define (problem move-two-balls)
+  (:domain gripper)
+  (:objects rooma roomb - room ball1 ball2 - ball)
+  (:init (at-robby rooma) (free) (at ball1 rooma) (at ball2 rooma))
+  (:goal (and (at ball1 roomb) (at ball2 roomb))))
+"""
+
+
+def gripper_output(plan_steps):
+    """Model output in the ; PLAN format for the gripper task with the given plan calls."""
+    plan = "\n".join(f"(; {number}) {call}" for number, call in enumerate(plan_steps, 1))
+    return f"{GRIPPER_DOMAIN}\n{GRIPPER_PROBLEM}\n; PLAN\n{plan}\n"
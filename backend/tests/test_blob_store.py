@@ -0,0 +1,43 @@
+import glob
+import json
+import os
+
+import pytest
+
+from blob_store import MAX_CHUNK_CHARS, split_chunks
+from conftest import TRAINING_DATA_DIR, gripper_output
+
+
+def session_texts():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(TRAINING_DATA_DIR, "rlhf_session_*.json"))):
+        with open(path) as f:
+            texts.append(json.load(f)["model_output"])
+    return texts
+
+
+EDGE_CASES = [
+    "",
+    "\n",
+    "no newline at the end",
+    "trailing newlines\n\n\n",
+    "(define (domain d)\n  (:action a\n    :parameters ()",  # truncated, parens never close
+    "prose (with an unclosed paren\n```pddl\n(:action a :effect (x))\n```\n# Heading\ntext",
+    "x" * (3 * MAX_CHUNK_CHARS + 5),
+    "; comment ( with parens\n" * 50,
+    gripper_output(["(pick ball1 rooma)"]),
+]
+
+
+@pytest.mark.parametrize("text", EDGE_CASES + session_texts())
+def test_split_chunks_round_trip(text):
+    chunks = split_chunks(text)
+    assert ''.join(chunks) == text
+    assert all(chunks)
+
+
+def test_split_chunks_cuts_out_actions():
+    text = gripper_output(["(pick ball1 rooma)"])
+    chunks = split_chunks(text)
+    assert any(chunk.lstrip().startswith("(:action pick") and chunk.rstrip().endswith("(not (free))))") for chunk in chunks)
+
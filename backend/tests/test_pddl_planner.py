@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import GRIPPER_DOMAIN, GRIPPER_PROBLEM, gripper_output
+from pddl_parser import parse_pddl
+from pddl_planner import PlannerError, solve
+from pddl_validator import validate_plan
+
+ALGORITHMS = ["gbfs", "astar"]
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_solve_finds_a_valid_plan(algorithm):
+    result = solve(parse_pddl(f"{GRIPPER_DOMAIN}\n{GRIPPER_PROBLEM}"), algorithm=algorithm)
+    assert result["algorithm"] == algorithm
+    assert result["solved"] is True
+    assert result["plan_length"] == len(result["plan"])
+    # The reference plan must itself pass the validator
+    report = validate_plan(parse_pddl(gripper_output(result["plan"])))
+    assert report["plan_valid"] is True
+
+
+def test_astar_plan_is_optimal():
+    result = solve(parse_pddl(f"{GRIPPER_DOMAIN}\n{GRIPPER_PROBLEM}"), algorithm="astar")
+    # pick, move, drop, move back, pick, move, drop
+    assert result["plan_length"] == 7
+
+
+def test_unreachable_goal_is_not_solved():
+    problem = GRIPPER_PROBLEM.replace("(:init (at-robby rooma) (free)", "(:init (at-robby rooma)")
+    result = solve(parse_pddl(f"{GRIPPER_DOMAIN}\n{problem}"), algorithm="gbfs")
+    assert result["solved"] is False
+    assert "plan" not in result
+
+
+def test_solve_without_problem_raises():
+    with pytest.raises(PlannerError):
+        solve(parse_pddl(GRIPPER_DOMAIN))
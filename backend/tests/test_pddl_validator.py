@@ -0,0 +1,75 @@
+import glob
+import json
+import os
+
+import pytest
+
+from conftest import TRAINING_DATA_DIR, gripper_output
+from pddl_parser import parse_pddl
+from pddl_validator import validate_plan
+
+SESSION_FILES = sorted(glob.glob(os.path.join(TRAINING_DATA_DIR, "rlhf_session_*.json")))
+
+VALID_PLAN = [
+    "(pick ball1 rooma)", "(move rooma roomb)", "(drop ball1 roomb)",
+    "(move roomb rooma)", "(pick ball2 rooma)", "(move rooma roomb)", "(drop ball2 roomb)",
+]
+
+
+@pytest.mark.parametrize("path", SESSION_FILES, ids=os.path.basename)
+def test_bundled_session_parses_and_validates(path):
+    with open(path) as f:
+        session = json.load(f)
+    doc = parse_pddl(session["model_output"])
+    report = validate_plan(doc)
+    if doc.domain is None or doc.problem is None or not doc.plan:
+        assert report["checked"] is False
+        assert report["score"] == 0.0
+        return
+    assert report["checked"] is True
+    assert report["errors"] == []
+    assert report["plan_valid"] is True
+    assert report["score"] == 1.0
+    assert report["total_steps"] == len(doc.plan)
+
+
+def test_bundled_sessions_include_a_checked_plan():
+    checked = [path for path in SESSION_FILES if parse_pddl(json.load(open(path))["model_output"]).plan]
+    assert checked
+
+
+def test_valid_plan_reaches_goal():
+    report = validate_plan(parse_pddl(gripper_output(VALID_PLAN)))
+    assert report["plan_valid"] is True
+    assert report["score"] == 1.0
+    assert report["valid_steps"] == len(VALID_PLAN)
+    assert report["goal_reached"] is True
+
+
+def test_failing_precondition_is_reported():
+    # Step 3 picks ball2 while the robot still carries ball1, so (free) does not hold
+    plan = ["(pick ball1 rooma)", "(move rooma roomb)", "(pick ball2 rooma)"]
+    report = validate_plan(parse_pddl(gripper_output(plan)))
+    assert report["checked"] is True
+    assert report["plan_valid"] is False
+    assert report["failed_step_count"] == 1
+    assert report["first_failed_step"] == 3
+    failure = report["failed_steps"][0]
+    assert failure["step"] == 3
+    assert failure["error"] == "Preconditions not satisfied"
+    assert failure["unsatisfied"]
+    assert report["goal_reached"] is False
+    assert report["score"] < 1.0
+
+
+def test_unknown_action_is_a_failed_step():
+    report = validate_plan(parse_pddl(gripper_output(["(teleport ball1 roomb)"])))
+    assert report["failed_step_count"] == 1
+    assert report["plan_valid"] is False
+
+
+def test_action_names_keep_their_casing():
+    doc = parse_pddl(gripper_output(VALID_PLAN).replace("(:action move", "(:action Move"))
+    assert doc.domain.name == "gripper"
+    assert doc.domain_actions["move"].name == "Move"
+    assert validate_plan(doc)["plan_valid"] is True